@@ -88,6 +88,7 @@ hiddenimports += [
     "fitz",
     "pymupdf",
     "pypdf",
+    "docx",
 ]
 
 # CRÍTICO: pyautogui y dependencias indirectas.
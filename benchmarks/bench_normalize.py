@@ -0,0 +1,99 @@
+"""
+Benchmark: normalización de texto carácter por carácter vs. tools/text.
+
+Mide sobre los nombres de la columna CLIENTE del Excel del mes y las páginas
+del PDF de mensajes:
+  - normalizar (sin acentos, minúsculas): la versión anterior de _normalize,
+    normalize_text uno por uno y normalize_texts en bloque;
+  - nombres de carpeta: el filtro anterior con isalnum() vs. safe_folder_name.
+
+Uso desde la raíz del proyecto:
+    python benchmarks/bench_normalize.py
+    python benchmarks/bench_normalize.py --excel "Data/08 25 CONTROL TRABAJADOR INDEPENDIENTE AGOSTO 2025.xlsx" --pdf "Data/08 MENSAJE TI AGOSTO TOTAL.pdf"
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from config import VALIDATION  # noqa: E402
+from tools.pdf import extract_pages_text  # noqa: E402
+from tools.text import normalize_text, normalize_texts, safe_folder_name  # noqa: E402
+
+
+DEFAULT_EXCEL = ROOT / "Data" / "08 25 CONTROL TRABAJADOR INDEPENDIENTE AGOSTO 2025.xlsx"
+DEFAULT_PDF = ROOT / "Data" / "08 MENSAJE TI AGOSTO TOTAL.pdf"
+
+
+def _normalize_per_char(s: str) -> str:
+    """La versión anterior de tools/pdf._normalize."""
+    s = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn").lower()
+
+
+def _folder_per_char(name: str) -> str:
+    """El filtro anterior de _client_folder_name / _rename_pdf."""
+    safe = "".join(
+        c for c in name if c.isalnum() or c in VALIDATION["allowed_folder_chars"]
+    ).strip()
+    return safe or VALIDATION["fallback_folder_name"]
+
+
+def _time(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def _names(excel: Path) -> list[str]:
+    import pandas as pd
+
+    df = pd.read_excel(excel, dtype=str).fillna("")
+    return [n for n in df["CLIENTE"].tolist() if n.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--excel", default=str(DEFAULT_EXCEL))
+    parser.add_argument("--pdf", default=str(DEFAULT_PDF))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    names = _names(Path(args.excel))
+    pages = extract_pages_text(Path(args.pdf))
+
+    assert [_normalize_per_char(n) for n in names] == normalize_texts(names)
+    assert [_normalize_per_char(p) for p in pages] == normalize_texts(pages)
+    assert [_folder_per_char(n) for n in names] == [safe_folder_name(n) for n in names]
+
+    cases = [
+        (f"nombres ({len(names)})", names),
+        (f"páginas ({len(pages)})", pages),
+    ]
+    print(f"repeticiones: {args.repeat} (mediana)")
+    print(f"{'normalizar':<16} {'anterior (ms)':>14} {'uno a uno (ms)':>15} {'en bloque (ms)':>15} {'aceleración':>12}")
+    for label, texts in cases:
+        before = _time(lambda: [_normalize_per_char(t) for t in texts], args.repeat)
+        single = _time(lambda: [normalize_text(t) for t in texts], args.repeat)
+        batch = _time(lambda: normalize_texts(texts), args.repeat)
+        print(f"{label:<16} {before * 1000:>14.2f} {single * 1000:>15.2f} {batch * 1000:>15.2f} "
+              f"{before / batch:>11.1f}x")
+
+    before = _time(lambda: [_folder_per_char(n) for n in names], args.repeat)
+    after = _time(lambda: [safe_folder_name(n) for n in names], args.repeat)
+    print(f"\n{'carpetas':<16} {'anterior (ms)':>14} {'nuevo (ms)':>15} {'aceleración':>12}")
+    print(f"{f'nombres ({len(names)})':<16} {before * 1000:>14.2f} {after * 1000:>15.2f} {before / after:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
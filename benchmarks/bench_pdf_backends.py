@@ -0,0 +1,51 @@
+"""
+Benchmark: extracción de texto con cada backend de PDF instalado (tools/pdf.py).
+
+Mide PyMuPDF, pypdf y PyPDF2 (los que estén instalados) sobre el mismo PDF
+para decidir PDF_CONFIG["backend"] en cada equipo, o cuánto cuesta distribuir
+el ejecutable sin PyMuPDF.
+
+Uso desde la raíz del proyecto:
+    python benchmarks/bench_pdf_backends.py
+    python benchmarks/bench_pdf_backends.py "Data/08 MENSAJE TI AGOSTO TOTAL.pdf" --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from tools.pdf import PDF_BACKEND, PDF_BACKENDS, benchmark_backends  # noqa: E402
+
+
+DEFAULT_PDF = ROOT / "Data" / "08 MENSAJE TI AGOSTO TOTAL.pdf"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pdf", nargs="?", default=str(DEFAULT_PDF))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = Path(args.pdf)
+    print(f"Origen: {source.name} | instalados: {', '.join(PDF_BACKENDS)} | "
+          f"en uso: {PDF_BACKEND} | repeticiones: {args.repeat}")
+    print(f"{'backend':>8} {'tiempo (s)':>11} {'páginas':>8} {'caracteres':>11}")
+
+    results = benchmark_backends(source, repeat=args.repeat)
+    for name, r in results.items():
+        if r["error"]:
+            print(f"{name:>8} {'error':>11}  {r['error']}")
+            continue
+        print(f"{name:>8} {r['seconds']:>11.3f} {r['pages']:>8} {r['chars']:>11}")
+
+    timed = {n: r["seconds"] for n, r in results.items() if r["seconds"] is not None}
+    if timed:
+        print(f"Más rápido: {min(timed, key=timed.get)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: extracción de texto en serie vs. en paralelo (tools/pdf.py).
+
+Arma PDFs de distintos tamaños repitiendo las páginas de un PDF de mensajes
+y mide extract_pages_text con parallel=False y parallel=True.
+
+Uso desde la raíz del proyecto:
+    python benchmarks/bench_pdf_extraction.py
+    python benchmarks/bench_pdf_extraction.py "Data/08 MENSAJE TI AGOSTO TOTAL.pdf" --pages 50 150 300 600
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from tools.pdf import extract_pages_text, parallel_workers  # noqa: E402
+
+
+DEFAULT_PDF = ROOT / "Data" / "08 MENSAJE TI AGOSTO TOTAL.pdf"
+
+
+def _build_pdf(source: Path, pages: int, target: Path) -> None:
+    """PDF de `pages` páginas repitiendo las del PDF de origen."""
+    import fitz  # type: ignore  (PyMuPDF)
+
+    with fitz.open(str(source)) as src, fitz.open() as out:
+        while len(out) < pages:
+            take = min(len(src), pages - len(out))
+            out.insert_pdf(src, from_page=0, to_page=take - 1)
+        out.save(str(target))
+
+
+def _time(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pdf", nargs="?", default=str(DEFAULT_PDF))
+    parser.add_argument("--pages", nargs="+", type=int, default=[25, 100, 300, 600])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = Path(args.pdf)
+    print(f"Origen: {source.name} | procesos: {parallel_workers()} | repeticiones: {args.repeat}")
+    print(f"{'páginas':>8} {'serie (s)':>10} {'paralelo (s)':>13} {'aceleración':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.pages:
+            target = Path(tmp) / f"bench_{count}.pdf"
+            _build_pdf(source, count, target)
+
+            serial = _time(lambda: extract_pages_text(target, parallel=False), args.repeat)
+            parallel = _time(lambda: extract_pages_text(target, parallel=True), args.repeat)
+            assert extract_pages_text(target, parallel=True) == extract_pages_text(target, parallel=False)
+
+            print(f"{count:>8} {serial:>10.3f} {parallel:>13.3f} {serial / parallel:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
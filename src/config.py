@@ -24,6 +24,11 @@ def _user_data_dir():
 DATA_DIR = _user_data_dir()
 ERROR_LOG_FILE = os.path.join(DATA_DIR, "error.log")
 CACHE_FILE = os.path.join(DATA_DIR, "app_cache.json")
+PDF_INDEX_DIR = os.path.join(DATA_DIR, "pdf_index")   # índice de texto de los PDF de mensajes
+RECEIPTS_CACHE_FILE = os.path.join(DATA_DIR, "receipts_cache.json")   # datos leídos de los recibos
+MESSAGES_ARCHIVE_FILE = os.path.join(DATA_DIR, "messages_archive.sqlite3")   # mensajes de todos los meses (FTS5)
+PDF_OPTIMIZED_DIR = os.path.join(DATA_DIR, "pdf_optimized")   # copias comprimidas para WhatsApp
+EXCEL_SNAPSHOT_DIR = os.path.join(DATA_DIR, "excel_snapshot")   # último contenido leído de cada Excel
 
 
 # ══════════════════════════════════════════════════════════
@@ -250,6 +255,73 @@ WHATSAPP_CONFIG = {
 }
 
 
+# ══════════════════════════════════════════════════════════
+# CONFIGURACIÓN DE PDF
+# ══════════════════════════════════════════════════════════
+
+PDF_CONFIG = {
+    # Extracción en paralelo (solo PyMuPDF): por debajo de este número de
+    # páginas el arranque de los procesos cuesta más de lo que se ahorra.
+    # Ajustar con benchmarks/bench_pdf_extraction.py en cada equipo.
+    "parallel_min_pages": 400,
+    "parallel_workers": None,   # None = núcleos disponibles (máx. 8)
+    # Backend de extracción preferido ("fitz", "pypdf" o "PyPDF2"); None = el
+    # mejor instalado. Medir con benchmarks/bench_pdf_backends.py.
+    "backend": None,
+    # Unión de PDF (merge_pdfs): MB acumulados antes de volcar al archivo de salida
+    "merge_memory_mb": 256,
+    # PDF unido que build_client_bundles deja en cada carpeta de cliente
+    "bundle_name": "{cliente}_completo.pdf",
+    # Página de mensaje que se separa para cada cliente (split_pages)
+    "message_page_name": "{cliente}_mensaje.pdf",
+    # Vista previa de la página del mensaje (render_page_images)
+    "thumbnail_zoom": 0.5,          # 612x792 pt -> 306x396 px
+    "thumbnail_cache_mb": 32,       # tope de la caché de miniaturas en memoria
+    "thumbnail_prefetch": 2,        # clientes antes/después que se renderizan de antemano
+    # Copia comprimida antes de enviar por WhatsApp (optimize_pdf)
+    "optimize_before_send": True,
+    "optimized_cache_days": 30,     # copias sin uso más antiguas se borran
+    # Documentos abiertos que se reutilizan entre consultas (open_document)
+    "document_pool_size": 4,        # máximo de PDF abiertos a la vez
+    "document_idle_seconds": 30,    # se cierran tras este tiempo sin uso (libera el archivo)
+    # Búsqueda por nombre (find_message_for_client): confianza mínima para
+    # aceptar una página que no tiene el nombre completo. Por debajo suelen
+    # ser homónimos de un apellido (otro cliente), así que no se usan.
+    "name_min_score": 0.8,
+}
+
+
+# ══════════════════════════════════════════════════════════
+# CONFIGURACIÓN DE EXCEL
+# ══════════════════════════════════════════════════════════
+
+EXCEL_CONFIG = {
+    # Escritura diferida: save() marca cambios y el archivo se escribe cuando
+    # pasan estos segundos sin ediciones nuevas (o con flush()/al cerrar).
+    "write_behind": True,
+    "save_delay": 3.0,
+    # Bitácora: cada cambio se anota al momento en <archivo>.journal.jsonl y
+    # se recupera al abrir si la app se cerró sin escribir el Excel. Con ella
+    # el Excel se escribe (y la bitácora se compacta) a lo sumo cada
+    # journal_compact_delay segundos, con flush() y al cerrar.
+    "journal": True,
+    "journal_compact_delay": 30.0,
+    # Guardado por parches: se escriben solo las celdas que cambiaron sobre el
+    # libro original (se conservan formato, anchos y otras hojas). En False se
+    # regenera el archivo completo desde el DataFrame.
+    "patch_save": True,
+    # Columna que identifica cada fila: si el Excel cambió fuera de la app
+    # (filas insertadas, borradas u ordenadas), el guardado ubica con ella la
+    # fila de la hoja que corresponde a cada fila del DataFrame.
+    "key_column": "ID",
+    # Lectura: se regresa con estas primeras filas y el resto se lee en segundo plano
+    "load_first_rows": 200,
+    # Instantánea: lo leído de cada Excel se guarda en EXCEL_SNAPSHOT_DIR y, si
+    # el archivo no cambió (tamaño y mtime), se abre desde ahí sin leerlo
+    "snapshot": True,
+}
+
+
 # ══════════════════════════════════════════════════════════
 # VALIDACIONES
 # ══════════════════════════════════════════════════════════
@@ -291,6 +363,15 @@ EXCEL_COLUMNS_TI = [
     "MENSAJE",
 ]
 
+# Datos leídos de los recibos descargados (tools/receipt.py) -> columna del Excel.
+# Columnas propias para no pisar LINEA DE CAPTURA / PERIODO que se capturan a mano.
+EXCEL_COLUMNS_RECIBO = {
+    "linea_captura": "RECIBO LINEA CAPTURA",
+    "importe":       "RECIBO IMPORTE",
+    "fecha_limite":  "RECIBO FECHA LIMITE",
+    "periodo":       "RECIBO PERIODO",
+}
+
 # M40 - Mismas columnas que TI + INTENTOS de descarga
 EXCEL_COLUMNS_M40 = [
     "ID",
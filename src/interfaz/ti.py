@@ -69,6 +69,12 @@ class InterfazTI(QWidget):
         self._imss_worker    = None
         self._captcha_worker = None
         self._wa_worker      = None
+        self._msg_worker     = None
+        self._archive_worker = None
+        self._split_worker   = None
+        self._thumb_worker   = None
+        self._thumb_pending  = False   # se navegó mientras se renderizaba
+        self._receipt_worker = None
         self._captcha_done_status = None
 
         main_layout = QHBoxLayout()
@@ -177,6 +183,11 @@ class InterfazTI(QWidget):
         self.btn_download.clicked.connect(self._download_pdf)
         layout.addWidget(self.btn_download)
 
+        # Datos de los recibos ya descargados -> columnas RECIBO del Excel
+        self.btn_read_receipts = QPushButton("Leer recibos descargados")
+        self.btn_read_receipts.clicked.connect(self._read_receipts)
+        layout.addWidget(self.btn_read_receipts)
+
         # Página / Captcha
         page_row = QHBoxLayout()
         self.btn_open_page    = QPushButton("Abrir página")
@@ -203,11 +214,28 @@ class InterfazTI(QWidget):
         self.global_pdf_label.setWordWrap(True)
         layout.addWidget(self.global_pdf_label)
 
+        # Página de cada cliente como PDF aparte, en su carpeta
+        self.btn_split_pages = QPushButton("Separar mensajes por cliente")
+        self.btn_split_pages.clicked.connect(self._split_message_pages)
+        layout.addWidget(self.btn_split_pages)
+
+        self.btn_search_archive = QPushButton("Buscar en mensajes anteriores")
+        self.btn_search_archive.clicked.connect(self._search_archive)
+        layout.addWidget(self.btn_search_archive)
+
         # Preview del mensaje (solo lectura, igual que el código viejo)
         self.word_preview = QTextEdit()
         self.word_preview.setReadOnly(True)
         self.word_preview.setPlaceholderText("Aquí se mostrará el texto del mensaje del cliente.")
-        layout.addWidget(self.word_preview)
+        # Texto y miniatura de la página del PDF, para detectar errores de extracción
+        preview_row = QHBoxLayout()
+        preview_row.addWidget(self.word_preview, 3)
+        self.page_thumb = QLabel("Sin vista previa")
+        self.page_thumb.setAlignment(Qt.AlignCenter)
+        self.page_thumb.setFixedWidth(220)
+        self.page_thumb.setStyleSheet("border: 1px solid #ccc;")
+        preview_row.addWidget(self.page_thumb)
+        layout.addLayout(preview_row)
 
         # Enviar
         self.btn_send = QPushButton("Enviar mensaje")
@@ -249,6 +277,8 @@ class InterfazTI(QWidget):
             self._set_status(f"Excel cargado: {os.path.basename(path)}")
         except Exception as e:
             self._show_error("Error cargando Excel", e)
+            return
+        self._start_message_precompute()
 
     def _save_changes(self):
         self.btn_save.setDisabled(True)
@@ -375,10 +405,93 @@ class InterfazTI(QWidget):
     # Panel 3 — Mensaje / WhatsApp
     # ──────────────────────────────────────────────────────────
 
+    def _read_receipts(self):
+        if not self.workflow.excel:
+            QMessageBox.warning(self, "Excel requerido", "Abre primero un archivo Excel.")
+            return
+
+        self.btn_read_receipts.setEnabled(False)
+        self._set_status("Leyendo recibos descargados...", color="gray")
+        self._receipt_worker = Worker(self.workflow.extract_receipts_data)
+        self._receipt_worker.finished.connect(self._on_receipts_done)
+        self._receipt_worker.error.connect(
+            lambda e: (self.btn_read_receipts.setEnabled(True),
+                       self._show_error("Error leyendo recibos", RuntimeError(e)))
+        )
+        self._receipt_worker.start()
+
+    def _on_receipts_done(self, resumen: dict):
+        self.btn_read_receipts.setEnabled(True)
+        color = "green" if resumen["sin_recibo"] == 0 else "orange"
+        self._set_status(
+            f"Recibos leídos: {resumen['actualizadas']} clientes actualizados, "
+            f"{resumen['sin_recibo']} sin recibo.",
+            color=color
+        )
+
+    def _split_message_pages(self):
+        if not self._global_pdf_path or not self.workflow.excel:
+            QMessageBox.warning(
+                self, "PDF de mensajes requerido",
+                "Abre el Excel y selecciona el PDF de mensajes antes de separar."
+            )
+            return
+
+        self.btn_split_pages.setEnabled(False)
+        self._set_status("Separando mensajes por cliente...", color="gray")
+        self._split_worker = Worker(self.workflow.split_message_pages, self._global_pdf_path)
+        self._split_worker.finished.connect(self._on_split_done)
+        self._split_worker.error.connect(
+            lambda e: (self.btn_split_pages.setEnabled(True),
+                       self._show_error("Error separando mensajes", RuntimeError(e)))
+        )
+        self._split_worker.start()
+
+    def _on_split_done(self, resumen: dict):
+        self.btn_split_pages.setEnabled(True)
+        pendientes = resumen["sin_mensaje"] + resumen["sin_carpeta"] + resumen["errores"]
+        self._set_status(
+            f"Mensajes separados: {resumen['escritos']} nuevos, {resumen['al_dia']} al día, "
+            f"{resumen['sin_mensaje']} sin mensaje, {resumen['sin_carpeta']} sin carpeta, "
+            f"{resumen['errores']} con error.",
+            color="green" if pendientes == 0 else "orange"
+        )
+
+    def _search_archive(self):
+        """Busca un nombre, ID o frase en los PDF de mensajes de meses anteriores."""
+        tipos = {"Nombre": "name", "ID": "id", "Texto": "text"}
+        tipo, ok = QInputDialog.getItem(
+            self, "Buscar en mensajes anteriores", "Buscar por:", list(tipos), 0, False
+        )
+        if not ok:
+            return
+        query, ok = QInputDialog.getText(self, "Buscar en mensajes anteriores", f"{tipo}:")
+        if not ok or not query.strip():
+            return
+
+        try:
+            resultados = self.workflow.search_message_archive(query.strip(), tipos[tipo], limit=10)
+        except Exception as e:
+            self._show_error("Error buscando en mensajes anteriores", e)
+            return
+
+        if not resultados:
+            QMessageBox.information(
+                self, "Mensajes anteriores",
+                f"Sin resultados para \"{query.strip()}\".\n\n"
+                "Solo se buscan los PDF de mensajes que ya se abrieron en la aplicación."
+            )
+            return
+        lineas = [
+            f"{r['name']} — página {r['page_idx'] + 1}:\n    {' '.join(r['snippet'].split())}"
+            for r in resultados
+        ]
+        QMessageBox.information(self, "Mensajes anteriores", "\n\n".join(lineas))
+
     def _select_global_pdf(self):
-        """Selecciona el PDF global de mensajes (solo sesión, no va al Excel)."""
+        """Selecciona el PDF (o .docx) global de mensajes (solo sesión, no va al Excel)."""
         path, _ = QFileDialog.getOpenFileName(
-            self, "Seleccionar PDF de mensajes", "", "PDF (*.pdf)"
+            self, "Seleccionar PDF de mensajes", "", "Mensajes (*.pdf *.docx)"
         )
         if not path:
             return
@@ -386,21 +499,86 @@ class InterfazTI(QWidget):
         self.global_pdf_label.setText(
             f"PDF de mensajes: {os.path.basename(self._global_pdf_path)}"
         )
+        if not self._start_message_precompute():
+            self._auto_load_message()
+
+    def _start_message_precompute(self) -> bool:
+        """
+        Resuelve en segundo plano los mensajes de todo el Excel para el PDF
+        seleccionado. Retorna False si no hay nada que preparar.
+        """
+        if not self._global_pdf_path or not self.workflow.excel:
+            return False
+        if self._msg_worker is not None and self._msg_worker.isRunning():
+            return True
+
+        self.btn_select_global_pdf.setEnabled(False)
+        self.word_preview.setPlaceholderText("Preparando mensajes del PDF...")
+        self._set_status("Preparando mensajes del PDF...", color="gray")
+        self._msg_worker = Worker(self.workflow.precompute_messages, self._global_pdf_path)
+        self._msg_worker.finished.connect(self._on_precompute_done)
+        self._msg_worker.error.connect(self._on_precompute_error)
+        self._msg_worker.start()
+        return True
+
+    def _on_precompute_done(self, cobertura: dict):
+        self.btn_select_global_pdf.setEnabled(True)
+        self.word_preview.setPlaceholderText("Aquí se mostrará el texto del mensaje del cliente.")
+        color = "green" if cobertura["sin_mensaje"] == 0 else "orange"
+        self._set_status(
+            f"Mensajes listos: {cobertura['por_id']} por ID, "
+            f"{cobertura['por_nombre']} por nombre, "
+            f"{cobertura['sin_mensaje']} sin mensaje.",
+            color=color
+        )
         self._auto_load_message()
+        self._start_message_archive()
+
+    def _on_precompute_error(self, error_msg: str):
+        self.btn_select_global_pdf.setEnabled(True)
+        self.word_preview.setPlaceholderText("Aquí se mostrará el texto del mensaje del cliente.")
+        self._set_status(f"No se pudieron preparar los mensajes: {error_msg}", color="orange")
+        self._auto_load_message()
+        self._start_message_archive()
+
+    def _start_message_archive(self):
+        """
+        Guarda el PDF de mensajes en el archivo histórico en segundo plano, ya
+        con los mensajes listos para no retrasar la vista previa. Si falla
+        queda en el log; la búsqueda en meses anteriores simplemente no lo tendrá.
+        """
+        if not self._global_pdf_path:
+            return
+        if self._archive_worker is not None and self._archive_worker.isRunning():
+            return
+        self._archive_worker = Worker(self.workflow.archive_messages_pdf, self._global_pdf_path)
+        self._archive_worker.start()
 
     def _auto_load_message(self):
         """Si hay PDF global seleccionado, carga el mensaje del cliente actual automáticamente."""
         if not self._global_pdf_path:
             return
+        # Mientras se preparan los mensajes el PDF está ocupado; se carga al terminar
+        if self._msg_worker is not None and self._msg_worker.isRunning():
+            self._clear_message_preview("Preparando mensajes...")
+            return
         try:
             trabajador = self.workflow.get_current_client()
             if not trabajador.cliente:
+                self._clear_message_preview()
                 return
             mensaje = self.workflow.get_message_for_client(
                 trabajador, self._global_pdf_path
             )
+            self._show_page_thumbnail(mensaje)
             if mensaje.es_valido():
                 self.word_preview.setPlainText(mensaje.texto)
+                if mensaje.metodo == "nombre" and mensaje.confianza < 1.0:
+                    self._set_status(
+                        f"Mensaje encontrado por nombre aproximado (confianza {mensaje.confianza:.2f}); "
+                        f"revisa que sea de '{trabajador.cliente}'.",
+                        color="orange"
+                    )
             else:
                 self.word_preview.setPlainText("")
                 self._set_status(
@@ -410,6 +588,57 @@ class InterfazTI(QWidget):
         except Exception:
             pass  # No interrumpir navegación si falla la búsqueda
 
+    def _clear_message_preview(self, placeholder: str = "Sin vista previa"):
+        """Quita el mensaje y la miniatura del cliente anterior."""
+        self.word_preview.setPlainText("")
+        self.page_thumb.clear()
+        self.page_thumb.setText(placeholder)
+
+    def _show_page_thumbnail(self, mensaje: Mensaje):
+        """Miniatura de la página del mensaje; si aún no está lista se renderiza en segundo plano."""
+        png = self.workflow.get_cached_thumbnail(mensaje)
+        if png:
+            self._set_page_thumbnail(png)
+        else:
+            self.page_thumb.clear()
+            self.page_thumb.setText(
+                "Cargando vista previa..." if mensaje.es_valido() else "Sin vista previa"
+            )
+        if mensaje.es_valido():
+            self._start_thumbnail_worker()
+
+    def _start_thumbnail_worker(self):
+        if self._thumb_worker is not None and self._thumb_worker.isRunning():
+            self._thumb_pending = True
+            return
+        self._thumb_pending = False
+        self._thumb_worker = Worker(
+            self.workflow.render_thumbnails, self._global_pdf_path, self.workflow.current_index
+        )
+        self._thumb_worker.finished.connect(self._on_thumbnails_done)
+        self._thumb_worker.error.connect(self._on_thumbnails_error)
+        self._thumb_worker.start()
+
+    def _on_thumbnails_done(self, images: dict):
+        png = images.get(self.workflow.current_index)
+        if png:
+            self._set_page_thumbnail(png)
+        if self._thumb_pending:
+            self._start_thumbnail_worker()
+
+    def _on_thumbnails_error(self, error_msg: str):
+        # Sin PyMuPDF o con un .docx simplemente no hay miniatura
+        self.page_thumb.clear()
+        self.page_thumb.setText("Sin vista previa")
+        self._thumb_pending = False
+
+    def _set_page_thumbnail(self, png: bytes):
+        pixmap = QPixmap()
+        pixmap.loadFromData(png)
+        self.page_thumb.setPixmap(
+            pixmap.scaledToWidth(self.page_thumb.width(), Qt.SmoothTransformation)
+        )
+
     def _open_whatsapp(self):
         self._set_wa_buttons_enabled(False)
         self._set_status("Abriendo WhatsApp Web...", color="gray")
@@ -485,6 +714,20 @@ class InterfazTI(QWidget):
     # Auxiliares UI
     # ──────────────────────────────────────────────────────────
 
+    def closeEvent(self, event):
+        """Antes de cerrar se escriben los cambios pendientes del Excel."""
+        try:
+            self.workflow.close()
+        except Exception as e:
+            respuesta = QMessageBox.question(
+                self, "Cambios sin guardar",
+                f"No se pudo guardar el Excel (¿está abierto?):\n{e}\n\n¿Cerrar de todos modos?",
+            )
+            if respuesta != QMessageBox.Yes:
+                event.ignore()
+                return
+        event.accept()
+
     def _regresar_launcher(self):
         from launcher import Launcher
         from PyQt5.QtWidgets import QApplication
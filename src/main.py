@@ -1,9 +1,12 @@
 # main.py
 import sys
+import multiprocessing
 from launcher import main as launcher_main
 from services.cache import clear_cache
 
 
 if __name__ == "__main__":
+    # Necesario en el .exe: la extracción de PDF en paralelo lanza procesos hijos
+    multiprocessing.freeze_support()
     #clear_cache()
     launcher_main()
\ No newline at end of file
@@ -8,6 +8,8 @@ class Mensaje:
     encontrado: bool = False
     page_idx: int  = -1
     pdf_path: str  = ""
+    metodo:   str  = ""   # "id" o "nombre": cómo se encontró en el PDF
+    confianza: float = 0.0  # 1.0 por ID o nombre exacto; menos si el nombre no coincide completo
 
     def es_valido(self) -> bool:
         return self.encontrado and bool(self.texto.strip())
@@ -6,8 +6,11 @@ import time
 import logging
 from typing import Optional
 
-from config import WHATSAPP_URL, WHATSAPP_SELECTORS, TIMEOUTS, DELAYS, ERROR_LOG_FILE
+from pathlib import Path
+
+from config import WHATSAPP_URL, WHATSAPP_SELECTORS, TIMEOUTS, DELAYS, ERROR_LOG_FILE, PDF_CONFIG
 from tools.browser import BrowserTools
+from tools.pdf import optimize_pdf
 
 
 # Configurar logging
@@ -259,6 +262,8 @@ class WhatsAppService:
             self.send_message(message)
 
         abs_path = os.path.abspath(pdf_path)
+        if PDF_CONFIG["optimize_before_send"]:
+            abs_path = self._optimized_pdf(abs_path)
 
         try:
             clip = self.browser.find_first(WHATSAPP_SELECTORS["clip_button"])
@@ -339,6 +344,19 @@ class WhatsAppService:
             logging.error(f"Error enviando PDF: {e}", exc_info=True)
             raise RuntimeError("Error al enviar el PDF por WhatsApp.")
 
+    def _optimized_pdf(self, pdf_path: str) -> str:
+        """Ruta de la copia comprimida del PDF (o la original si no conviene)."""
+        try:
+            result = optimize_pdf(Path(pdf_path))
+        except Exception as e:
+            logging.error(f"No se pudo optimizar {pdf_path}: {e}")
+            return pdf_path
+        logging.info(
+            f"PDF {os.path.basename(pdf_path)}: {result['original_bytes']} -> "
+            f"{result['optimized_bytes']} bytes{' (caché)' if result['cached'] else ''}"
+        )
+        return str(result["path"])
+
     def send_to(self, phone_number: str, message: str, pdf_path: str) -> None:
         """Flujo completo: abre chat, envía mensaje y PDF."""
         self.open_chat(phone_number)
@@ -0,0 +1,251 @@
+# tools/archive.py
+"""
+Archivo histórico de mensajes: el texto de todos los PDF de mensajes (uno por
+mes) en una base SQLite con búsqueda de texto completo (FTS5), en
+MESSAGES_ARCHIVE_FILE.
+
+Cada PDF se incorpora una vez por versión (ruta, tamaño, mtime) a partir del
+índice de tools/pdf (get_pages_index), así que el texto ya extraído no se
+vuelve a extraer. Un PDF que después se borra sigue en el archivo.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable
+
+from config import MESSAGES_ARCHIVE_FILE
+from tools.pdf import canonical_id, get_pages_index, page_ids, pdf_key
+from tools.text import normalize_text
+
+
+# Subir cuando cambie el esquema: la base se rehace desde los PDF (salvo las
+# versiones que _migrate sabe actualizar en su lugar)
+_ARCHIVE_VERSION = 2
+
+# rowid de cada página = documento << 20 | página: las páginas de un
+# documento se borran por rango sin recorrer la tabla
+_PAGE_BITS = 20
+
+_WORD_RE = re.compile(r"\w+")
+
+# Búsquedas aceptadas por search_messages
+SEARCH_TEXT = "text"    # todas las palabras, en cualquier orden
+SEARCH_NAME = "name"    # el nombre como frase; si no aparece, todas sus palabras
+SEARCH_ID = "id"        # ID de la primera línea ("557 TI" = "557TI")
+
+_write_lock = threading.Lock()
+
+
+def _migrate(conn: sqlite3.Connection, version: int) -> bool:
+    """
+    Actualiza en su lugar una base de una versión anterior; False si no se
+    puede y hay que rehacerla. Así no se pierden los PDF que ya no existen.
+    """
+    if version != 1:
+        return False
+    # v1 -> v2: la columna ids gana los números sin sufijo de page_ids
+    with conn:
+        for (doc_id,) in conn.execute("SELECT id FROM documents").fetchall():
+            rows = conn.execute(
+                "SELECT rowid, first_line FROM page_text WHERE rowid BETWEEN ? AND ? ORDER BY rowid",
+                (doc_id << _PAGE_BITS, ((doc_id + 1) << _PAGE_BITS) - 1),
+            ).fetchall()
+            ids = page_ids([row["first_line"] for row in rows])
+            conn.executemany(
+                "UPDATE page_text SET ids = ? WHERE rowid = ?",
+                [(" ".join(sorted(page)), row["rowid"]) for row, page in zip(rows, ids)],
+            )
+        conn.execute(f"PRAGMA user_version = {_ARCHIVE_VERSION}")
+    return True
+
+
+def _connect() -> sqlite3.Connection:
+    """Conexión a la base; crea (o rehace, si cambió la versión) el esquema."""
+    path = Path(MESSAGES_ARCHIVE_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != _ARCHIVE_VERSION and not _migrate(conn, version):
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS documents")
+                conn.execute("DROP TABLE IF EXISTS page_text")
+                conn.execute(
+                    "CREATE TABLE documents ("
+                    " id INTEGER PRIMARY KEY,"
+                    " path TEXT UNIQUE NOT NULL,"
+                    " name TEXT NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " mtime_ns INTEGER NOT NULL,"
+                    " pages INTEGER NOT NULL)"
+                )
+                # norm/ids se buscan; text (original) y first_line solo se devuelven
+                conn.execute(
+                    "CREATE VIRTUAL TABLE page_text USING fts5("
+                    " norm, ids, text UNINDEXED, first_line UNINDEXED,"
+                    " tokenize = 'unicode61 remove_diacritics 2')"
+                )
+                conn.execute(f"PRAGMA user_version = {_ARCHIVE_VERSION}")
+    except sqlite3.OperationalError as e:
+        conn.close()
+        raise RuntimeError(f"No se pudo abrir el archivo de mensajes (¿SQLite sin FTS5?): {e}")
+    return conn
+
+
+def ingest_messages_pdf(path: Path) -> dict:
+    """
+    Incorpora (o actualiza) un PDF o .docx de mensajes en el archivo.
+
+    Retorna {"pages": páginas guardadas, "skipped": True si ya estaba al día}.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"No existe el archivo de mensajes: {path}")
+    abs_path, size, mtime_ns = pdf_key(path)
+
+    with _write_lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT id, size, mtime_ns, pages FROM documents WHERE path = ?", (abs_path,)
+            ).fetchone()
+            if row is not None and (row["size"], row["mtime_ns"]) == (size, mtime_ns):
+                return {"pages": row["pages"], "skipped": True}
+
+            index = get_pages_index(path)
+            pages, norm = index["pages"], index["norm"]
+            if len(pages) >= 1 << _PAGE_BITS:
+                raise ValueError(f"Demasiadas páginas para el archivo de mensajes: {len(pages)}")
+
+            with conn:
+                if row is None:
+                    doc_id = conn.execute(
+                        "INSERT INTO documents (path, name, size, mtime_ns, pages) VALUES (?, ?, ?, ?, ?)",
+                        (abs_path, path.name, size, mtime_ns, len(pages)),
+                    ).lastrowid
+                else:
+                    doc_id = row["id"]
+                    conn.execute(
+                        "UPDATE documents SET name = ?, size = ?, mtime_ns = ?, pages = ? WHERE id = ?",
+                        (path.name, size, mtime_ns, len(pages), doc_id),
+                    )
+                    conn.execute(
+                        "DELETE FROM page_text WHERE rowid BETWEEN ? AND ?",
+                        (doc_id << _PAGE_BITS, ((doc_id + 1) << _PAGE_BITS) - 1),
+                    )
+
+                # Mismos IDs (con los números sin sufijo) que find_message_by_id
+                first_lines = [text_norm.split("\n", 1)[0].strip() for text_norm in norm]
+                rows = [
+                    ((doc_id << _PAGE_BITS) | i, text_norm, " ".join(sorted(ids)), text, first_line)
+                    for i, (text, text_norm, first_line, ids) in enumerate(
+                        zip(pages, norm, first_lines, page_ids(first_lines))
+                    )
+                ]
+                conn.executemany(
+                    "INSERT INTO page_text (rowid, norm, ids, text, first_line) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            return {"pages": len(pages), "skipped": False}
+        finally:
+            conn.close()
+
+
+def ingest_messages(paths: Iterable[Path]) -> dict[Path, dict]:
+    """
+    Incorpora varios archivos de mensajes (ver ingest_messages_pdf).
+    Un archivo que falla trae "error" y no detiene a los demás.
+    """
+    results: dict[Path, dict] = {}
+    for path in dict.fromkeys(Path(p) for p in paths):
+        try:
+            results[path] = {**ingest_messages_pdf(path), "error": ""}
+        except Exception as e:
+            results[path] = {"pages": 0, "skipped": False, "error": str(e)}
+    return results
+
+
+def _quote(words: list[str]) -> str:
+    """Frase FTS5 entre comillas (las palabras ya vienen de \\w+, sin comillas)."""
+    return '"' + " ".join(words) + '"'
+
+
+def _match_queries(query: str, search_by: str) -> list[str]:
+    """Expresiones MATCH a probar en orden hasta que una devuelva resultados."""
+    if search_by == SEARCH_ID:
+        canonical = canonical_id(query)
+        words = _WORD_RE.findall(canonical)
+        return [f"ids : {_quote(words)}"] if words else []
+
+    words = _WORD_RE.findall(normalize_text(query))
+    if not words:
+        return []
+    all_words = "norm : (" + " AND ".join(_quote([w]) for w in words) + ")"
+    if search_by == SEARCH_NAME:
+        return [f"norm : {_quote(words)}", all_words]
+    if search_by == SEARCH_TEXT:
+        return [all_words]
+    raise ValueError(f"Búsqueda no soportada: {search_by}")
+
+
+def search_messages(query: str, search_by: str = SEARCH_TEXT, limit: int = 20) -> list[dict]:
+    """
+    Busca en todos los mensajes archivados, del más relevante al menos (bm25;
+    a igual relevancia, el PDF más reciente primero).
+
+    Retorna una lista de:
+        {"path", "name", "page_idx", "first_line", "snippet", "text", "score"}
+    donde snippet es un fragmento normalizado con las coincidencias entre [ ].
+    """
+    queries = _match_queries(query, search_by)
+    if not queries:
+        return []
+
+    conn = _connect()
+    try:
+        for match in queries:
+            rows = conn.execute(
+                "SELECT page_text.rowid AS rowid, d.path AS path, d.name AS name,"
+                " page_text.first_line AS first_line, page_text.text AS text,"
+                " bm25(page_text) AS score,"
+                " snippet(page_text, 0, '[', ']', '…', 12) AS snippet"
+                " FROM page_text JOIN documents AS d ON d.id = (page_text.rowid >> ?)"
+                " WHERE page_text MATCH ?"
+                " ORDER BY score, d.mtime_ns DESC, page_text.rowid"
+                " LIMIT ?",
+                (_PAGE_BITS, match, max(1, int(limit))),
+            ).fetchall()
+            if rows:
+                return [
+                    {
+                        "path": row["path"],
+                        "name": row["name"],
+                        "page_idx": row["rowid"] & ((1 << _PAGE_BITS) - 1),
+                        "first_line": row["first_line"],
+                        "snippet": row["snippet"],
+                        "text": row["text"],
+                        # bm25 es negativo: más negativo = más relevante
+                        "score": -row["score"],
+                    }
+                    for row in rows
+                ]
+        return []
+    finally:
+        conn.close()
+
+
+def archived_documents() -> list[dict]:
+    """Archivos incorporados: [{"path", "name", "pages"}], el más reciente primero."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT path, name, pages FROM documents ORDER BY mtime_ns DESC"
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
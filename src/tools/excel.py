@@ -1,49 +1,667 @@
 # tools/excel.py
 import os
+import json
+import pickle
+import hashlib
+import atexit
+import logging
+import weakref
+import threading
 from pathlib import Path
 from datetime import datetime
 import pandas as pd
+import openpyxl
 import tempfile
 import shutil
 import time
 
-from config import TIMEOUTS
+from config import TIMEOUTS, EXCEL_CONFIG, EXCEL_SNAPSHOT_DIR
+
+
+# Instancias con escritura diferida: lo pendiente se escribe al salir
+_open_workbooks: "weakref.WeakSet[ExcelTools]" = weakref.WeakSet()
+
+
+def _flush_all() -> None:
+    for excel in list(_open_workbooks):
+        try:
+            excel.flush()
+        except Exception:
+            pass
+
+
+atexit.register(_flush_all)
+
+
+def _file_stamp(path: Path) -> list[int]:
+    """[tamaño, mtime_ns] del archivo: identifica la versión sobre la que se anotó."""
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+# Subir cuando cambie lo que se guarda en la instantánea: invalida las guardadas
+_SNAPSHOT_VERSION = 1
+
+
+def _snapshot_file(path: Path) -> Path:
+    """Una instantánea por ruta; la versión del archivo se valida con la llave guardada dentro."""
+    digest = hashlib.sha1(str(path).encode("utf-8")).hexdigest()
+    return Path(EXCEL_SNAPSHOT_DIR) / f"{digest}.pkl"
+
+
+def _read_snapshot(path: Path, key: list) -> dict | None:
+    try:
+        with open(_snapshot_file(path), "rb") as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(data, dict) or data.get("version") != _SNAPSHOT_VERSION:
+        return None
+    return data if data.get("key") == key else None
+
+
+def _write_snapshot(path: Path, key: list, payload: dict) -> None:
+    target = _snapshot_file(path)
+    tmp = target.with_suffix(".tmp")
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "wb") as f:
+            pickle.dump({"version": _SNAPSHOT_VERSION, "key": key, **payload}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)
+    except Exception:
+        # La instantánea es solo una optimización
+        tmp.unlink(missing_ok=True)
+
+
+def _header_names(header: tuple) -> list:
+    """Nombres de columna como los pone pandas: "Unnamed: j" si no hay, "X.1" si se repite."""
+    names, seen = [], {}
+    for j, value in enumerate(header):
+        name = f"Unnamed: {j}" if value is None else value
+        while name in seen:
+            seen[name] += 1
+            name = f"{value}.{seen[value]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def _trim(values: tuple) -> tuple:
+    """La fila sin las celdas vacías del final."""
+    end = len(values)
+    while end and values[end - 1] is None:
+        end -= 1
+    return values[:end]
+
+
+def _data_rows(rows):
+    """
+    Filas de la hoja sin las vacías del final (igual que pandas); las vacías
+    intermedias se conservan para que cada fila siga en su renglón de la hoja.
+    """
+    blank = []
+    for values in rows:
+        if any(v is not None for v in values):
+            yield from blank
+            blank.clear()
+            yield values
+        else:
+            blank.append(values)
+
+
+def _repeated(values: list) -> list:
+    """Los valores que aparecen más de una vez, en orden de aparición."""
+    seen, repeated = set(), []
+    for value in values:
+        if value in seen and value not in repeated:
+            repeated.append(value)
+        seen.add(value)
+    return repeated
+
+
+def _cell_value(value):
+    """Valor del DataFrame tal como va en la celda: "" es una celda vacía."""
+    if isinstance(value, str):
+        return value if value != "" else None
+    if hasattr(value, "item"):      # escalares de numpy
+        return value.item()
+    return value
 
 
 class ExcelTools:
-    def __init__(self, path: str, has_header: bool = True, save_timeout: float = None):
+    def __init__(self, path: str, has_header: bool = True, save_timeout: float = None,
+                 write_behind: bool = None, journal: bool = None):
         self.path = Path(path).resolve()
         self.has_header = has_header
         # Usar timeout de config.py si no se especifica
         self.save_timeout = float(save_timeout) if save_timeout is not None else TIMEOUTS["default"]
+        # Con escritura diferida save() solo agenda la escritura (ver save/flush)
+        self.write_behind = EXCEL_CONFIG["write_behind"] if write_behind is None else write_behind
+        self.save_delay = float(EXCEL_CONFIG["save_delay"])
+        # Bitácora de cambios junto al Excel (ver _journal_append / _replay_journal)
+        self.journal = EXCEL_CONFIG["journal"] if journal is None else journal
+        self.journal_path = self.path.with_name(self.path.name + ".journal.jsonl")
+        if self.journal:
+            self.save_delay = float(EXCEL_CONFIG["journal_compact_delay"])
         self.df: pd.DataFrame | None = None
         self.current_index: int = 0
 
+        self._lock = threading.RLock()         # protege df, _dirty y la bitácora entre hilos
+        self._write_lock = threading.Lock()    # una escritura del archivo a la vez
+        self._dirty = False
+        self._timer: threading.Timer | None = None
+        self.last_save_error: Exception | None = None
+        self._journal_lines: list[str] = []    # cambios anotados desde la última escritura
+        self._base_stamp: list[int] | None = None
+        self.replayed_ops = 0                  # cambios recuperados de la bitácora en load()
+        # Guardado por parches: solo las celdas de los cambios pendientes, sobre
+        # el libro abierto con openpyxl (conserva formato, anchos y otras hojas)
+        self.patch_save = EXCEL_CONFIG["patch_save"]
+        self._pending_ops: list[dict] = []     # cambios que aún no están en el archivo
+        self._base_rows = 0                    # filas del archivo en _base_stamp
+        self._base_keys: set[str] = set()      # llaves de esas filas (ver _patch_all)
+        self.key_column = EXCEL_CONFIG["key_column"]
+        self._workbook = None                  # libro de openpyxl tal como quedó en disco
+        self._positions: dict = {}             # columna del DataFrame -> columna de la hoja
+        self._sheet_width = 0                  # columnas con encabezado en la hoja
+        self._first_row = 1                    # renglón de la hoja de df.iloc[0]
+        # Lectura en segundo plano (ver load)
+        self.columns: list | None = None
+        self.load_first_rows = int(EXCEL_CONFIG["load_first_rows"])
+        self._loaded = threading.Event()
+        self._loaded.set()
+        self._rows_ready = threading.Condition(self._lock)
+        self._load_gen = 0
+        self._load_thread: threading.Thread | None = None
+        self._load_error: Exception | None = None
+        # Instantánea del DataFrame leído en EXCEL_SNAPSHOT_DIR (ver _store_snapshot)
+        self.snapshot = EXCEL_CONFIG["snapshot"]
+        self.from_snapshot = False             # True si el último load() salió de la instantánea
+        _open_workbooks.add(self)
+
     # =========================
     # I/O
     # =========================
 
-    def load(self) -> pd.DataFrame:
+    def load(self, columns: list | None = None) -> pd.DataFrame:
+        """
+        Lee el Excel fila por fila (openpyxl en modo solo lectura) y regresa en
+        cuanto tiene las primeras load_first_rows filas; el resto se sigue
+        leyendo en segundo plano. get_row() y has_row() esperan solo a la fila
+        que piden; row_count(), las búsquedas, los cambios de estructura y las
+        escrituras esperan a que termine la lectura.
+
+        Con columns solo se cargan esas columnas (más key_column y
+        UltimaActualizacion, si existen); las demás no se leen y, al guardar
+        por parches, quedan como están en el archivo. La llave siempre se
+        carga porque, si el Excel cambió por fuera, con ella se ubica la fila
+        de cada cambio y las columnas no cargadas no se separan de su fila
+        (ver _patch_all). Sin guardado por parches se cargan todas, porque la
+        escritura completa las perdería.
+
+        Si el archivo no cambió (misma ruta, tamaño y mtime) desde la última
+        lectura o escritura de la app, el DataFrame sale de la instantánea y
+        no se lee el Excel.
+        """
         if not self.path.exists():
             raise FileNotFoundError(f"No existe el archivo Excel: {self.path}")
 
-        try:
-            if self.has_header:
-                self.df = pd.read_excel(self.path, engine="openpyxl")
+        self._stop_loading()
+        if columns is not None and self.patch_save:
+            self.columns = list(dict.fromkeys([self.key_column, *columns, "UltimaActualizacion"]))
+        else:
+            self.columns = None
+        # La bitácora y las hojas sin encabezado se aplican/leen completas
+        background = self.has_header and not (self.journal and self.journal_path.exists())
+
+        stamp = _file_stamp(self.path)
+        snapshot = self._snapshot_for(stamp) if self.snapshot else None
+        wb = None
+        if snapshot is not None:
+            df = snapshot["df"]
+            if self.columns is not None:
+                df = df[[c for c in df.columns if c in self.columns]]
+            positions = snapshot["positions"]
+            width, first_row = snapshot["width"], snapshot["first_row"]
+        else:
+            try:
+                wb = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+                ws = wb.worksheets[0]
+                ws.reset_dimensions()
+                rows = ws.iter_rows(values_only=True)
+                if self.has_header:
+                    # Como pandas: el encabezado es el primer renglón de la hoja
+                    header = _trim(next(rows, ()))
+                    names = _header_names(header)
+                    picked = [j for j, name in enumerate(names)
+                              if self.columns is None or name in self.columns]
+                    width = len(header)
+                    first_row = 2
+                    rows = _data_rows(rows)
+                else:
+                    data = [_trim(r) for r in _data_rows(rows)]
+                    width = max((len(r) for r in data), default=0)
+                    names = list(range(width))
+                    picked = names
+                    first_row = 1
+                    rows = iter(data)
+
+                take = self.load_first_rows if background else None
+                df = self._rows_frame(rows, picked, [names[j] for j in picked], take)
+                # Todas las columnas de la hoja, también las que no se cargaron
+                positions = {name: j + 1 for j, name in enumerate(names)}
+            except Exception as e:
+                if wb is not None:
+                    wb.close()
+                raise RuntimeError(f"Error leyendo Excel: {self.path}") from e
+
+        with self._lock:
+            self.df = df
+            self.current_index = 0
+            self._dirty = False
+            self._base_stamp = stamp
+            self._pending_ops = []
+            self._workbook = None
+            self._positions = positions
+            self._sheet_width = width
+            self._first_row = first_row
+            self._journal_lines = []
+            self._load_error = None
+            self.replayed_ops = 0
+            self.from_snapshot = snapshot is not None
+            if wb is not None and background and len(df) == take:
+                self._loaded.clear()
+                self._load_thread = threading.Thread(
+                    target=self._load_rest, args=(self._load_gen, wb, rows, picked), daemon=True
+                )
+                self._load_thread.start()
             else:
-                self.df = pd.read_excel(self.path, header=None, engine="openpyxl")
-        except Exception as e:
-            raise RuntimeError(f"Error leyendo Excel: {self.path}") from e
-
-        self.df = self.df.fillna("")
-        self.df = self.df.reset_index(drop=True)
-        self.current_index = 0
+                if wb is not None:
+                    wb.close()
+                    self._store_snapshot()
+                self._base_rows = len(self.df)
+                self._base_keys = set(self._row_keys(self.df) or ())
+                self.replayed_ops = self._replay_journal() if self.journal else 0
         return self.df
 
+    def _snapshot_for(self, stamp: list[int]) -> dict | None:
+        """La instantánea de esta versión del archivo, si tiene las columnas pedidas."""
+        snapshot = _read_snapshot(self.path, [str(self.path), *stamp])
+        if snapshot is None or snapshot["has_header"] != self.has_header:
+            return None
+        if snapshot["columns"] is not None and (
+                self.columns is None or not set(self.columns) <= set(snapshot["columns"])):
+            return None
+        return snapshot
+
+    def _store_snapshot(self, df: pd.DataFrame | None = None) -> None:
+        """
+        Guarda df (por omisión el DataFrame actual) como instantánea de la
+        versión del archivo en _base_stamp. Solo debe llamarse cuando df es
+        exactamente lo que hay en el archivo: al terminar de leerlo o después
+        de escribirlo.
+        """
+        if not self.snapshot:
+            return
+        with self._lock:
+            if df is None:
+                if self._dirty:
+                    return   # ya trae cambios que no están en el archivo
+                df = self.df.copy()
+            payload = {
+                "has_header": self.has_header,
+                "columns": self.columns,
+                "positions": dict(self._positions),
+                "width": self._sheet_width,
+                "first_row": self._first_row,
+                "df": df,
+            }
+            key = [str(self.path), *self._base_stamp]
+        _write_snapshot(self.path, key, payload)
+
+    def _rows_frame(self, rows, picked: list[int], names: list, limit: int | None = None) -> pd.DataFrame:
+        """DataFrame con las columnas picked de hasta limit filas de rows ("" en las vacías)."""
+        data = []
+        for values in rows:
+            data.append(tuple(values[j] if j < len(values) else None for j in picked))
+            if limit is not None and len(data) >= limit:
+                break
+        return pd.DataFrame(data, columns=names, dtype=object).fillna("")
+
+    def _load_rest(self, gen: int, wb, rows, picked: list[int]) -> None:
+        """Sigue leyendo en segundo plano; los bloques crecen al doble para no copiar de más."""
+        names = list(self.df.columns)
+        try:
+            while gen == self._load_gen:
+                size = max(len(self.df), self.load_first_rows)
+                chunk = self._rows_frame(rows, picked, names, size)
+                with self._lock:
+                    if gen != self._load_gen:
+                        return
+                    if len(chunk):
+                        self.df = pd.concat([self.df, chunk], ignore_index=True)
+                    self._rows_ready.notify_all()
+                if len(chunk) < size:
+                    break
+        except Exception as e:
+            self._load_error = e
+        finally:
+            wb.close()
+        if gen == self._load_gen and self._load_error is None:
+            with self._lock:
+                self._base_rows = len(self.df)
+                self._base_keys = set(self._row_keys(self.df) or ())
+            self._store_snapshot()
+        with self._lock:
+            if gen == self._load_gen:
+                self._loaded.set()
+                self._rows_ready.notify_all()
+
+    def _stop_loading(self) -> None:
+        """Corta una lectura en segundo plano anterior (y suelta su archivo)."""
+        with self._lock:
+            self._load_gen += 1
+            thread = self._load_thread
+            self._load_thread = None
+            self._loaded.set()
+            self._rows_ready.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def is_loading(self) -> bool:
+        return not self._loaded.is_set()
+
+    def wait_loaded(self) -> None:
+        """Espera a que termine la lectura en segundo plano."""
+        self._loaded.wait()
+        if self._load_error is not None:
+            raise RuntimeError(f"Error leyendo Excel: {self.path}") from self._load_error
+
+    def has_row(self, index: int) -> bool:
+        """True si existe la fila index; espera solo hasta que esa fila se haya leído."""
+        if self.df is None:
+            raise ValueError("DataFrame no cargado.")
+        with self._rows_ready:
+            while index >= len(self.df) and not self._loaded.is_set():
+                self._rows_ready.wait()
+        if index >= len(self.df):
+            self.wait_loaded()
+        return 0 <= index < len(self.df)
+
     def save(self) -> Path:
+        """
+        Guarda los cambios. Con escritura diferida solo agenda la escritura:
+        se hace cuando pasan save_delay segundos sin otro save() (las ediciones
+        seguidas se juntan en una sola escritura), con flush() o al cerrar.
+        Con bitácora cada cambio ya quedó en disco al hacerse, así que la
+        escritura del Excel no se pospone más: se hace a lo sumo cada
+        journal_compact_delay segundos aunque sigan llegando save().
+        Sin cambios pendientes no se escribe nada.
+
+        Si falló una escritura en segundo plano, save() la vuelve a agendar y
+        lanza ese error (p. ej. PermissionError con el Excel abierto) para que
+        quien guarda se entere.
+        """
         if self.df is None:
             raise ValueError("No hay DataFrame cargado para guardar.")
+        if not self.write_behind:
+            return self._write()
+
+        with self._lock:
+            if self._dirty and not (self._timer is not None and self.journal):
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = threading.Timer(self.save_delay, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+            error, self.last_save_error = self.last_save_error, None
+        if error is not None:
+            raise error
+        return self.path
+
+    def flush(self) -> Path:
+        """Escribe ya los cambios pendientes (puntos críticos, antes de cerrar)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.df is None or not self._dirty:
+                return self.path
+        return self._write()
+
+    def has_pending_changes(self) -> bool:
+        return self._dirty
 
+    def close(self) -> None:
+        """Escribe lo pendiente y deja de seguir el archivo."""
+        self.flush()
+        self._stop_loading()
+        self._workbook = None
+        _open_workbooks.discard(self)
+
+    def _flush_in_background(self) -> None:
+        with self._lock:
+            self._timer = None
+        try:
+            self._write()
+        except Exception as e:
+            # Queda pendiente: se reintenta en el siguiente save() o flush()
+            self.last_save_error = e
+
+    def _write(self) -> Path:
+        """
+        Escribe los cambios (copia del DataFrame tomada con el candado) sobre
+        el archivo y compacta la bitácora: quedan solo los cambios anotados
+        mientras se escribía.
+        """
+        self.wait_loaded()
+        with self._write_lock:
+            with self._lock:
+                if self.df is None:
+                    raise ValueError("No hay DataFrame cargado para guardar.")
+                df = self.df.copy()
+                ops, self._pending_ops = self._pending_ops, []
+                written = len(self._journal_lines)
+                self._dirty = False
+            try:
+                if self.patch_save:
+                    self._patch_workbook(df, ops)
+                else:
+                    self._write_dataframe(df)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                    self._pending_ops = ops + self._pending_ops
+                # El libro en memoria pudo quedar a medias: se vuelve a abrir del disco
+                self._workbook = None
+                raise
+            with self._lock:
+                self._base_stamp = _file_stamp(self.path)
+                self._base_rows = len(df)
+                self._base_keys = set(self._row_keys(df) or ())
+                if self.journal:
+                    self._journal_lines = self._journal_lines[written:]
+                    self._rewrite_journal()
+            # Lo recién escrito es la nueva versión del archivo
+            self._store_snapshot(df)
+            self.last_save_error = None
+            return self.path
+
+    def _write_dataframe(self, df: pd.DataFrame) -> None:
+        self._replace_file(lambda tmp_path: df.to_excel(tmp_path, index=False, engine="openpyxl"))
+
+    def _patch_workbook(self, df: pd.DataFrame, ops: list[dict]) -> None:
+        """
+        Aplica los cambios al libro de openpyxl (se abre una vez y se conserva
+        entre escrituras) y lo guarda. Solo se tocan las celdas de los cambios;
+        si el archivo cambió por fuera desde la última lectura o escritura, las
+        filas del DataFrame se ubican por su llave en el libro recién abierto
+        (ver _patch_all), que conserva igual su formato.
+
+        openpyxl guarda las fórmulas pero no su último resultado: hasta que
+        Excel vuelva a abrir y guardar el archivo, load() (que lee resultados)
+        las ve vacías. Por eso se avisa en el log y se le pide a Excel que
+        recalcule todo al abrirlo.
+        """
+        external = _file_stamp(self.path) != self._base_stamp
+        wb = self._workbook
+        if wb is None or external:
+            try:
+                wb = openpyxl.load_workbook(self.path)
+            except Exception as e:
+                raise RuntimeError(f"Error leyendo Excel: {self.path}") from e
+            self._check_formulas(wb)
+        ws = wb.worksheets[0]
+
+        if external:
+            self._patch_all(ws, df)
+        else:
+            self._patch_ops(ws, df, ops)
+
+        self._replace_file(wb.save)
+        self._workbook = wb
+
+    def _check_formulas(self, wb) -> None:
+        ws = wb.worksheets[0]
+        formulas = sorted({
+            cell.column_letter
+            for row in ws.iter_rows() for cell in row if cell.data_type == "f"
+        })
+        if formulas:
+            wb.calculation.fullCalcOnLoad = True
+            logging.warning(
+                f"El Excel tiene fórmulas (columnas {', '.join(formulas)}): al guardar se conservan, "
+                f"pero sus resultados quedan vacíos para la app hasta que Excel abra y guarde "
+                f"el archivo: {self.path}"
+            )
+
+    def _position(self, name) -> int:
+        """Columna de la hoja de name; las columnas nuevas van después de la última."""
+        if name not in self._positions and str(name) in self._positions:
+            return self._positions[str(name)]   # claves que vienen de la bitácora
+        if name not in self._positions:
+            self._sheet_width += 1
+            self._positions[name] = self._sheet_width
+        return self._positions[name]
+
+    def _patch_ops(self, ws, df: pd.DataFrame, ops: list[dict]) -> None:
+        first = self._first_row
+        rows = self._base_rows
+
+        def write_row(r: int, data: dict) -> None:
+            for col, val in data.items():
+                cell = ws.cell(r, self._position(col))
+                # Una fórmula cuyo resultado la app leyó vacío no se borra con ""
+                if val == "" and cell.data_type == "f":
+                    continue
+                cell.value = _cell_value(val)
+
+        for op in ops:
+            kind = op["op"]
+            if kind == "columns":
+                for name in op["names"]:
+                    col = self._position(name)
+                    if self.has_header:
+                        ws.cell(1, col).value = name
+            elif kind == "update":
+                write_row(op["index"] + first, op["data"])
+            elif kind == "add":
+                write_row(rows + first, op["data"])
+                rows += 1
+            elif kind == "insert":
+                ws.insert_rows(op["index"] + first)
+                write_row(op["index"] + first, op["data"])
+                rows += 1
+            elif kind == "delete":
+                ws.delete_rows(op["index"] + first)
+                rows -= 1
+
+    def _patch_all(self, ws, df: pd.DataFrame) -> None:
+        """
+        El archivo cambió por fuera desde la última lectura o escritura, así
+        que sus filas ya no están en el mismo renglón que las del DataFrame.
+        Las columnas se vuelven a ubicar por encabezado y las filas por su
+        llave (key_column):
+        - la fila de la hoja con la misma llave recibe los valores del
+          DataFrame; las columnas que no se cargaron se quedan con su fila;
+        - una fila que la app conocía y ya no está en el DataFrame (se borró)
+          se quita de la hoja; las que se agregaron por fuera se conservan;
+        - una fila del DataFrame que no está en la hoja se inserta después de
+          la fila que la precede en el DataFrame;
+        - las filas sin llave (renglones vacíos, totales) no se tocan.
+        Sin columna de llave, o con llaves repetidas, no se sabe qué fila es
+        cuál y se lanza RuntimeError para que el Excel se vuelva a cargar.
+        """
+        first = self._first_row
+        keys = self._row_keys(df)
+        if self.has_header:
+            header = _trim(tuple(c.value for c in ws[1]))
+            self._positions = {name: j + 1 for j, name in enumerate(_header_names(header))}
+            self._sheet_width = len(header)
+        if keys is None or self.key_column not in self._positions:
+            raise RuntimeError(
+                f"El Excel cambió fuera de la app y no tiene columna {self.key_column} para "
+                f"ubicar las filas; vuelve a cargarlo: {self.path}"
+            )
+        repeated = _repeated([k for k in keys if k])
+        if repeated:
+            raise RuntimeError(
+                f"El Excel cambió fuera de la app y {self.key_column} se repite ({', '.join(repeated)}); "
+                f"vuelve a cargarlo: {self.path}"
+            )
+
+        key_col = self._positions[self.key_column]
+
+        def sheet_rows() -> dict[str, int]:
+            found = {}
+            for r in range(first, ws.max_row + 1):
+                key = self._to_string(ws.cell(r, key_col).value).strip()
+                if not key:
+                    continue
+                if key in found:
+                    raise RuntimeError(
+                        f"El Excel cambió fuera de la app y {self.key_column} se repite ({key}); "
+                        f"vuelve a cargarlo: {self.path}"
+                    )
+                found[key] = r
+            return found
+
+        sheet = sheet_rows()
+        wanted = set(keys)
+        deleted = [r for key, r in sheet.items() if key in self._base_keys and key not in wanted]
+        for r in sorted(deleted, reverse=True):
+            ws.delete_rows(r)
+        if deleted:
+            sheet = sheet_rows()
+
+        for name in df.columns:
+            ws.cell(1, self._position(name)).value = name
+        cols = [self._position(name) for name in df.columns]
+        previous = first - 1
+        for key, row in zip(keys, df.itertuples(index=False, name=None)):
+            if not key:
+                continue
+            r = sheet.get(key)
+            if r is None:
+                r = previous + 1
+                ws.insert_rows(r)
+                sheet = {k: v + 1 if v >= r else v for k, v in sheet.items()}
+                sheet[key] = r
+            for col, val in zip(cols, row):
+                cell = ws.cell(r, col)
+                if cell.data_type != "f":   # no se pisa la fórmula (su resultado sí se pierde, ver _patch_workbook)
+                    cell.value = _cell_value(val)
+            previous = r
+
+    def _row_keys(self, df: pd.DataFrame) -> list[str] | None:
+        """La llave (key_column como texto) de cada fila de df; None si no se cargó esa columna."""
+        if self.key_column not in df.columns:
+            return None
+        return [self._to_string(v).strip() for v in df[self.key_column]]
+
+    def _replace_file(self, write) -> None:
+        """Escribe con write(ruta_temporal) junto al archivo y lo reemplaza de una vez."""
         folder = self.path.parent
         end_time = time.time() + self.save_timeout
 
@@ -53,11 +671,12 @@ class ExcelTools:
             Path(tmp_path).unlink(missing_ok=True)
 
             try:
-                self.df.to_excel(tmp_path, index=False, engine="openpyxl")
+                write(tmp_path)
                 shutil.move(tmp_path, self.path)
-                return self.path
+                return
 
             except PermissionError as e:
+                Path(tmp_path).unlink(missing_ok=True)
                 if time.time() > end_time:
                     raise PermissionError(
                         f"No se pudo guardar el Excel por bloqueo: {self.path}"
@@ -68,7 +687,139 @@ class ExcelTools:
                 raise RuntimeError("Error inesperado guardando Excel.") from e
 
     def reload(self) -> None:
-        self.load()
+        self.load(self.columns)
+
+    # =========================
+    # Bitácora de cambios
+    # =========================
+    # Cada cambio se anota como una línea JSON en <archivo>.journal.jsonl en
+    # cuanto se hace (con fsync), así que sobrevive a un cierre inesperado
+    # aunque el Excel todavía no se haya escrito. La primera línea guarda
+    # tamaño y mtime del Excel sobre el que se anotaron los cambios; al
+    # escribir el Excel la bitácora se compacta y, si no queda nada, se borra.
+
+    def _journal_append(self, op: dict) -> None:
+        line = json.dumps(op, ensure_ascii=False, default=str)
+        mode = "a" if self._journal_lines else "w"
+        with self.journal_path.open(mode, encoding="utf-8") as f:
+            if mode == "w":
+                f.write(json.dumps({"base": self._base_stamp}) + "\n")
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_lines.append(line)
+
+    def _rewrite_journal(self) -> None:
+        """Deja en disco solo self._journal_lines (o nada) sobre la versión actual."""
+        if not self._journal_lines:
+            self.journal_path.unlink(missing_ok=True)
+            return
+        tmp = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write(json.dumps({"base": self._base_stamp}) + "\n")
+            for line in self._journal_lines:
+                f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.journal_path)
+
+    def _replay_journal(self) -> int:
+        """
+        Aplica al DataFrame recién leído los cambios que quedaron en la
+        bitácora (la app se cerró antes de escribir el Excel). Una última
+        línea incompleta se descarta. Si la bitácora es de otra versión del
+        Excel o no se puede aplicar, se aparta como .bak y no se usa.
+
+        Retorna cuántos cambios se recuperaron.
+        """
+        try:
+            with self.journal_path.open("r", encoding="utf-8") as f:
+                raw = f.read().split("\n")
+        except FileNotFoundError:
+            return 0
+
+        lines, ops = [], []
+        for line in raw[1:]:
+            try:
+                ops.append(json.loads(line))
+            except ValueError:
+                break   # escritura cortada: lo que sigue no es confiable
+            lines.append(line)
+
+        df = self.df
+        try:
+            base = json.loads(raw[0]).get("base")
+            if base != self._base_stamp:
+                raise ValueError("la bitácora corresponde a otra versión del Excel")
+            for op in ops:
+                self._apply(op)
+        except Exception as e:
+            self.df = df
+            self._set_journal_aside(e)
+            return 0
+
+        self._journal_lines = lines
+        self._pending_ops = ops
+        if len(lines) + 1 < len([r for r in raw if r]):
+            self._rewrite_journal()
+        self._dirty = bool(ops)
+        return len(ops)
+
+    def _set_journal_aside(self, reason: Exception) -> None:
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        aside = self.journal_path.with_name(f"{self.journal_path.name}.{stamp}.bak")
+        self.journal_path.replace(aside)
+        logging.warning(f"Bitácora de Excel descartada ({reason}); se apartó en {aside}")
+
+    def _record(self, op: dict) -> None:
+        """Aplica un cambio al DataFrame, lo marca pendiente y lo anota en la bitácora."""
+        self._apply(op)
+        self._dirty = True
+        self._pending_ops.append(op)
+        if self.journal:
+            try:
+                self._journal_append(op)
+            except OSError as e:
+                # Una bitácora con huecos recuperaría cambios sobre filas
+                # equivocadas: se deja de usar y queda la escritura diferida
+                self.journal = False
+                self._journal_lines = []
+                self.journal_path.unlink(missing_ok=True)
+                logging.warning(f"No se pudo anotar en la bitácora de Excel ({e}); se desactiva")
+
+    def _column(self, name):
+        # Sin encabezado las columnas son enteros y en JSON vuelven como texto
+        if not self.has_header and isinstance(name, str) and name not in self.df.columns \
+                and name.isdigit() and int(name) in self.df.columns:
+            return int(name)
+        return name
+
+    def _apply(self, op: dict) -> None:
+        kind = op["op"]
+        if kind == "columns":
+            for name in op["names"]:
+                name = self._column(name)
+                if name not in self.df.columns:
+                    self.df[name] = ""
+        elif kind == "update":
+            if not 0 <= op["index"] < len(self.df):
+                raise IndexError("Índice fuera de rango.")
+            for col, val in op["data"].items():
+                self.df.at[op["index"], self._column(col)] = val
+        elif kind in ("add", "insert"):
+            row = {c: "" for c in self.df.columns}
+            for k, v in op["data"].items():
+                row[self._column(k)] = v
+            index = len(self.df) if kind == "add" else op["index"]
+            if not 0 <= index <= len(self.df):
+                raise IndexError("Índice fuera de rango.")
+            top = self.df.iloc[:index]
+            bottom = self.df.iloc[index:]
+            self.df = pd.concat([top, pd.DataFrame([row]), bottom], ignore_index=True)
+        elif kind == "delete":
+            self.df = self.df.drop(op["index"]).reset_index(drop=True)
+        else:
+            raise ValueError(f"Cambio desconocido en la bitácora: {kind}")
 
     # =========================
     # Columnas
@@ -78,9 +829,13 @@ class ExcelTools:
         if self.df is None:
             raise ValueError("DataFrame no cargado.")
 
-        for name in names:
-            if name not in self.df.columns:
-                self.df[name] = ""
+        missing = [name for name in dict.fromkeys(names) if name not in self.df.columns]
+        if missing:
+            self.wait_loaded()   # los bloques que faltan no traerían la columna nueva
+        with self._lock:
+            missing = [name for name in dict.fromkeys(names) if name not in self.df.columns]
+            if missing:
+                self._record({"op": "columns", "names": missing})
 
     # =========================
     # Filas / CRUD
@@ -89,17 +844,19 @@ class ExcelTools:
     def row_count(self) -> int:
         if self.df is None:
             raise ValueError("DataFrame no cargado.")
+        self.wait_loaded()
         return len(self.df)
 
     def get_row(self, index: int) -> dict:
         if self.df is None:
             raise ValueError("DataFrame no cargado.")
 
-        if not 0 <= index < len(self.df):
+        if not self.has_row(index):
             raise IndexError("Índice fuera de rango.")
 
         self.current_index = index
-        row = self.df.iloc[index].to_dict()
+        with self._lock:
+            row = self.df.iloc[index].to_dict()
 
         return {k: self._to_string(v) for k, v in row.items()}  
 
@@ -107,7 +864,7 @@ class ExcelTools:
         if self.df is None:
             raise ValueError("DataFrame no cargado.")
 
-        if self.current_index + 1 >= len(self.df):
+        if not self.has_row(self.current_index + 1):
             return None
 
         return self.get_row(self.current_index + 1)
@@ -128,20 +885,21 @@ class ExcelTools:
         if data is None:
             data = {}
 
+        self.wait_loaded()
         self.ensure_columns(list(data.keys()))
 
-        row = {c: "" for c in self.df.columns}
-        for k, v in data.items():
-            row[k] = "" if pd.isna(v) else v
-
-        self.df = pd.concat([self.df, pd.DataFrame([row])], ignore_index=True)
-        self.current_index = len(self.df) - 1
-        return self.current_index
+        with self._lock:
+            row = {k: "" if pd.isna(v) else v for k, v in data.items()}
+            self._record({"op": "add", "data": row})
+            self.current_index = len(self.df) - 1
+            return self.current_index
 
     def insert_row(self, index: int, data: dict | None = None) -> int:
         if self.df is None:
             raise ValueError("DataFrame no cargado.")
 
+        self.wait_loaded()
+
         if not 0 <= index <= len(self.df):
             raise IndexError("Índice fuera de rango.")
 
@@ -150,45 +908,45 @@ class ExcelTools:
 
         self.ensure_columns(list(data.keys()))
 
-        row = {c: "" for c in self.df.columns}
-        for k, v in data.items():
-            row[k] = "" if pd.isna(v) else v
-
-        top = self.df.iloc[:index]
-        bottom = self.df.iloc[index:]
-        self.df = pd.concat([top, pd.DataFrame([row]), bottom], ignore_index=True)
-
-        self.current_index = index
-        return index
+        with self._lock:
+            row = {k: "" if pd.isna(v) else v for k, v in data.items()}
+            self._record({"op": "insert", "index": index, "data": row})
+            self.current_index = index
+            return index
 
     def update_row(self, index: int, data: dict) -> None:
         if self.df is None:
             raise ValueError("DataFrame no cargado.")
 
-        if not 0 <= index < len(self.df):
+        if not self.has_row(index):
             raise IndexError("Índice fuera de rango.")
 
         self.ensure_columns(list(data.keys()))
 
-        for col, val in data.items():
-            self.df.at[index, col] = "" if pd.isna(val) else val
+        with self._lock:
+            values = {col: "" if pd.isna(val) else val for col, val in data.items()}
 
-        if "UltimaActualizacion" in self.df.columns:
-            self.df.at[index, "UltimaActualizacion"] = datetime.now().isoformat(
-                sep=" ", timespec="seconds"
-            )
+            # La fecha va en el cambio anotado: al recuperarlo queda la misma
+            if "UltimaActualizacion" in self.df.columns:
+                values["UltimaActualizacion"] = datetime.now().isoformat(
+                    sep=" ", timespec="seconds"
+                )
+            self._record({"op": "update", "index": index, "data": values})
 
     def delete_row(self, index: int) -> None:
         if self.df is None:
             raise ValueError("DataFrame no cargado.")
 
+        self.wait_loaded()
+
         if not 0 <= index < len(self.df):
             raise IndexError("Índice fuera de rango.")
 
-        self.df = self.df.drop(index).reset_index(drop=True)
+        with self._lock:
+            self._record({"op": "delete", "index": index})
 
-        if self.current_index >= len(self.df):
-            self.current_index = len(self.df) - 1 if len(self.df) > 0 else 0
+            if self.current_index >= len(self.df):
+                self.current_index = len(self.df) - 1 if len(self.df) > 0 else 0
 
     # =========================
     # Búsqueda
@@ -201,6 +959,7 @@ class ExcelTools:
         if column not in self.df.columns:
             raise ValueError(f"La columna '{column}' no existe.")
 
+        self.wait_loaded()
         mask = self.df[column] == value
         indices = list(self.df.index[mask])
 
@@ -1,209 +1,1591 @@
 # tools/pdf.py
 from __future__ import annotations
 
+import os
 import re
-import unicodedata
+import copy
+import json
+import hashlib
+import threading
+import time
+import statistics
 from pathlib import Path
-from typing import Iterable
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 
 from PyPDF2 import PdfReader, PdfWriter
 
+from config import PDF_INDEX_DIR, PDF_OPTIMIZED_DIR, PDF_CONFIG
+from tools.text import normalize_text, normalize_texts
+
 
 # ─────────────────────────────────────────────────────────────
 # Merge / validación
 # ─────────────────────────────────────────────────────────────
 
-def merge_pdfs(pdf_paths: Iterable[Path], output_path: Path) -> None:
-    writer = PdfWriter()
-    added_pages = False
+def merge_pdfs(pdf_paths: Iterable[Path], output_path: Path,
+               max_memory_mb: int | None = None) -> None:
+    """
+    Une los PDF en orden. Con PyMuPDF el resultado se escribe por partes:
+    cuando lo acumulado en memoria (aproximado por el tamaño en disco de las
+    entradas) supera max_memory_mb (PDF_CONFIG["merge_memory_mb"] si es
+    None; 0 vuelca después de cada entrada), se vuelca al archivo de salida
+    y se sigue agregando desde ahí. Al final, si hubo volcados, el archivo se
+    reescribe completo para no dejar una cadena de actualizaciones
+    incrementales. Sin PyMuPDF se arma todo en memoria con PyPDF2.
+    """
+    pdf_paths = [Path(p) for p in pdf_paths]
+    for path in pdf_paths:
+        if not path.exists():
+            raise FileNotFoundError(f"No existe el PDF: {path}")
+
+    if fitz is None:
+        _merge_pdfs_pypdf2(pdf_paths, output_path)
+        return
+
+    if max_memory_mb is None:
+        max_memory_mb = PDF_CONFIG["merge_memory_mb"]
+    limit = max_memory_mb * 1024 * 1024
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with _fitz_lock:
+        _merge_pdfs_fitz(pdf_paths, output_path, limit)
+
+
+def _merge_pdfs_fitz(pdf_paths: list[Path], output_path: Path, limit: int) -> None:
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    packed_path = output_path.with_name(output_path.name + ".packed.tmp")
+
+    out = fitz.open()
+    on_disk = False
+    pending = 0
+    added_pages = False
+    try:
+        for path in pdf_paths:
+            try:
+                src = fitz.open(str(path))
+                if not src.is_pdf:
+                    raise ValueError("no es PDF")
+            except Exception as e:
+                raise ValueError(f"PDF inválido o corrupto: {path}") from e
+
+            with src:
+                if src.page_count:
+                    out.insert_pdf(src)
+                    added_pages = True
+            pending += path.stat().st_size
+
+            # Volcar lo acumulado y reabrir: lo ya escrito deja de ocupar memoria
+            if added_pages and pending >= limit:
+                if on_disk:
+                    out.saveIncr()
+                else:
+                    out.save(str(tmp_path))
+                    on_disk = True
+                out.close()
+                out = None   # cerrado: el except no debe volver a cerrarlo
+                out = fitz.open(str(tmp_path))
+                pending = 0
+
+        if not added_pages:
+            raise ValueError("No se agregaron páginas al PDF final.")
+
+        if on_disk:
+            # Lo volcado quedó como una cadena de actualizaciones incrementales
+            # (cada una con sus objetos viejos): se reescribe completo y compacto
+            out.save(str(packed_path), garbage=3, deflate=True)
+            out.close()
+            out = None
+            os.replace(packed_path, output_path)
+            tmp_path.unlink()
+        else:
+            out.save(str(tmp_path), garbage=1, deflate=True)
+            out.close()
+            out = None
+            os.replace(tmp_path, output_path)
+    except Exception:
+        # Cerrar antes de borrar los temporales (en Windows un archivo abierto no se borra)
+        if out is not None:
+            out.close()
+        tmp_path.unlink(missing_ok=True)
+        packed_path.unlink(missing_ok=True)
+        raise
+
+
+def _merge_pdfs_pypdf2(pdf_paths: list[Path], output_path: Path) -> None:
+    writer = PdfWriter()
+    added_pages = False
+
+    for path in pdf_paths:
+        try:
+            reader = PdfReader(str(path))
+        except Exception as e:
+            raise ValueError(f"PDF inválido o corrupto: {path}") from e
+
+        for page in reader.pages:
+            writer.add_page(page)
+            added_pages = True
+
+    if not added_pages:
+        raise ValueError("No se agregaron páginas al PDF final.")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("wb") as f:
+        writer.write(f)
+
+
+# Documentos que se unen en cada carpeta de cliente, en este orden
+# (se compara contra el nombre en minúsculas y sin espacios)
+_BUNDLE_PARTS = ("comprobante", "lineacaptura")
+
+
+def _bundle_sources(folder: Path, output_name: str) -> list[Path]:
+    """Versión más reciente de cada documento de _BUNDLE_PARTS en la carpeta."""
+    pdfs = [
+        p for p in folder.iterdir()
+        if p.is_file() and p.suffix.lower() == ".pdf" and p.name != output_name
+    ]
+    sources = []
+    for part in _BUNDLE_PARTS:
+        matches = [p for p in pdfs if part in p.stem.lower().replace(" ", "")]
+        if matches:
+            sources.append(max(matches, key=lambda p: p.stat().st_mtime_ns))
+    return sources
+
+
+def _build_bundle(sources: list[str], output: str) -> None:
+    """Tarea de build_client_bundles; recibe rutas en texto para cruzar procesos."""
+    merge_pdfs([Path(s) for s in sources], Path(output))
+
+
+def build_client_bundles(
+    base_folder: Path,
+    workers: int | None = None,
+    overwrite: bool = False,
+) -> dict[str, dict]:
+    """
+    Une en cada carpeta de cliente (<base>/<CLIENTE>/) el Comprobante y la
+    línea de captura más recientes en PDF_CONFIG["bundle_name"], repartiendo
+    las carpetas entre procesos. Si el PDF unido es más nuevo que sus partes
+    no se rehace, salvo con overwrite.
+
+    Retorna {cliente: {"success", "skipped", "output", "sources", "error"}}.
+    """
+    base_folder = Path(base_folder)
+    if not base_folder.exists():
+        raise FileNotFoundError(f"No existe el directorio: {base_folder}")
+
+    results: dict[str, dict] = {}
+    jobs: dict[str, tuple[list[str], str]] = {}
+
+    for folder in sorted(p for p in base_folder.iterdir() if p.is_dir()):
+        output = folder / PDF_CONFIG["bundle_name"].format(cliente=folder.name)
+        sources = _bundle_sources(folder, output.name)
+        result = {
+            "success": False, "skipped": False, "output": str(output),
+            "sources": [str(s) for s in sources], "error": "",
+        }
+        results[folder.name] = result
+
+        if not sources:
+            result["error"] = "No hay Comprobante ni línea de captura"
+            continue
+        if not overwrite and output.exists() and all(
+            output.stat().st_mtime_ns >= s.stat().st_mtime_ns for s in sources
+        ):
+            result.update(success=True, skipped=True)
+            continue
+        jobs[folder.name] = (result["sources"], str(output))
+
+    def _run_serial(names: list[str]) -> None:
+        for name in names:
+            try:
+                _build_bundle(*jobs[name])
+                results[name]["success"] = True
+            except Exception as e:
+                results[name]["error"] = str(e)
+
+    workers = min(workers or parallel_workers(), len(jobs))
+    if workers <= 1:
+        _run_serial(list(jobs))
+        return results
+
+    # "spawn" también en Linux: la app tiene hilos de Qt y fork no es seguro con ellos
+    done: set[str] = set()
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = {name: pool.submit(_build_bundle, *job) for name, job in jobs.items()}
+            for name, future in futures.items():
+                try:
+                    future.result()
+                    results[name]["success"] = True
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        raise
+                    results[name]["error"] = str(e)
+                done.add(name)
+    except Exception:
+        # Si no se pudieron usar procesos, lo pendiente se hace aquí mismo
+        _run_serial([name for name in jobs if name not in done])
+
+    return results
+
+
+def split_pages(pdf_path: Path, outputs: dict[Path, int], overwrite: bool = False) -> dict[Path, dict]:
+    """
+    Escribe cada página pedida como un PDF de una sola página: {salida: página}.
+
+    El PDF de origen se abre una sola vez y cada salida se escribe una vez.
+    Una salida más nueva que el origen ya está al día y se omite, salvo con overwrite.
+
+    Retorna {salida: {"success", "skipped", "page_idx", "error"}}.
+    """
+    pdf_path = Path(pdf_path)
+    if not pdf_path.exists():
+        raise FileNotFoundError(f"No existe el PDF: {pdf_path}")
+    if _is_docx(pdf_path):
+        raise ValueError("Solo se pueden separar páginas de un PDF, no de un .docx.")
+
+    source_mtime = pdf_path.stat().st_mtime_ns
+    results: dict[Path, dict] = {}
+    pending: dict[Path, int] = {}
+    for output, page_idx in outputs.items():
+        output = Path(output)
+        results[output] = {"success": False, "skipped": False, "page_idx": page_idx, "error": ""}
+        if not overwrite and output.exists() and output.stat().st_mtime_ns >= source_mtime:
+            results[output].update(success=True, skipped=True)
+        else:
+            pending[output] = page_idx
+    if not pending:
+        return results
+
+    # Un solo lector para todas las salidas
+    with _fitz_lock if fitz is not None else nullcontext():
+        if fitz is not None:
+            src = fitz.open(str(pdf_path))
+            page_count = src.page_count
+
+            def _write(page_idx: int, output: Path) -> None:
+                with fitz.open() as out:
+                    out.insert_pdf(src, from_page=page_idx, to_page=page_idx)
+                    out.save(str(output), garbage=1, deflate=True)
+        else:
+            src = None
+            reader = PdfReader(str(pdf_path))
+            page_count = len(reader.pages)
+
+            def _write(page_idx: int, output: Path) -> None:
+                writer = PdfWriter()
+                writer.add_page(reader.pages[page_idx])
+                with output.open("wb") as f:
+                    writer.write(f)
+
+        try:
+            for output, page_idx in pending.items():
+                if not 0 <= page_idx < page_count:
+                    results[output]["error"] = f"Página fuera de rango: {page_idx + 1}"
+                    continue
+                tmp_path = output.with_name(output.name + ".tmp")
+                try:
+                    output.parent.mkdir(parents=True, exist_ok=True)
+                    _write(page_idx, tmp_path)
+                    os.replace(tmp_path, output)
+                    results[output]["success"] = True
+                except Exception as e:
+                    tmp_path.unlink(missing_ok=True)
+                    results[output]["error"] = str(e)
+        finally:
+            if src is not None:
+                src.close()
+
+    return results
+
+
+def _file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _prune_optimized(keep: Path) -> None:
+    """Borra las copias optimizadas sin uso en los últimos optimized_cache_days."""
+    limit = time.time() - PDF_CONFIG["optimized_cache_days"] * 86400
+    for folder in Path(PDF_OPTIMIZED_DIR).glob("*"):
+        try:
+            if folder != keep and folder.is_dir() and folder.stat().st_mtime < limit:
+                for f in folder.iterdir():
+                    f.unlink()
+                folder.rmdir()
+        except OSError:
+            pass
+
+
+def optimize_pdf(path: Path) -> dict:
+    """
+    Copia más ligera de un PDF para enviarlo: recomprime los flujos, quita los
+    objetos sin uso y une los repetidos (p. ej. las fuentes de un PDF unido).
+
+    La copia queda en PDF_OPTIMIZED_DIR/<sha1 del contenido>/<mismo nombre>:
+    cada contenido se optimiza una sola vez y quien lo recibe ve el nombre
+    original. Si la copia no sale más chica, no es válida o no hay PyMuPDF,
+    se usa el original.
+
+    Retorna {"path", "original_bytes", "optimized_bytes", "cached"}.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"No existe el PDF: {path}")
+    original_bytes = path.stat().st_size
+    result = {"path": path, "original_bytes": original_bytes,
+              "optimized_bytes": original_bytes, "cached": False}
+    if fitz is None or check_pdf(path)["status"] != PDF_OK:
+        return result
+
+    folder = Path(PDF_OPTIMIZED_DIR) / _file_sha1(path)
+    target = folder / path.name
+    if target.exists() and check_pdf(target)["status"] == PDF_OK:
+        result["cached"] = True
+        os.utime(folder)   # en uso: que no se borre por antigüedad
+    else:
+        tmp_path = target.with_name(target.name + ".tmp")
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            with _fitz_lock:
+                with fitz.open(str(path)) as doc:
+                    pages = doc.page_count
+                    try:
+                        doc.save(str(tmp_path), garbage=4, deflate=True, use_objstms=1)
+                    except TypeError:
+                        # PyMuPDF anterior a 1.24 no tiene flujos de objetos
+                        doc.save(str(tmp_path), garbage=4, deflate=True)
+                with fitz.open(str(tmp_path)) as doc:
+                    if doc.page_count != pages:
+                        raise RuntimeError("La copia optimizada no tiene las mismas páginas.")
+            os.replace(tmp_path, target)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            return result
+        _prune_optimized(folder)
+
+    optimized_bytes = target.stat().st_size
+    if optimized_bytes < original_bytes:
+        result.update(path=target, optimized_bytes=optimized_bytes)
+    return result
+
+
+def get_pdf_page_count(path: Path) -> int:
+    if not path.exists():
+        raise FileNotFoundError(f"No existe el archivo: {path}")
+
+    verdict = check_pdf(path)
+    if verdict["status"] != PDF_OK:
+        raise ValueError(f"No se pudo leer el PDF: {path} ({verdict['error']})")
+    if verdict["pages"] is None:
+        try:
+            if fitz is not None:
+                with _fitz_lock, fitz.open(str(path)) as doc:
+                    pages = doc.page_count
+            else:
+                pages = len(PdfReader(str(path)).pages)
+        except Exception as e:
+            raise ValueError(f"No se pudo leer el PDF: {path}") from e
+        # Se recuerda en el veredicto guardado, si sigue siendo de esta versión
+        with _validation_lock:
+            cached = _validation_cache.get(pdf_key(path))
+            if cached is not None and cached["pages"] is None:
+                cached["pages"] = pages
+        return pages
+    return verdict["pages"]
+
+
+def is_valid_pdf(path: Path) -> bool:
+    return check_pdf(path)["status"] == PDF_OK
+
+
+# Veredictos de check_pdf
+PDF_OK = "ok"
+PDF_MISSING = "missing"
+PDF_TRUNCATED = "truncated"   # descarga interrumpida: vacío o sin el final del archivo
+PDF_CORRUPT = "corrupt"       # no es un PDF o su estructura no se puede leer
+
+# El encabezado %PDF- puede venir tras basura inicial y el %%EOF seguido de
+# relleno; los lectores toleran hasta 1 KB en ambos extremos.
+_PDF_SNIFF_BYTES = 1024
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF")
+_XREF_AT_RE = re.compile(rb"\s*(?:xref|\d+\s+\d+\s+obj)")
+
+# (ruta, tamaño, mtime) -> veredicto
+_validation_cache: dict[tuple[str, int, int], dict] = {}
+_validation_lock = threading.Lock()
+
+
+def _sniff_pdf(path: Path, size: int) -> tuple[str, str]:
+    """
+    Revisión estructural sin parsear: encabezado, %%EOF final y que startxref
+    apunte a una tabla xref (o a un flujo xref). Devuelve (estado, detalle);
+    estado "" significa que hace falta el parseo completo para decidir.
+    """
+    if size == 0:
+        return PDF_TRUNCATED, "archivo vacío"
+
+    with path.open("rb") as f:
+        head = f.read(_PDF_SNIFF_BYTES)
+        if b"%PDF-" not in head:
+            return PDF_CORRUPT, "no tiene encabezado %PDF"
+
+        f.seek(max(0, size - _PDF_SNIFF_BYTES))
+        tail = f.read()
+        if b"%%EOF" not in tail:
+            return PDF_TRUNCATED, "falta el final del archivo (%%EOF)"
+
+        matches = _STARTXREF_RE.findall(tail)
+        if not matches:
+            return "", "sin startxref"
+        offset = int(matches[-1])
+        if offset >= size:
+            return "", "startxref fuera del archivo"
+
+        f.seek(offset)
+        if not _XREF_AT_RE.match(f.read(64)):
+            return "", "startxref no apunta a la tabla xref"
+
+    return PDF_OK, ""
+
+
+def check_pdf(path: Path) -> dict:
+    """
+    Valida un PDF sin construir un PdfReader salvo que la revisión estructural
+    no alcance para decidir (xref desplazada, etc.).
+
+    Retorna {"status": PDF_OK | PDF_MISSING | PDF_TRUNCATED | PDF_CORRUPT,
+    "error": detalle, "pages": n o None}. El veredicto se recuerda por versión
+    del archivo (ruta, tamaño, mtime).
+    """
+    path = Path(path)
+    if not path.exists():
+        return {"status": PDF_MISSING, "error": f"No existe el archivo: {path}", "pages": None}
+
+    key = pdf_key(path)
+    with _validation_lock:
+        cached = _validation_cache.get(key)
+    if cached is not None:
+        return dict(cached)   # copia: quien la reciba no debe poder cambiar la caché
+
+    try:
+        status, error = _sniff_pdf(path, key[1])
+    except OSError as e:
+        return {"status": PDF_CORRUPT, "error": str(e), "pages": None}
+
+    pages = None
+    if not status:
+        try:
+            pages = len(PdfReader(str(path)).pages)
+            status, error = PDF_OK, ""
+        except Exception as e:
+            status, error = PDF_CORRUPT, f"{error}: {e}"
+
+    verdict = {"status": status, "error": error, "pages": pages}
+    with _validation_lock:
+        # Solo se conserva la versión vigente de cada ruta
+        for old in [k for k in _validation_cache if k[0] == key[0]]:
+            del _validation_cache[old]
+        _validation_cache[key] = verdict
+    return dict(verdict)
+
+
+def check_pdfs(paths: Iterable[Path], workers: int | None = None) -> dict[Path, dict]:
+    """check_pdf sobre muchos archivos a la vez (la revisión es casi toda lectura de disco)."""
+    paths = [Path(p) for p in paths]
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=workers or min(len(paths), 8)) as pool:
+        return dict(zip(paths, pool.map(check_pdf, paths)))
+
+
+def check_client_folders(base_folder: Path) -> dict[str, dict[str, dict]]:
+    """
+    Valida los PDF descargados en cada carpeta de cliente (<base>/<CLIENTE>/*.pdf).
+    Retorna {cliente: {archivo: veredicto}}.
+    """
+    base_folder = Path(base_folder)
+    if not base_folder.exists():
+        raise FileNotFoundError(f"No existe el directorio: {base_folder}")
+
+    paths = sorted(p for p in base_folder.glob("*/*") if p.suffix.lower() == ".pdf")
+    report: dict[str, dict[str, dict]] = {}
+    for path, verdict in check_pdfs(paths).items():
+        report.setdefault(path.parent.name, {})[path.name] = verdict
+    return report
+
+
+# ─────────────────────────────────────────────────────────────
+# Extracción de texto
+# ─────────────────────────────────────────────────────────────
+
+# Backends opcionales: se detectan una sola vez al importar el módulo en lugar
+# de reintentar el import (y pagar la excepción) en cada extracción.
+try:
+    import fitz  # type: ignore  (PyMuPDF)
+except Exception:
+    fitz = None
+
+# MuPDF no es seguro entre hilos, ni siquiera con documentos distintos: toda
+# llamada a fitz dentro del proceso va con este candado (reentrante, para que
+# una función que ya lo tiene pueda usar open_document). Los procesos de
+# _extract_parallel_fitz y build_client_bundles tienen cada uno el suyo.
+_fitz_lock = threading.RLock()
+
+try:
+    from pypdf import PdfReader as _PypdfReader  # type: ignore
+except Exception:
+    _PypdfReader = None
+
+
+def _detect_backends() -> tuple[str, ...]:
+    """
+    Backends instalados en orden de preferencia: PyMuPDF (mejor calidad) →
+    pypdf → PyPDF2 (dependencia obligatoria, siempre disponible).
+    PDF_CONFIG["backend"] adelanta uno concreto si está instalado.
+    """
+    found = [name for name, mod in (("fitz", fitz), ("pypdf", _PypdfReader)) if mod is not None]
+    found.append("PyPDF2")
+
+    preferred = PDF_CONFIG.get("backend")
+    if preferred in found:
+        found.remove(preferred)
+        found.insert(0, preferred)
+    return tuple(found)
+
+
+PDF_BACKENDS: tuple[str, ...] = _detect_backends()
+PDF_BACKEND: str = PDF_BACKENDS[0]
+
+
+# ─────────────────────────────────────────────────────────────
+# Documentos abiertos (pool compartido entre hilos)
+# ─────────────────────────────────────────────────────────────
+
+# (backend, ruta) -> {"doc", "lock", "stamp": (tamaño, mtime), "used", "retired"};
+# el menos usado sale primero al pasar de PDF_CONFIG["document_pool_size"]
+_documents: OrderedDict[tuple[str, str], dict] = OrderedDict()
+_documents_lock = threading.Lock()
+_documents_timer: threading.Timer | None = None
+
+
+def _open_backend_document(backend: str, abs_path: str):
+    if backend == "fitz":
+        return fitz.open(abs_path)
+    reader = _PypdfReader if backend == "pypdf" else PdfReader
+    return reader(abs_path)
+
+
+def _close_document(doc) -> None:
+    close = getattr(doc, "close", None)   # PdfReader de PyPDF2 no tiene close
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _retire(key: tuple[str, str]) -> dict:
+    """Saca un handle del pool. Llamar con _documents_lock."""
+    handle = _documents.pop(key)
+    handle["retired"] = True
+    return handle
+
+
+def _close_handles(handles: list[dict]) -> None:
+    """
+    Cierra handles ya retirados. Uno que esté en uso lo cierra su hilo al
+    soltarlo (ver open_document), así que aquí no se espera por su handle.
+    _fitz_lock se toma antes que el candado del handle, en el mismo orden que
+    open_document.
+    """
+    if not handles:
+        return
+    with _fitz_lock:
+        for handle in handles:
+            if handle["lock"].acquire(blocking=False):
+                try:
+                    doc, handle["doc"] = handle["doc"], None
+                    _close_document(doc)
+                finally:
+                    handle["lock"].release()
+
+
+def _expired_handles(now: float) -> list[dict]:
+    """Retira los handles sin uso desde hace document_idle_seconds. Llamar con _documents_lock."""
+    idle = PDF_CONFIG["document_idle_seconds"]
+    expired = [k for k, h in _documents.items() if now - h["used"] >= idle and not h["lock"].locked()]
+    return [_retire(k) for k in expired]
+
+
+def _sweep_documents() -> None:
+    global _documents_timer
+    with _documents_lock:
+        _documents_timer = None
+        retired = _expired_handles(time.monotonic())
+        _schedule_sweep()
+    _close_handles(retired)
+
+
+def _schedule_sweep() -> None:
+    """Programa el cierre por inactividad mientras quede algo abierto. Llamar con _documents_lock."""
+    global _documents_timer
+    if _documents and _documents_timer is None:
+        _documents_timer = threading.Timer(PDF_CONFIG["document_idle_seconds"], _sweep_documents)
+        _documents_timer.daemon = True
+        _documents_timer.start()
+
+
+@contextmanager
+def open_document(path: Path | str, backend: str | None = None) -> Iterator:
+    """
+    Documento abierto de `path` (fitz.Document o PdfReader según `backend`,
+    PDF_BACKEND por omisión), reutilizado entre llamadas:
+
+        with open_document(pdf) as doc:
+            doc.load_page(0)
+
+    Dentro del with el documento es exclusivo del hilo (un candado por
+    handle). Con pypdf/PyPDF2 otros archivos se siguen leyendo en paralelo;
+    con PyMuPDF además se toma _fitz_lock, así que MuPDF atiende a un hilo a
+    la vez. El handle se reabre si el archivo cambió (tamaño o mtime), se
+    cierra tras document_idle_seconds sin uso y nunca hay más de
+    document_pool_size abiertos.
+    """
+    backend = backend or PDF_BACKEND
+    if backend not in PDF_BACKENDS:
+        raise RuntimeError(f"Backend de PDF no disponible: {backend}")
+    abs_path = str(Path(path).resolve())
+    st = os.stat(abs_path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    key = (backend, abs_path)
+    now = time.monotonic()
+
+    retired: list[dict] = []
+    with _documents_lock:
+        handle = _documents.get(key)
+        if handle is not None and handle["stamp"] != stamp:
+            retired.append(_retire(key))
+            handle = None
+        if handle is None:
+            handle = {"doc": None, "lock": threading.Lock(), "stamp": stamp, "used": now, "retired": False}
+            _documents[key] = handle
+        handle["used"] = now
+        _documents.move_to_end(key)
+        while len(_documents) > max(1, PDF_CONFIG["document_pool_size"]):
+            retired.append(_retire(next(iter(_documents))))
+        retired.extend(_expired_handles(now))
+        _schedule_sweep()
+    _close_handles(retired)
+
+    with _fitz_lock if backend == "fitz" else nullcontext(), handle["lock"]:
+        if handle["doc"] is None:
+            handle["doc"] = _open_backend_document(backend, abs_path)
+        try:
+            yield handle["doc"]
+        finally:
+            handle["used"] = time.monotonic()
+            with _documents_lock:
+                retired_meanwhile = handle["retired"]
+            if retired_meanwhile:
+                doc, handle["doc"] = handle["doc"], None
+                _close_document(doc)
+
+
+def close_documents() -> None:
+    """Cierra todos los documentos del pool (p. ej. antes de reemplazar los archivos)."""
+    with _documents_lock:
+        retired = [_retire(k) for k in list(_documents)]
+    _close_handles(retired)
+
+
+def _extract_range_fitz(abs_path: str, start: int, stop: int) -> list[str]:
+    """Texto de las páginas [start, stop). Cada proceso abre su propio documento."""
+    with _fitz_lock:
+        doc = fitz.open(abs_path)
+        pages = []
+        try:
+            for i in range(start, stop):
+                try:
+                    pages.append(doc.load_page(i).get_text("text") or "")
+                except Exception:
+                    pages.append("")
+        finally:
+            doc.close()
+    return pages
+
+
+def parallel_workers() -> int:
+    """Procesos para extraer en paralelo: PDF_CONFIG["parallel_workers"] o los núcleos (máx. 8)."""
+    workers = PDF_CONFIG["parallel_workers"] or min(os.cpu_count() or 1, 8)
+    return max(1, int(workers))
+
+
+def _extract_parallel_fitz(abs_path: str, page_count: int, workers: int) -> list[str]:
+    """Reparte las páginas en bloques contiguos y las devuelve en orden."""
+    chunk = -(-page_count // workers)
+    ranges = [(s, min(s + chunk, page_count)) for s in range(0, page_count, chunk)]
+
+    # "spawn" también en Linux: la app tiene hilos de Qt y fork no es seguro con ellos
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=ctx) as pool:
+        futures = [pool.submit(_extract_range_fitz, abs_path, s, e) for s, e in ranges]
+        pages: list[str] = []
+        for f in futures:
+            pages.extend(f.result())
+    return pages
+
+
+def _pages_fitz(abs_path: str, parallel: bool | None) -> list[str]:
+    with _fitz_lock, fitz.open(abs_path) as doc:
+        page_count = len(doc)
+
+    workers = parallel_workers()
+    if parallel is None:
+        parallel = page_count >= PDF_CONFIG["parallel_min_pages"]
+    if parallel and workers > 1 and page_count > 1:
+        try:
+            return _extract_parallel_fitz(abs_path, page_count, workers)
+        except Exception:
+            pass
+
+    return _extract_range_fitz(abs_path, 0, page_count)
+
+
+def _pages_pypdf(abs_path: str, parallel: bool | None) -> list[str]:
+    return [p.extract_text() or "" for p in _PypdfReader(abs_path).pages]
+
+
+def _pages_pypdf2(abs_path: str, parallel: bool | None) -> list[str]:
+    return [p.extract_text() or "" for p in PdfReader(abs_path).pages]
+
+
+def _page_fitz(abs_path: str, page_idx: int) -> str:
+    with open_document(abs_path, "fitz") as doc:
+        return doc.load_page(page_idx).get_text("text") or ""
+
+
+def _page_pypdf(abs_path: str, page_idx: int) -> str:
+    with open_document(abs_path, "pypdf") as reader:
+        return reader.pages[page_idx].extract_text() or ""
+
+
+def _page_pypdf2(abs_path: str, page_idx: int) -> str:
+    with open_document(abs_path, "PyPDF2") as reader:
+        return reader.pages[page_idx].extract_text() or ""
+
+
+_PAGES_EXTRACTORS = {"fitz": _pages_fitz, "pypdf": _pages_pypdf, "PyPDF2": _pages_pypdf2}
+_PAGE_EXTRACTORS = {"fitz": _page_fitz, "pypdf": _page_pypdf, "PyPDF2": _page_pypdf2}
+
+
+def _run_backends(extractors: dict, backend: str | None, *args):
+    """
+    Prueba los backends detectados en orden hasta que uno funcione.
+    Con `backend` se usa solo ese (sin respaldo), p. ej. para medirlo.
+    """
+    if backend is not None and backend not in PDF_BACKENDS:
+        raise RuntimeError(f"Backend de PDF no disponible: {backend}")
+    names = (backend,) if backend else PDF_BACKENDS
+
+    last_error: Exception | None = None
+    for name in names:
+        try:
+            return extractors[name](*args)
+        except Exception as e:
+            last_error = e
+    raise RuntimeError(
+        f"No se pudo extraer texto del PDF ({'/'.join(names)} fallaron): {last_error}"
+    )
+
+
+def _get_pages_text(path: Path, parallel: bool | None = None,
+                    backend: str | None = None) -> list[str]:
+    """
+    Extrae el texto de cada página con el primer backend de PDF_BACKENDS que
+    funcione (o solo con `backend` si se indica).
+
+    parallel: None decide según PDF_CONFIG["parallel_min_pages"]; True/False lo fuerza.
+    Solo aplica a PyMuPDF. Si la extracción en paralelo falla se repite en serie.
+
+    Un .docx no pasa por ningún backend de PDF: cada "página" es un mensaje
+    (ver _get_docx_pages).
+    """
+    if _is_docx(path):
+        return _get_docx_pages(path)
+
+    return _run_backends(_PAGES_EXTRACTORS, backend, str(path.resolve()), parallel)
+
+
+# Franja superior de la página (fracción de la altura) donde se busca la
+# primera línea; si queda vacía se usa la página completa.
+_FIRST_LINE_BAND = 0.2
+
+
+def _get_first_lines_text(path: Path, page_indices: list[int] | None = None) -> list[str]:
+    """
+    Primera línea de cada página (o de las indicadas, en ese orden), extrayendo
+    solo la franja superior. Sin PyMuPDF no hay recorte posible y se usa el
+    texto completo.
+    """
+    if _is_docx(path):
+        lines = [pg.split("\n", 1)[0].strip() for pg in _get_docx_pages(path)]
+        return lines if page_indices is None else [lines[i] for i in page_indices]
+
+    if PDF_BACKEND == "fitz":
+        try:
+            lines = []
+            with open_document(path, "fitz") as doc:
+                for i in (range(len(doc)) if page_indices is None else page_indices):
+                    try:
+                        page = doc.load_page(i)
+                        r = page.rect
+                        band = fitz.Rect(r.x0, r.y0, r.x1, r.y0 + r.height * _FIRST_LINE_BAND)
+                        text = page.get_text("text", clip=band) or ""
+                        if not text.strip():
+                            text = page.get_text("text") or ""
+                    except Exception:
+                        text = ""
+                    lines.append(text.split("\n", 1)[0].strip())
+            return lines
+        except Exception:
+            pass
+
+    if page_indices is not None:
+        return [_get_single_page_text(path, i).split("\n", 1)[0].strip() for i in page_indices]
+    return [pg.split("\n", 1)[0].strip() for pg in _get_pages_text(path)]
+
+
+def _get_single_page_text(path: Path, page_idx: int) -> str:
+    """Texto de una sola página, con la misma prioridad de backends que _get_pages_text."""
+    if _is_docx(path):
+        return _get_docx_pages(path)[page_idx]
+
+    return _run_backends(_PAGE_EXTRACTORS, None, str(path.resolve()), page_idx)
+
+
+def extract_pages_text(path: Path, parallel: bool = False) -> list[str]:
+    """
+    Texto de cada página sin pasar por el índice (archivos que se leen una
+    sola vez). parallel=True reparte las páginas entre procesos (PyMuPDF).
+    """
+    return _get_pages_text(path, parallel=parallel)
+
+
+def _page_hashes(path: Path) -> list[str] | None:
+    """
+    Huella de cada página según lo que determina su texto: el flujo de
+    contenido, las fuentes (nombre y tabla ToUnicode), los formularios
+    incrustados y el tamaño/rotación. No extrae texto, así que cuesta una
+    fracción de la extracción.
+
+    Solo con PyMuPDF; sin él (o con un .docx) devuelve None.
+    """
+    if fitz is None or _is_docx(path):
+        return None
+    try:
+        with open_document(path, "fitz") as doc:
+            fonts: dict[int, bytes] = {}   # xref -> huella; las fuentes se comparten entre páginas
+
+            def _font(xref: int, basefont: str) -> bytes:
+                if xref not in fonts:
+                    h = hashlib.sha1(basefont.encode("utf-8"))
+                    kind, value = doc.xref_get_key(xref, "ToUnicode")
+                    if kind == "xref":
+                        h.update(doc.xref_stream(int(value.split()[0])) or b"")
+                    fonts[xref] = h.digest()
+                return fonts[xref]
+
+            hashes = []
+            for page in doc:
+                h = hashlib.sha1(page.read_contents())
+                h.update(f"{tuple(page.rect)}|{page.rotation}".encode())
+                for font in page.get_fonts():
+                    h.update(font[4].encode("utf-8") + _font(font[0], font[3]))
+                for xobject in page.get_xobjects():
+                    h.update(doc.xref_stream(xobject[0]) or b"")
+                hashes.append(h.hexdigest())
+            return hashes
+    except Exception:
+        return None
+
+
+def benchmark_backends(path: Path, repeat: int = 3) -> dict[str, dict]:
+    """
+    Mide la extracción completa (en serie) con cada backend instalado.
+
+    Devuelve {backend: {"seconds": mediana | None, "pages": n, "chars": n, "error": str}}
+    en el orden de PDF_BACKENDS, para elegir PDF_CONFIG["backend"] en cada equipo.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"No existe el PDF: {path}")
+
+    results: dict[str, dict] = {}
+    for name in PDF_BACKENDS:
+        samples = []
+        pages: list[str] = []
+        error = ""
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            try:
+                pages = _get_pages_text(path, parallel=False, backend=name)
+            except Exception as e:
+                error = str(e)
+                break
+            samples.append(time.perf_counter() - start)
+
+        results[name] = {
+            "seconds": statistics.median(samples) if samples and not error else None,
+            "pages": len(pages),
+            "chars": sum(len(p) for p in pages),
+            "error": error,
+        }
+    return results
+
+
+# ─────────────────────────────────────────────────────────────
+# Mensajes desde .docx
+# ─────────────────────────────────────────────────────────────
+
+def _is_docx(path: Path) -> bool:
+    return path.suffix.lower() == ".docx"
+
+
+def _get_docx_pages(path: Path) -> list[str]:
+    """
+    Separa un .docx de mensajes en un texto por cliente.
+
+    El Word de combinación de correspondencia termina cada registro con un
+    salto de sección; también se corta en saltos de página explícitos y en
+    párrafos con "salto de página anterior". Cada párrafo es una línea, así
+    que el texto ya viene con los párrafos reales (sin cortes de renglón).
+    """
+    try:
+        import docx  # type: ignore  (python-docx)
+        from docx.oxml.ns import qn  # type: ignore
+    except Exception as e:
+        raise RuntimeError(f"No se pudo leer el .docx (falta python-docx): {e}")
+
+    try:
+        document = docx.Document(str(path.resolve()))
+    except Exception as e:
+        raise RuntimeError(f"No se pudo leer el .docx: {path}") from e
+
+    pages: list[str] = []
+    lines: list[str] = []
+    current: list[str] = []   # texto del párrafo en curso
+
+    def _close_page():
+        nonlocal lines
+        if any(line.strip() for line in lines):
+            pages.append("\n".join(lines).strip("\n"))
+        lines = []
+
+    for p in document.paragraphs:
+        p_pr = p._p.pPr
+        if p.paragraph_format.page_break_before and lines:
+            _close_page()
+
+        for el in p._p.iter():
+            if el.tag == qn("w:t"):
+                current.append(el.text or "")
+            elif el.tag == qn("w:tab"):
+                current.append("\t")
+            elif el.tag == qn("w:br"):
+                if el.get(qn("w:type")) == "page":
+                    lines.append("".join(current))
+                    current = []
+                    _close_page()
+                else:
+                    current.append("\n")
+
+        lines.append("".join(current))
+        current = []
+
+        if p_pr is not None and p_pr.find(qn("w:sectPr")) is not None:
+            _close_page()
+
+    _close_page()
+    return pages
+
+
+def _clean_docx_message(text: str) -> str:
+    """Los párrafos de un .docx ya son reales: solo se limpian líneas vacías de más."""
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+# ─────────────────────────────────────────────────────────────
+# Normalización de texto
+# ─────────────────────────────────────────────────────────────
+
+# Sin acentos y en minúsculas; el kernel está en tools/text (compartido con
+# los nombres de carpeta) y aquí conserva su nombre de siempre
+_normalize = normalize_text
+
+
+# ─────────────────────────────────────────────────────────────
+# Índice de texto por página (memoria + disco)
+# ─────────────────────────────────────────────────────────────
+
+# Subir cuando cambie el formato de lo que se guarda en disco (o el resultado
+# de las búsquedas guardadas en *.messages.json)
+_INDEX_VERSION = 3
+
+# (ruta, tamaño, mtime) -> {"pages": [...], "norm": [...]}
+_pages_index: dict[tuple[str, int, int], dict] = {}
+_index_lock = threading.RLock()
+# (llave, dato) -> candado del hilo que lo está extrayendo (ver _index_field)
+_index_builds: dict[tuple, threading.Lock] = {}
+
+
+def pdf_key(path: Path) -> tuple[str, int, int]:
+    """Identifica una versión concreta del archivo: ruta absoluta, tamaño y mtime."""
+    st = path.stat()
+    return (str(path.resolve()), st.st_size, st.st_mtime_ns)
+
+
+def _index_file(abs_path: str, suffix: str = ".json") -> Path:
+    """Un archivo de índice por ruta; la versión se valida con la llave guardada dentro."""
+    digest = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()
+    return Path(PDF_INDEX_DIR) / f"{digest}{suffix}"
+
+
+def _read_json(target: Path) -> dict | None:
+    try:
+        with open(target, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    return data if isinstance(data, dict) and data.get("version") == _INDEX_VERSION else None
+
+
+def _read_index_json(target: Path, key: tuple[str, int, int]) -> dict | None:
+    data = _read_json(target)
+    if data is None or tuple(data.get("key", ())) != key:
+        return None
+    return data
+
+
+def _write_index_json(target: Path, key: tuple[str, int, int], payload: dict) -> None:
+    tmp = target.with_suffix(".tmp")
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": _INDEX_VERSION, "key": list(key), **payload},
+                f, ensure_ascii=False,
+            )
+        os.replace(tmp, target)
+    except Exception:
+        # El índice en disco es solo una optimización
+        tmp.unlink(missing_ok=True)
+
+
+# Lo que se guarda en disco; el resto del registro (mapas, índices) se reconstruye.
+# "previous" es lo reutilizable de la versión anterior mientras no se haya
+# indexado la actual por completo (ver _previous_version).
+_PERSISTED_KEYS = ("pages", "norm", "first_lines", "page_hashes", "previous")
+
+# Lo que se hereda de una versión a la siguiente, por huella de página
+_REUSABLE_KEYS = ("page_hashes", "pages", "norm", "first_lines")
+
+
+def _load_index_file(key: tuple[str, int, int]) -> dict | None:
+    data = _read_index_json(_index_file(key[0]), key)
+    if data is None:
+        return None
+    return {k: data[k] for k in _PERSISTED_KEYS if k in data}
+
+
+def _save_index_file(key: tuple[str, int, int], entry: dict) -> None:
+    _write_index_json(
+        _index_file(key[0]), key,
+        {k: entry[k] for k in _PERSISTED_KEYS if k in entry},
+    )
+
+
+def _reusable(entry: dict) -> dict | None:
+    """Lo que sirve de un registro para indexar la versión siguiente, o None."""
+    if "page_hashes" in entry and ("norm" in entry or "first_lines" in entry):
+        return {k: entry[k] for k in _REUSABLE_KEYS if k in entry}
+    # Una versión que nunca se indexó del todo pasa lo que heredó
+    return entry.get("previous")
+
+
+def _previous_version(key: tuple[str, int, int]) -> dict | None:
+    """
+    Índice de otra versión de la misma ruta (en memoria o en disco), para
+    que al regenerar el PDF solo se extraigan las páginas que cambiaron.
+    """
+    for old_key, old in _pages_index.items():
+        if old_key[0] == key[0] and old_key != key:
+            return _reusable(old)
+
+    data = _read_json(_index_file(key[0]))
+    if data is None or tuple(data.get("key", ())) == key or (data.get("key") or [None])[0] != key[0]:
+        return None
+    return _reusable(data)
+
+
+def _unchanged_pages(hashes: list[str] | None, previous: dict | None) -> dict[int, int]:
+    """{página actual: página de la versión anterior} con la misma huella."""
+    if not hashes or not previous or not previous.get("page_hashes"):
+        return {}
+    by_hash: dict[str, int] = {}
+    for i, h in enumerate(previous["page_hashes"]):
+        by_hash.setdefault(h, i)
+    return {i: by_hash[h] for i, h in enumerate(hashes) if h in by_hash}
+
+
+def _get_entry(path: Path) -> tuple[tuple[str, int, int], dict]:
+    """
+    Registro del índice para la versión actual del archivo (puede estar incompleto).
+    Llamar con _index_lock tomado.
+    """
+    key = pdf_key(path)
+    entry = _pages_index.get(key)
+    if entry is None:
+        entry = _load_index_file(key)
+        if entry is None:
+            entry = {}
+            previous = _previous_version(key)
+            if previous:
+                entry["previous"] = previous
+        # Solo se conserva la versión vigente de cada ruta
+        for old in [k for k in _pages_index if k[0] == key[0]]:
+            del _pages_index[old]
+        _pages_index[key] = entry
+    return key, entry
+
+
+def _index_field(path: Path, name: str, build, drop: tuple[str, ...] = ()) -> dict:
+    """
+    Registro de la versión actual del archivo con entry[name] ya calculado.
+
+    build(entry) recibe una copia del registro y regresa lo que se agrega a
+    él. Corre sin _index_lock, así que las consultas que ya tienen lo suyo
+    en el índice (get_page_text, miniaturas, mapa de IDs) no esperan a una
+    extracción larga. Cada versión la extrae un solo hilo; los demás que
+    piden el mismo dato esperan su resultado en lugar de repetirla. Si el
+    archivo cambió mientras se extraía, el resultado se descarta y se vuelve
+    a empezar con la versión nueva.
+    """
+    while True:
+        with _index_lock:
+            key, entry = _get_entry(path)
+            if name in entry:
+                return entry
+            build_lock = _index_builds.setdefault((key, name), threading.Lock())
+
+        with build_lock:
+            with _index_lock:
+                current, entry = _get_entry(path)
+                if name in entry:
+                    return entry    # lo extrajo otro hilo mientras se esperaba
+                seed = dict(entry)
+            try:
+                update = build(seed) if current == key else None
+            finally:
+                with _index_lock:
+                    if _index_builds.get((key, name)) is build_lock:
+                        del _index_builds[(key, name)]
+            if update is None:
+                continue
+
+            with _index_lock:
+                current, entry = _get_entry(path)
+                if current != key:
+                    continue
+                if name not in entry:
+                    entry.update(update)
+                    for k in drop:
+                        entry.pop(k, None)
+                    _save_index_file(key, entry)
+                return entry
 
-    for path in pdf_paths:
-        if not path.exists():
-            raise FileNotFoundError(f"No existe el PDF: {path}")
+
+def get_pages_index(path: Path) -> dict:
+    """
+    Devuelve el texto de cada página del PDF y su versión normalizada:
+    {"pages": [...], "norm": [...]}.
+
+    Cada versión del archivo (ruta, tamaño, mtime) se extrae una sola vez;
+    después se sirve desde memoria o desde el índice guardado en PDF_INDEX_DIR.
+    Si la ruta ya estaba indexada en otra versión, las páginas con la misma
+    huella (_page_hashes) se copian de ella y solo se extraen las demás.
+    La extracción no bloquea el índice (ver _index_field).
+    """
+    def build(entry: dict) -> dict:
+        hashes = entry.get("page_hashes") or _page_hashes(path)
+        previous = entry.get("previous") or {}
+        reuse = _unchanged_pages(hashes, previous) if "pages" in previous else {}
+        if reuse:
+            changed = [i for i in range(len(hashes)) if i not in reuse]
+            fresh = dict(_iter_backend_pages(path, changed))
+            fresh_norm = dict(zip(changed, normalize_texts(fresh[i] for i in changed)))
+            pages = [previous["pages"][reuse[i]] if i in reuse else fresh[i]
+                     for i in range(len(hashes))]
+            norm = [previous["norm"][reuse[i]] if i in reuse else fresh_norm[i]
+                    for i in range(len(hashes))]
+        else:
+            pages = _get_pages_text(path)
+            norm = normalize_texts(pages)
+        update = {"pages": pages, "norm": norm}
+        if hashes is not None:
+            update["page_hashes"] = hashes
+        return update
+
+    return _index_field(path, "pages", build, drop=("page_cache", "previous"))
+
+
+def get_first_lines(path: Path) -> list[str]:
+    """
+    Primera línea (normalizada) de cada página.
+
+    Si el texto completo ya está indexado se toma de ahí; si no, se extrae
+    solo la franja superior de cada página, sin pasar por get_pages_index
+    (y, como allí, sin repetir las páginas que no cambiaron desde la versión
+    anterior).
+    """
+    def build(entry: dict) -> dict:
+        if "norm" in entry:
+            return {"first_lines": [pg.split("\n", 1)[0].strip() for pg in entry["norm"]]}
+        hashes = entry.get("page_hashes") or _page_hashes(path)
+        previous = entry.get("previous") or {}
+        old_lines = previous.get("first_lines") or [
+            pg.split("\n", 1)[0].strip() for pg in previous.get("norm", [])
+        ]
+        reuse = _unchanged_pages(hashes, previous) if old_lines else {}
+        if reuse:
+            changed = [i for i in range(len(hashes)) if i not in reuse]
+            fresh = dict(zip(changed, normalize_texts(_get_first_lines_text(path, changed))))
+            lines = [old_lines[reuse[i]] if i in reuse else fresh[i]
+                     for i in range(len(hashes))]
+        else:
+            lines = normalize_texts(_get_first_lines_text(path))
+        update = {"first_lines": lines}
+        if hashes is not None:
+            update["page_hashes"] = hashes
+        return update
+
+    return _index_field(path, "first_lines", build)["first_lines"]
+
+
+def get_page_text(path: Path, page_idx: int) -> str:
+    """
+    Texto de una sola página. Usa el índice completo si existe; si no,
+    extrae solo esa página y la recuerda mientras el archivo no cambie.
+    """
+    with _index_lock:
+        _, entry = _get_entry(path)
+        if "pages" in entry:
+            return entry["pages"][page_idx]
+        text = entry.get("page_cache", {}).get(page_idx)
+    if text is None:
+        text = _get_single_page_text(path, page_idx)
+        _remember_page(path, page_idx, text)
+    return text
+
+
+def _iter_backend_pages(path: Path, page_indices: list[int] | None) -> Iterator[tuple[int, str]]:
+    """
+    Texto de las páginas pedidas con el documento de PDF_BACKEND del pool
+    (open_document), sin reabrir el archivo. El documento se toma página por
+    página: mientras el generador está en pausa no bloquea a otros hilos.
+    Una página que ese backend no puede leer se pide a los demás (_get_single_page_text).
+    """
+    abs_path = str(path.resolve())
+    if PDF_BACKEND == "fitz":
+        count_of = len
+        read = lambda doc, i: doc.load_page(i).get_text("text") or ""  # noqa: E731
+    else:
+        count_of = lambda reader: len(reader.pages)  # noqa: E731
+        read = lambda reader, i: reader.pages[i].extract_text() or ""  # noqa: E731
+
+    if page_indices is None:
         try:
-            reader = PdfReader(str(path))
-        except Exception as e:
-            raise ValueError(f"PDF inválido o corrupto: {path}") from e
+            with open_document(abs_path) as doc:
+                page_indices = range(count_of(doc))
+        except Exception:
+            yield from enumerate(_get_pages_text(path))
+            return
 
-        for page in reader.pages:
-            writer.add_page(page)
-            added_pages = True
+    for i in page_indices:
+        try:
+            with open_document(abs_path) as doc:
+                text = read(doc, i)
+        except Exception:
+            text = None
+        yield i, text if text is not None else _get_single_page_text(path, i)
 
-    if not added_pages:
-        raise ValueError("No se agregaron páginas al PDF final.")
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("wb") as f:
-        writer.write(f)
+def iter_pages_text(path: Path, page_indices: Iterable[int] | None = None) -> Iterator[tuple[int, str]]:
+    """
+    Entrega (página, texto) de una en una, en el orden pedido (todas si no se indica).
 
+    Sirve lo que ya esté en el índice; el resto se extrae abriendo el archivo
+    una sola vez y se recuerda igual que en get_page_text.
+    """
+    indices = None if page_indices is None else list(page_indices)
 
-def get_pdf_page_count(path: Path) -> int:
-    if not path.exists():
-        raise FileNotFoundError(f"No existe el archivo: {path}")
-    try:
-        return len(PdfReader(str(path)).pages)
-    except Exception as e:
-        raise ValueError(f"No se pudo leer el PDF: {path}") from e
+    with _index_lock:
+        _, entry = _get_entry(path)
+        if "pages" in entry:
+            pages = entry["pages"]
+            cached = dict(enumerate(pages))
+        else:
+            cached = dict(entry.get("page_cache", {}))
 
+    if indices is None and "pages" in entry:
+        indices = list(range(len(pages)))
+
+    missing = None if indices is None else list(dict.fromkeys(i for i in indices if i not in cached))
+    if _is_docx(path):
+        docx_pages = _get_docx_pages(path)
+        stream = enumerate(docx_pages) if missing is None else ((i, docx_pages[i]) for i in missing)
+    else:
+        stream = _iter_backend_pages(path, missing)
+
+    if indices is None:
+        for i, text in stream:
+            _remember_page(path, i, text)
+            yield i, text
+        return
+
+    # Lo que faltaba llega en el orden pedido; lo que ya estaba se intercala sin extraerlo
+    for i in indices:
+        if i not in cached:
+            j, text = next(stream)
+            _remember_page(path, j, text)
+            cached[j] = text
+        yield i, cached[i]
+
+
+def _remember_page(path: Path, page_idx: int, text: str) -> None:
+    with _index_lock:
+        _, entry = _get_entry(path)
+        if "pages" not in entry:
+            entry.setdefault("page_cache", {})[page_idx] = text
+
+
+def _get_message_memo(path: Path) -> tuple[tuple[str, int, int], dict]:
+    """
+    Resultados de extract_message ya calculados para esta versión del PDF,
+    guardados junto al índice (*.messages.json). Llamar con _index_lock tomado.
+    """
+    key, entry = _get_entry(path)
+    if "messages" not in entry:
+        data = _read_index_json(_index_file(key[0], ".messages.json"), key)
+        entry["messages"] = data["messages"] if data else {}
+    return key, entry["messages"]
+
+
+def _save_message_memo(key: tuple[str, int, int], memo: dict) -> None:
+    _write_index_json(_index_file(key[0], ".messages.json"), key, {"messages": memo})
 
-def is_valid_pdf(path: Path) -> bool:
-    if not path.exists():
-        return False
-    try:
-        PdfReader(str(path))
-        return True
-    except Exception:
-        return False
+
+def clear_pages_index() -> None:
+    """Vacía el índice en memoria (el de disco se invalida solo por versión)."""
+    with _index_lock:
+        _pages_index.clear()
 
 
 # ─────────────────────────────────────────────────────────────
-# Extracción de texto
+# Miniaturas de página (vista previa del mensaje)
 # ─────────────────────────────────────────────────────────────
 
-def _get_pages_text(path: Path) -> list[str]:
+# (ruta, tamaño, mtime, página, zoom) -> PNG; el menos usado sale primero
+# cuando se pasa de PDF_CONFIG["thumbnail_cache_mb"]
+_thumbnails: OrderedDict[tuple, bytes] = OrderedDict()
+_thumbnails_bytes = 0
+_thumbnails_lock = threading.Lock()
+
+
+def _thumbnail_key(path: Path, page_idx: int, zoom: float) -> tuple:
+    return (*pdf_key(path), page_idx, round(zoom, 3))
+
+
+def _remember_thumbnail(key: tuple, png: bytes) -> None:
+    global _thumbnails_bytes
+    limit = PDF_CONFIG["thumbnail_cache_mb"] * 1024 * 1024
+    with _thumbnails_lock:
+        if key in _thumbnails:
+            return
+        _thumbnails[key] = png
+        _thumbnails_bytes += len(png)
+        while _thumbnails_bytes > limit and len(_thumbnails) > 1:
+            _, old = _thumbnails.popitem(last=False)
+            _thumbnails_bytes -= len(old)
+
+
+def get_cached_page_image(path: Path, page_idx: int, zoom: float | None = None) -> bytes | None:
+    """PNG ya renderizado de la página, o None si no está en caché (no renderiza)."""
+    key = _thumbnail_key(path, page_idx, zoom or PDF_CONFIG["thumbnail_zoom"])
+    with _thumbnails_lock:
+        png = _thumbnails.get(key)
+        if png is not None:
+            _thumbnails.move_to_end(key)
+        return png
+
+
+def render_page_images(path: Path, page_indices: Iterable[int],
+                       zoom: float | None = None) -> dict[int, bytes]:
     """
-    Extrae el texto de cada página.
-    Intenta PyMuPDF (mejor calidad) → pypdf → PyPDF2.
+    PNG de cada página pedida a escala `zoom`, abriendo el PDF una sola vez
+    para las que no estén en caché. Las páginas fuera de rango se omiten.
     """
-    abs_path = str(path.resolve())
+    if fitz is None:
+        raise RuntimeError("Se necesita PyMuPDF para mostrar la vista previa de la página.")
+    if _is_docx(path):
+        raise ValueError("La vista previa solo está disponible para PDF.")
 
-    try:
-        import fitz  # type: ignore  (PyMuPDF)
-        doc = fitz.open(abs_path)
-        pages = []
-        for i in range(len(doc)):
-            try:
-                pages.append(doc.load_page(i).get_text("text") or "")
-            except Exception:
-                pages.append("")
-        doc.close()
-        return pages
-    except Exception:
-        pass
+    zoom = zoom or PDF_CONFIG["thumbnail_zoom"]
+    images: dict[int, bytes] = {}
+    missing = []
+    for i in dict.fromkeys(page_indices):
+        png = get_cached_page_image(path, i, zoom)
+        if png is None:
+            missing.append(i)
+        else:
+            images[i] = png
+    if not missing:
+        return images
 
-    try:
-        from pypdf import PdfReader as _Reader  # type: ignore
-        return [p.extract_text() or "" for p in _Reader(abs_path).pages]
-    except Exception:
-        pass
+    with open_document(path, "fitz") as doc:
+        for i in missing:
+            if not 0 <= i < doc.page_count:
+                continue
+            png = doc.load_page(i).get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes("png")
+            _remember_thumbnail(_thumbnail_key(path, i, zoom), png)
+            images[i] = png
+    return images
 
-    try:
-        return [p.extract_text() or "" for p in PdfReader(abs_path).pages]
-    except Exception as e:
-        raise RuntimeError(
-            f"No se pudo extraer texto del PDF (fitz/pypdf/PyPDF2 fallaron): {e}"
-        )
+
+def render_page_image(path: Path, page_idx: int, zoom: float | None = None) -> bytes:
+    """PNG de una página (ver render_page_images)."""
+    images = render_page_images(path, [page_idx], zoom)
+    if page_idx not in images:
+        raise IndexError(f"Página fuera de rango: {page_idx + 1}")
+    return images[page_idx]
 
 
 # ─────────────────────────────────────────────────────────────
-# Normalización de texto
+# Normalización de párrafos
 # ─────────────────────────────────────────────────────────────
 
-def _normalize(s: str) -> str:
-    """Normaliza texto: sin acentos, minúsculas"""
-    s = unicodedata.normalize("NFD", s)
-    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn").lower()
+# Una sola expresión precompilada por clase de regla (se aplican a la línea ya sin espacios):
+# línea que debe ir sola (datos bancarios, números con punto final como "65509866769.")
+_STANDALONE_RE = re.compile(r"(?:BANCO|NÚMERO|CUENTA|NOMBRE|TARJETA|CLABE):|\d+\.$")
+# puntuación fuerte al final: cierra el párrafo
+_HARD_END_RE = re.compile(r"[.!?]$")
+# signos especiales al inicio: abren un párrafo nuevo
+_NEW_PARAGRAPH_RE = re.compile(r"[¡¿⚠]")
 
-def normalize_paragraph_breaks(text: str) -> str:
+
+def iter_normalized_lines(lines: Iterable[str]) -> Iterator[str]:
     """
-    Normaliza los saltos de línea en el texto extraído de PDF:
-    
+    Versión en flujo de normalize_paragraph_breaks: consume líneas de texto
+    extraído de PDF y va entregando las líneas ya normalizadas.
+
     - Une líneas que son parte del mismo párrafo (saltos shift+enter)
-    - Mantiene separación entre párrafos verdaderos (líneas vacías)
+    - Mantiene separación entre párrafos verdaderos (una sola línea vacía)
     - Preserva listas y formato estructurado (BANCO:, NÚMERO:, etc.)
     """
-    if not text or not text.strip():
-        return ""
-    
-    lines = text.split('\n')
-    
-    # Patrones que indican que una línea debe estar SOLA (no unir con anterior/siguiente)
-    standalone_patterns = [
-        r'^(BANCO|NÚMERO|CUENTA|NOMBRE|TARJETA|CLABE):',  # Campos estructurados
-        r'^\d+\.$',  # Números con punto al final (ej: "65509866769.")
-    ]
-    
-    # Patrones que terminan un párrafo definitivamente
-    hard_end_patterns = [
-        r'[.!?]$',  # Puntuación fuerte
-    ]
-    
-    # Patrones que inician un nuevo párrafo
-    new_paragraph_patterns = [
-        r'^[¡¿⚠]',  # Signos especiales de inicio
-    ]
-    
-    def is_standalone_line(line: str) -> bool:
-        """Línea que debe estar sola (datos bancarios, etc.)"""
-        for pattern in standalone_patterns:
-            if re.match(pattern, line):
-                return True
-        return False
-    
-    def ends_paragraph(line: str) -> bool:
-        """Línea que termina un párrafo"""
-        for pattern in hard_end_patterns:
-            if re.search(pattern, line):
-                return True
-        return False
-    
-    def starts_new_paragraph(line: str) -> bool:
-        """Línea que inicia un nuevo párrafo"""
-        for pattern in new_paragraph_patterns:
-            if re.match(pattern, line):
-                return True
-        return False
-    
-    # Procesar líneas
-    result_lines = []
-    current_paragraph = []
-    
+    standalone = _STANDALONE_RE.match
+    hard_end = _HARD_END_RE.search
+    new_paragraph = _NEW_PARAGRAPH_RE.match
+
+    paragraph: list[str] = []
+    emitted = False         # ya salió alguna línea con contenido
+    blank_pending = False   # separación pendiente hasta ver la siguiente línea con contenido
+
+    def _emit(line: str) -> Iterator[str]:
+        nonlocal emitted, blank_pending
+        if blank_pending:
+            yield ""
+            blank_pending = False
+        emitted = True
+        yield line
+
     for line in lines:
         stripped = line.strip()
-        
-        # Línea vacía -> cerrar párrafo actual y agregar separación
+
+        # Línea vacía -> cerrar párrafo actual y dejar separación
         if not stripped:
-            if current_paragraph:
-                result_lines.append(' '.join(current_paragraph))
-                current_paragraph = []
-            # Agregar línea vacía solo si no es la primera o si ya hay contenido
-            if result_lines:
-                result_lines.append('')
+            if paragraph:
+                yield from _emit(" ".join(paragraph))
+                paragraph = []
+            blank_pending = emitted
             continue
-        
+
         # Línea standalone (BANCO:, NÚMERO:, etc.) -> cerrar párrafo y agregar sola
-        if is_standalone_line(stripped):
-            if current_paragraph:
-                result_lines.append(' '.join(current_paragraph))
-                current_paragraph = []
-            result_lines.append(stripped)
+        if standalone(stripped):
+            if paragraph:
+                yield from _emit(" ".join(paragraph))
+                paragraph = []
+            yield from _emit(stripped)
             continue
-        
+
         # Línea que inicia nuevo párrafo (¡, ⚠, etc.) -> cerrar anterior
-        if starts_new_paragraph(stripped):
-            if current_paragraph:
-                result_lines.append(' '.join(current_paragraph))
-                current_paragraph = []
-            current_paragraph.append(stripped)
+        if new_paragraph(stripped):
+            if paragraph:
+                yield from _emit(" ".join(paragraph))
+            paragraph = [stripped]
             continue
-        
-        # Agregar al párrafo actual
-        current_paragraph.append(stripped)
-        
+
+        paragraph.append(stripped)
+
         # Si termina con puntuación fuerte -> cerrar párrafo
-        if ends_paragraph(stripped):
-            result_lines.append(' '.join(current_paragraph))
-            current_paragraph = []
-    
-    # Agregar último párrafo si quedó algo
-    if current_paragraph:
-        result_lines.append(' '.join(current_paragraph))
-    
-    # Unir y limpiar líneas vacías múltiples
-    result = '\n'.join(result_lines)
-    result = re.sub(r'\n{3,}', '\n\n', result)  # Max 2 saltos consecutivos
+        if hard_end(stripped):
+            yield from _emit(" ".join(paragraph))
+            paragraph = []
+
+    if paragraph:
+        yield from _emit(" ".join(paragraph))
+
+
+def normalize_paragraph_breaks(text: str) -> str:
+    """
+    Normaliza los saltos de línea en el texto extraído de PDF:
     
-    return result.strip()
+    - Une líneas que son parte del mismo párrafo (saltos shift+enter)
+    - Mantiene separación entre párrafos verdaderos (líneas vacías)
+    - Preserva listas y formato estructurado (BANCO:, NÚMERO:, etc.)
+    """
+    if not text or not text.strip():
+        return ""
+
+    return "\n".join(iter_normalized_lines(text.split("\n")))
+
+
+def iter_normalized_messages(
+    pages: Iterable[str],
+    remove_first_line_flag: bool = False,
+    docx: bool = False,
+) -> Iterator[str]:
+    """
+    Entrega el mensaje procesado de cada página conforme llegan las páginas,
+    para encadenarlo con una extracción que también va página por página
+    (ver iter_pages_text) sin esperar a tener todo el archivo.
+
+    docx: las páginas vienen de un .docx, cuyos párrafos ya son reales.
+    """
+    clean = _clean_docx_message if docx else normalize_paragraph_breaks
+    for text in pages:
+        if remove_first_line_flag:
+            text = remove_first_line(text)
+        yield clean(text)
 
 def remove_first_line(text: str) -> str:
     """
@@ -223,10 +1605,67 @@ def remove_first_line(text: str) -> str:
 # Búsqueda de mensaje por nombre de cliente
 # ─────────────────────────────────────────────────────────────
 
+_WORD_RE = re.compile(r"\w+")
+
+# El nombre del cliente aparece en el saludo, al inicio de la página
+_NAME_HEAD_CHARS = 300
+
+# Confianza máxima de una coincidencia que no es exacta
+_TOKEN_MATCH_MAX_SCORE = 0.9
+_FUZZY_CUTOFF = 0.6
+_FUZZY_CANDIDATES = 10
+
+
+def _trigrams(s: str) -> set[str]:
+    s = f" {' '.join(s.split())} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def build_name_index(pages_norm: list[str]) -> dict:
+    """
+    Índices para buscar clientes por nombre sobre las páginas normalizadas:
+    {"tokens": {palabra: [page_idx, ...]}, "trigrams": {trigrama: [page_idx, ...]},
+     "head_trigrams": [set, ...]}.
+    Los trigramas se toman solo del inicio de cada página (_NAME_HEAD_CHARS).
+    """
+    tokens: dict[str, list[int]] = {}
+    trigrams: dict[str, list[int]] = {}
+    head_trigrams: list[set[str]] = []
+
+    for i, pg in enumerate(pages_norm):
+        for word in set(_WORD_RE.findall(pg)):
+            tokens.setdefault(word, []).append(i)
+        grams = _trigrams(pg[:_NAME_HEAD_CHARS])
+        head_trigrams.append(grams)
+        for g in grams:
+            trigrams.setdefault(g, []).append(i)
+
+    return {"tokens": tokens, "trigrams": trigrams, "head_trigrams": head_trigrams}
+
+
+def get_name_index(path: Path) -> dict:
+    """Índice de nombres del PDF (ver build_name_index); uno por versión del archivo."""
+    index = get_pages_index(path)
+    with _index_lock:
+        if "name_index" not in index:
+            index["name_index"] = build_name_index(index["norm"])
+        return index["name_index"]
+
+
 def find_message_for_client(path: Path, client_name: str) -> dict:
+    """
+    Busca la página del cliente por nombre: exacta → por apellido(s) → difusa.
+
+    Además de la mejor página, "matches" trae los candidatos ordenados
+    [{"page_idx", "score"}] y "score" la confianza (0 a 1) del elegido.
+    Si la mejor confianza no llega a PDF_CONFIG["name_min_score"] la página
+    no se acepta: "found" queda en False, con el motivo en "errors", y
+    "score"/"matches" se conservan para mostrar el candidato descartado.
+    """
     result: dict = {
         "found": False, "page_idx": None,
         "text": "", "snippet": "", "errors": [],
+        "score": 0.0, "matches": [],
     }
 
     if not client_name or not client_name.strip():
@@ -237,52 +1676,88 @@ def find_message_for_client(path: Path, client_name: str) -> dict:
         return result
 
     try:
-        pages = _get_pages_text(path)
+        index = get_pages_index(path)
+        name_index = get_name_index(path)
     except Exception as e:
         result["errors"].append(str(e))
         return result
 
-    client_norm = _normalize(client_name)
+    pages = index["pages"]
+    pages_norm = index["norm"]
+    postings = name_index["tokens"]
+    head_trigrams = name_index["head_trigrams"]
+
+    client_norm = " ".join(_normalize(client_name).split())
+    client_grams = _trigrams(client_norm)
+
+    def _coverage(i: int) -> float:
+        """Fracción de los trigramas del nombre presentes al inicio de la página."""
+        if not client_grams:
+            return 0.0
+        return len(client_grams & head_trigrams[i]) / len(client_grams)
 
-    def _set_found(i: int) -> dict:
+    def _set_found(ranked: list[tuple[int, float]]) -> dict:
+        i, score = ranked[0]
+        matches = [{"page_idx": p, "score": round(sc, 3)} for p, sc in ranked[:5]]
+        min_score = PDF_CONFIG["name_min_score"]
+        if score < min_score:
+            result.update({"score": round(score, 3), "matches": matches})
+            result["errors"].append(
+                f"Coincidencia insuficiente por nombre: '{client_name}' se parece a la "
+                f"página {i + 1} con confianza {score:.2f} (mínimo {min_score:.2f})"
+            )
+            return result
         txt = pages[i].strip()
         result.update({
             "found": True,
             "page_idx": i,
             "text": txt,
             "snippet": (txt[:160] + "...") if len(txt) > 160 else txt,
+            "score": round(score, 3),
+            "matches": matches,
         })
         return result
 
-    # 1. Exacta
-    for i, pg in enumerate(pages):
-        if client_norm in _normalize(pg):
-            return _set_found(i)
+    def _rank(scored: dict[int, float]) -> list[tuple[int, float]]:
+        # Mayor confianza primero; a igualdad, la primera página
+        return sorted(scored.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    # 1. Exacta: solo páginas que contienen todas las palabras del nombre
+    words = _WORD_RE.findall(client_norm)
+    if words and all(w in postings for w in words):
+        candidates = set(postings[words[0]]).intersection(*(postings[w] for w in words[1:]))
+        exact = sorted(i for i in candidates if client_norm in pages_norm[i])
+        if exact:
+            return _set_found([(i, 1.0) for i in exact])
 
-    # 2. Por apellido(s)
+    # 2. Por apellido(s): páginas con alguno de los dos últimos apellidos,
+    #    ordenadas por qué tanto del nombre completo aparece en el saludo
     parts = [p for p in client_name.split() if p.strip()]
-    tokens: list[str] = []
+    surnames: list[str] = []
     if len(parts) >= 2:
-        tokens = [_normalize(parts[-1]), _normalize(parts[-2])]
+        surnames = [_normalize(parts[-1]), _normalize(parts[-2])]
     elif parts:
-        tokens = [_normalize(parts[0])]
+        surnames = [_normalize(parts[0])]
 
-    for token in tokens:
-        for i, pg in enumerate(pages):
-            if token in _normalize(pg):
-                return _set_found(i)
+    # "O'REILLY" -> "reilly": el índice guarda palabras sueltas
+    surname_words = {w for s in surnames for w in _WORD_RE.findall(s) if len(w) >= 3}
+    by_surname = {i for w in surname_words for i in postings.get(w, ())}
+    if by_surname:
+        return _set_found(_rank({
+            i: min(_coverage(i), _TOKEN_MATCH_MAX_SCORE) for i in by_surname
+        }))
 
-    # 3. Difusa
-    try:
-        import difflib
-        snippets_norm = [_normalize(pg[:300]) for pg in pages]
-        candidates = [client_norm] + [_normalize(p) for p in parts if len(p) >= 3]
-        for cand in candidates:
-            matches = difflib.get_close_matches(cand, snippets_norm, n=1, cutoff=0.6)
-            if matches:
-                return _set_found(snippets_norm.index(matches[0]))
-    except Exception:
-        pass
+    # 3. Difusa: los trigramas preseleccionan unos pocos candidatos
+    votes: dict[int, int] = {}
+    for g in client_grams:
+        for i in name_index["trigrams"].get(g, ()):
+            votes[i] = votes.get(i, 0) + 1
+    shortlist = sorted(votes, key=lambda i: -votes[i])[:_FUZZY_CANDIDATES]
+
+    scored = {i: _coverage(i) for i in shortlist}
+    scored = {i: min(sc, _TOKEN_MATCH_MAX_SCORE) for i, sc in scored.items() if sc >= _FUZZY_CUTOFF}
+    if scored:
+        return _set_found(_rank(scored))
 
     return result
 
@@ -291,6 +1766,108 @@ def find_message_for_client(path: Path, client_name: str) -> dict:
 # Búsqueda de mensaje por ID de cliente
 # ─────────────────────────────────────────────────────────────
 
+# Un ID es una "palabra" de la primera línea que contiene al menos un dígito
+# (p. ej. "382TI" en "Hola . 382TI .hola"). Un número seguido de un sufijo
+# de letras ("557 TI") también se registra junto: "557ti". Y al revés: el
+# número de "382TI" se registra solo ("382") si no lleva a otra página, como
+# en el Excel, donde a veces el ID viene sin sufijo.
+_ID_TOKEN_RE = re.compile(r"[\w-]+")
+_ID_SUFFIX_RE = re.compile(r"(\d+)[a-z]+")
+
+
+def _is_id_token(token: str) -> bool:
+    return any(ch.isdigit() for ch in token)
+
+
+def canonical_id(value: str) -> str:
+    """Forma comparable de un ID: normalizado y sin espacios ("557 TI" -> "557ti")."""
+    return re.sub(r"\s+", "", _normalize(str(value)))
+
+
+def _line_ids(line: str) -> set[str]:
+    tokens = _ID_TOKEN_RE.findall(line)
+    found = {t for t in tokens if _is_id_token(t)}
+    for cur, nxt in zip(tokens, tokens[1:]):
+        if cur.isdigit() and nxt.isalpha():
+            found.add(cur + nxt)
+    return found
+
+
+def page_ids(first_lines: list[str]) -> list[set[str]]:
+    """
+    IDs de cada página a partir de su primera línea (normalizada), con las
+    mismas reglas que el mapa de IDs: las "palabras" con dígitos, "557 ti"
+    también como "557ti" y el número solo de un "<número><letras>" ("382"
+    por "382ti") si no es ID de otra página ni lleva a varias.
+    """
+    ids = [_line_ids(line) for line in first_lines]
+
+    # Número sin sufijo -> páginas de todos los IDs "<número><letras>"
+    tokens = set().union(*ids)
+    bare: dict[str, set[int]] = {}
+    for i, page in enumerate(ids):
+        for token in page:
+            m = _ID_SUFFIX_RE.fullmatch(token)
+            if m:
+                bare.setdefault(m.group(1), set()).add(i)
+    for number, pages in bare.items():
+        if number not in tokens and len(pages) == 1:
+            ids[next(iter(pages))].add(number)
+    return ids
+
+
+def build_id_map(first_lines: list[str]) -> dict:
+    """
+    Construye el mapa ID -> página a partir de la primera línea (normalizada)
+    de cada página (los IDs de cada una salen de page_ids).
+
+    Retorna:
+        {
+            "ids":         {id: page_idx},         # primera página donde aparece
+            "duplicates":  {id: [page_idx, ...]},  # IDs presentes en varias páginas
+            "overlaps":    {id: [id, ...]},        # IDs contenidos en otros IDs ("1" en "10")
+            "first_lines": [str, ...],
+        }
+    """
+    pages_by_id: dict[str, list[int]] = {}
+    for i, ids in enumerate(page_ids(first_lines)):
+        for token in ids:
+            pages_by_id.setdefault(token, []).append(i)
+
+    ids = {k: v[0] for k, v in pages_by_id.items()}
+    duplicates = {k: v for k, v in pages_by_id.items() if len(v) > 1}
+
+    # Subcadenas de cada ID que también son IDs: O(n·L²) en vez de comparar todos contra todos
+    overlaps: dict[str, list[str]] = {}
+    for longer in ids:
+        n = len(longer)
+        subs = {longer[a:b] for a in range(n) for b in range(a + 1, n + 1)} - {longer}
+        for sub in subs & ids.keys():
+            # "557" y "557ti" salen de la misma línea: no es un conflicto
+            if set(pages_by_id[sub]) != set(pages_by_id[longer]):
+                overlaps.setdefault(sub, []).append(longer)
+
+    return {
+        "ids": ids,
+        "duplicates": duplicates,
+        "overlaps": {k: sorted(v) for k, v in overlaps.items()},
+        "first_lines": list(first_lines),
+    }
+
+
+def get_id_map(path: Path) -> dict:
+    """
+    Mapa de IDs del PDF (ver build_id_map); se construye una vez por versión
+    del archivo y solo necesita la primera línea de cada página.
+    """
+    first_lines = get_first_lines(path)
+    with _index_lock:
+        _, entry = _get_entry(path)
+        if "id_map" not in entry:
+            entry["id_map"] = build_id_map(first_lines)
+        return entry["id_map"]
+
+
 def find_message_by_id(path: Path, client_id: str) -> dict:
     result: dict = {
         "found": False,
@@ -298,10 +1875,9 @@ def find_message_by_id(path: Path, client_id: str) -> dict:
         "text": "",
         "snippet": "",
         "errors": [],
+        "warnings": [],
     }
 
-    print("id: "+client_id)
-
     if not client_id or not str(client_id).strip():
         result["errors"].append("ID de cliente vacío")
         return result
@@ -311,34 +1887,55 @@ def find_message_by_id(path: Path, client_id: str) -> dict:
         return result
 
     try:
-        pages = _get_pages_text(path)
+        id_map = get_id_map(path)
     except Exception as e:
         result["errors"].append(str(e))
         return result
 
-    # Normalizar el ID para comparación
-    id_search = str(client_id).strip().lower()
+    id_search = canonical_id(client_id)
+    page_idx = id_map["ids"].get(id_search)
 
-    # Buscar en cada página
-    for i, page_text in enumerate(pages):
-        if not page_text.strip():
-            continue
-        
-        # Obtener la primera línea
-        first_line = page_text.split('\n', 1)[0].strip().lower()
-        
-        # Verificar si el ID está en la primera línea
-        if id_search in first_line:
-            print("data: "+id_search+"<->"+first_line)
-            result.update({
-                "found": True,
-                "page_idx": i,
-                "text": page_text.strip(),
-                "snippet": (page_text[:160] + "...") if len(page_text) > 160 else page_text.strip(),
-            })
+    # IDs sin dígitos o con símbolos no están en el mapa: se buscan como
+    # subcadena de la primera línea, pero solo si la coincidencia es única.
+    if page_idx is None and not (
+        _ID_TOKEN_RE.fullmatch(id_search) and _is_id_token(id_search)
+    ):
+        id_text = _normalize(str(client_id).strip())
+        hits = [
+            i for i, line in enumerate(id_map["first_lines"])
+            if line and id_text in line
+        ]
+        if len(hits) > 1:
+            result["errors"].append(
+                f"ID ambiguo: {client_id} aparece en las páginas "
+                f"{', '.join(str(i + 1) for i in hits)}"
+            )
             return result
+        if hits:
+            page_idx = hits[0]
+
+    if page_idx is None:
+        result["errors"].append(f"No se encontró mensaje con ID: {client_id}")
+        return result
+
+    if id_search in id_map["duplicates"]:
+        result["warnings"].append(
+            f"ID duplicado: {client_id} aparece en las páginas "
+            f"{', '.join(str(i + 1) for i in id_map['duplicates'][id_search])}"
+        )
+
+    try:
+        page_text = get_page_text(path, page_idx)
+    except Exception as e:
+        result["errors"].append(str(e))
+        return result
 
-    result["errors"].append(f"No se encontró mensaje con ID: {client_id}")
+    result.update({
+        "found": True,
+        "page_idx": page_idx,
+        "text": page_text.strip(),
+        "snippet": (page_text[:160] + "...") if len(page_text) > 160 else page_text.strip(),
+    })
     return result
 
 
@@ -346,48 +1943,158 @@ def find_message_by_id(path: Path, client_id: str) -> dict:
 # Función principal de extracción
 # ─────────────────────────────────────────────────────────────
 
-def extract_message(
-    pdf_path: Path,
-    identifier: str,
-    search_by: str = "name",
-    remove_first_line_flag: bool = False,
-    normalize_breaks: bool = True
-) -> dict:
-    result = {
+def _empty_message_result() -> dict:
+    return {
         "success": False,
         "message": "",
         "raw_message": "",
         "page_idx": None,
-        "errors": []
+        "errors": [],
+        "warnings": [],
+        "score": 0.0,
     }
-    
-    # Buscar mensaje según el método
+
+
+def _find_message(pdf_path: Path, identifier: str, search_by: str) -> dict:
     if search_by == "id":
-        search_result = find_message_by_id(pdf_path, identifier)
-    else:  # "name"
-        search_result = find_message_for_client(pdf_path, identifier)
-    
+        return find_message_by_id(pdf_path, identifier)
+    return find_message_for_client(pdf_path, identifier)  # "name"
+
+
+def _iter_processed_messages(
+    pdf_path: Path,
+    texts: Iterable[str],
+    remove_first_line_flag: bool,
+    normalize_breaks: bool,
+) -> Iterator[str]:
+    """Aplica a cada texto el mismo procesamiento que extract_message, en flujo."""
+    if normalize_breaks:
+        # Un .docx ya trae los párrafos reales
+        yield from iter_normalized_messages(texts, remove_first_line_flag, docx=_is_docx(pdf_path))
+        return
+    for text in texts:
+        yield remove_first_line(text) if remove_first_line_flag else text
+
+
+def _message_result(search_result: dict, message: str) -> dict:
+    result = _empty_message_result()
+    result["warnings"] = search_result.get("warnings", [])
+
     if not search_result["found"]:
         result["errors"] = search_result["errors"]
+        result["score"] = search_result.get("score", 0.0)   # candidato descartado, si hubo
         return result
-    
-    # Mensaje encontrado
-    raw_message = search_result["text"]
-    result["raw_message"] = raw_message
+
+    result["raw_message"] = search_result["text"]
     result["page_idx"] = search_result["page_idx"]
-    
-    # Procesar mensaje
-    processed = raw_message
-    
-    # 1. Eliminar primera línea si se solicita
-    if remove_first_line_flag:
-        processed = remove_first_line(processed)
-    
-    # 2. Normalizar párrafos
-    if normalize_breaks:
-        processed = normalize_paragraph_breaks(processed)
-    
-    result["message"] = processed
+    result["score"] = search_result.get("score", 1.0)
+    result["message"] = message
     result["success"] = True
-    
-    return result
\ No newline at end of file
+    return result
+
+
+def extract_message(
+    pdf_path: Path,
+    identifier: str,
+    search_by: str = "name",
+    remove_first_line_flag: bool = False,
+    normalize_breaks: bool = True
+) -> dict:
+    search_result = _find_message(pdf_path, identifier, search_by)
+
+    message = ""
+    if search_result["found"]:
+        # 1. Eliminar primera línea si se solicita; 2. normalizar párrafos
+        message = next(_iter_processed_messages(
+            pdf_path, [search_result["text"]], remove_first_line_flag, normalize_breaks
+        ))
+
+    return _message_result(search_result, message)
+
+
+def extract_messages_bulk(
+    pdf_path: Path,
+    identifiers: Iterable[str],
+    search_by: str = "name",
+    remove_first_line_flag: bool = False,
+    normalize_breaks: bool = True
+) -> dict[str, dict]:
+    """
+    Resuelve los mensajes de muchos clientes con una sola extracción del PDF.
+
+    Retorna {identificador: resultado}, donde cada resultado tiene la misma
+    forma que el de extract_message. Los resultados se recuerdan por versión
+    del PDF, así que volver a pedir un cliente ya resuelto no cuesta nada.
+    """
+    identifiers = [i for i in identifiers if i is not None]
+    results: dict[str, dict] = {}
+    if not identifiers:
+        # Sin clientes no se abre el PDF (por nombre construiría el índice completo)
+        return results
+
+    def _fail(names: Iterable[str], error: Exception) -> None:
+        for identifier in names:
+            results[identifier] = _empty_message_result()
+            results[identifier]["errors"].append(str(error))
+
+    # Lo ya resuelto para esta versión del PDF sale del archivo lateral
+    # (*.messages.json) sin leer el PDF ni construir ningún índice
+    try:
+        if not pdf_path.exists():
+            raise FileNotFoundError(f"PDF no existe: {pdf_path}")
+        with _index_lock:
+            key, memo = _get_message_memo(pdf_path)
+    except Exception as e:
+        _fail(identifiers, e)
+        return results
+
+    # El mínimo de confianza entra en la llave: si se cambia, se vuelve a buscar
+    options = (f"{search_by}|{int(remove_first_line_flag)}|{int(normalize_breaks)}"
+               f"|{PDF_CONFIG['name_min_score']}")
+    pending = [i for i in dict.fromkeys(identifiers) if f"{options}|{i}" not in memo]
+
+    # Solo para los que faltan: por ID basta con las primeras líneas; por
+    # nombre hace falta el texto completo. Si el PDF no se puede leer, se
+    # reporta una vez en lugar de reintentarlo por cliente.
+    if pending:
+        try:
+            if search_by == "id":
+                id_map = get_id_map(pdf_path)
+            else:
+                get_pages_index(pdf_path)
+        except Exception as e:
+            _fail(pending, e)
+            pending = []
+
+    if pending:
+        def _process(pages: Iterable[int]) -> dict[int, str]:
+            pages = list(dict.fromkeys(pages))
+            texts = (text.strip() for _, text in iter_pages_text(pdf_path, pages))
+            return dict(zip(pages, _iter_processed_messages(
+                pdf_path, texts, remove_first_line_flag, normalize_breaks
+            )))
+
+        # Por ID se sabe de antemano qué páginas hacen falta: se extraen y se
+        # procesan en un solo recorrido del archivo, página por página.
+        messages: dict[int, str] = {}
+        if search_by == "id":
+            ids = id_map["ids"]
+            messages = _process(ids[c] for c in map(canonical_id, pending) if c in ids)
+
+        searches = {i: _find_message(pdf_path, i, search_by) for i in pending}
+        messages.update(_process(
+            s["page_idx"] for s in searches.values()
+            if s["found"] and s["page_idx"] not in messages
+        ))
+
+        with _index_lock:
+            for identifier, search in searches.items():
+                message = messages.get(search["page_idx"], "")
+                memo[f"{options}|{identifier}"] = _message_result(search, message)
+            _save_message_memo(key, memo)
+
+    for identifier in identifiers:
+        if identifier not in results:
+            results[identifier] = copy.deepcopy(memo[f"{options}|{identifier}"])
+
+    return results
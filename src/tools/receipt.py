@@ -0,0 +1,261 @@
+# tools/receipt.py
+"""
+Lectura de los recibos que descarga el flujo TI (Comprobante y lineaCaptura).
+
+Saca de cada PDF la línea de captura, el importe, la fecha límite y el
+periodo. Lo ya leído se recuerda por contenido (sha1 del archivo) en
+RECEIPTS_CACHE_FILE, así que solo se procesan los archivos nuevos.
+"""
+from __future__ import annotations
+
+import re
+import json
+import hashlib
+import threading
+import multiprocessing
+from pathlib import Path
+from typing import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import PDF_CONFIG, RECEIPTS_CACHE_FILE
+from tools.pdf import extract_pages_text, parallel_workers
+
+
+# Subir cuando cambien las reglas: invalida lo guardado en caché
+_PARSER_VERSION = 2
+
+# Tipos de recibo (se reconocen por el contenido, no por el nombre del archivo)
+RECEIPT_LINEA = "linea"               # Formato para pago de cuotas (lineaCaptura)
+RECEIPT_COMPROBANTE = "comprobante"   # Solicitud de incorporación (Comprobante)
+
+# Nombres de los archivos descargados (en minúsculas y sin espacios); los PDF
+# que arma la app en la misma carpeta (unión y mensaje) no son recibos
+_RECEIPT_NAME_PARTS = ("comprobante", "lineacaptura")
+_OUTPUT_NAME_SUFFIXES = tuple(
+    PDF_CONFIG[key].format(cliente="").lower() for key in ("bundle_name", "message_page_name")
+)
+
+_KIND_MARKERS = (
+    (RECEIPT_LINEA, "FORMATO PARA PAGO DE CUOTAS"),
+    (RECEIPT_COMPROBANTE, "Solicitud de incorporación"),
+)
+
+# La línea de captura SIPARE tiene 53 caracteres; en el PDF viene con guiones
+# o partida en dos renglones.
+_LINEA_LEN = 53
+_CODE_LINE_RE = re.compile(r"[A-Z0-9]+(?:-[A-Z0-9]+)*")
+_AMOUNT_RE = re.compile(r"\$\s*([\d,]+\.\d{2})")
+_NUM_DATE_RE = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+_LONG_DATE_RE = re.compile(r"\b(\d{1,2}) de ([A-Za-zé]+) de (\d{4})\b")
+_PERIOD_LINE_RE = re.compile(r"(\d{2})-(\d{4})")
+
+_MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10,
+    "noviembre": 11, "diciembre": 12,
+}
+
+_cache_lock = threading.Lock()
+
+
+def _empty_receipt() -> dict:
+    return {
+        "tipo": "",
+        "linea_captura": "",
+        "importe": "",
+        "fecha_limite": "",
+        "periodo": "",
+    }
+
+
+def _find_linea(lines: list[str]) -> tuple[str, int]:
+    """(línea de captura sin guiones, renglón donde termina) o ("", -1)."""
+    i = 0
+    while i < len(lines):
+        code = ""
+        j = i
+        while j < len(lines) and _CODE_LINE_RE.fullmatch(lines[j]) and len(code) < _LINEA_LEN:
+            code += lines[j].replace("-", "")
+            j += 1
+        if len(code) == _LINEA_LEN and re.search(r"\d", code) and re.search(r"[A-Z]", code):
+            return code, j - 1
+        i = max(j, i + 1)
+    return "", -1
+
+
+def _long_date(match: re.Match) -> tuple[int, int, int] | None:
+    month = _MONTHS.get(match.group(2).lower())
+    if not month:
+        return None
+    return int(match.group(1)), month, int(match.group(3))
+
+
+def parse_receipt_text(text: str) -> dict:
+    """
+    Campos del recibo a partir de su texto. Las fechas salen como dd/mm/aaaa,
+    el periodo como mm-aaaa y el importe como "1969.34". Un campo que no se
+    encuentra queda vacío.
+
+    El periodo es el periodo de pago IMSS y solo viene en la lineaCaptura; en
+    el Comprobante queda vacío (su fecha de inicio de aseguramiento es otra
+    cosa y no debe mezclarse en la misma columna).
+    """
+    result = _empty_receipt()
+    for kind, marker in _KIND_MARKERS:
+        if marker in text:
+            result["tipo"] = kind
+            break
+    if not result["tipo"]:
+        return result
+
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    linea, linea_at = _find_linea(lines)
+    result["linea_captura"] = linea
+
+    # Importe y fecha límite se imprimen después de la línea de captura
+    after = "\n".join(lines[linea_at + 1:]) if linea else text
+    amounts = [float(a.replace(",", "")) for a in _AMOUNT_RE.findall(after)]
+    if amounts:
+        result["importe"] = f"{max(amounts):.2f}"
+
+    if result["tipo"] == RECEIPT_LINEA:
+        # Primera fecha del formato: FECHA LIMITE DE PAGO; primer mm-aaaa: periodo IMSS
+        date = _NUM_DATE_RE.search(text)
+        if date:
+            result["fecha_limite"] = "/".join(date.groups())
+        for line in lines:
+            period = _PERIOD_LINE_RE.fullmatch(line)
+            if period:
+                result["periodo"] = f"{period.group(1)}-{period.group(2)}"
+                break
+    else:
+        for m in _LONG_DATE_RE.finditer(after):
+            date = _long_date(m)
+            if date:
+                result["fecha_limite"] = "{:02d}/{:02d}/{}".format(*date)
+                break
+
+    return result
+
+
+def receipt_files(folder: Path) -> list[Path]:
+    """PDF de recibos descargados (Comprobante y lineaCaptura) de una carpeta de cliente."""
+    files = []
+    for p in Path(folder).iterdir():
+        name = p.name.lower()
+        if not p.is_file() or p.suffix.lower() != ".pdf" or name.endswith(_OUTPUT_NAME_SUFFIXES):
+            continue
+        if any(part in name.replace(" ", "") for part in _RECEIPT_NAME_PARTS):
+            files.append(p)
+    return files
+
+
+def parse_receipt(path: Path) -> dict:
+    """
+    Campos de un recibo en PDF (ver parse_receipt_text). Se lee la primera
+    página que corresponde a un recibo: las siguientes son avisos legales que
+    repiten importes y fechas que no son los del pago.
+    """
+    pages = extract_pages_text(Path(path))
+    for page in pages:
+        if any(marker in page for _, marker in _KIND_MARKERS):
+            return parse_receipt_text(page)
+    return _empty_receipt()
+
+
+def _parse_receipt_file(path: str) -> dict:
+    """Tarea de parse_receipts; recibe la ruta en texto para cruzar procesos."""
+    return parse_receipt(Path(path))
+
+
+def _file_hash(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_cache() -> dict:
+    try:
+        with open(RECEIPTS_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == _PARSER_VERSION:
+            return data.get("receipts", {})
+    except Exception:
+        pass
+    return {}
+
+
+def _save_cache(receipts: dict) -> None:
+    path = Path(RECEIPTS_CACHE_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": _PARSER_VERSION, "receipts": receipts}, f, ensure_ascii=False)
+    tmp.replace(path)
+
+
+def parse_receipts(paths: Iterable[Path], workers: int | None = None) -> dict[Path, dict]:
+    """
+    Lee muchos recibos a la vez. Solo se procesan los archivos cuyo contenido
+    no está en caché, repartidos entre procesos; el resto sale de la caché.
+
+    Retorna {ruta: campos}; un archivo ilegible trae "error" en lugar de campos.
+    """
+    paths = list(dict.fromkeys(Path(p) for p in paths))
+    results: dict[Path, dict] = {}
+
+    hashes: dict[Path, str] = {}
+    for path in paths:
+        try:
+            hashes[path] = _file_hash(path)
+        except OSError as e:
+            results[path] = {**_empty_receipt(), "error": str(e)}
+
+    with _cache_lock:
+        cache = _load_cache()
+
+    pending = sorted({h for h in hashes.values() if h not in cache})
+    by_hash = {h: p for p, h in hashes.items()}
+    parsed: dict[str, dict] = {}
+
+    def _run_serial(todo: list[str]) -> None:
+        for h in todo:
+            try:
+                parsed[h] = parse_receipt(by_hash[h])
+            except Exception as e:
+                parsed[h] = {**_empty_receipt(), "error": str(e)}
+
+    workers = min(workers or parallel_workers(), len(pending))
+    if workers <= 1:
+        _run_serial(pending)
+    else:
+        # "spawn" también en Linux: la app tiene hilos de Qt y fork no es seguro con ellos
+        try:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                futures = {h: pool.submit(_parse_receipt_file, str(by_hash[h])) for h in pending}
+                for h, future in futures.items():
+                    try:
+                        parsed[h] = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        parsed[h] = {**_empty_receipt(), "error": str(e)}
+        except Exception:
+            _run_serial([h for h in pending if h not in parsed])
+
+    # Solo se recuerdan los recibos que se pudieron leer
+    fresh = {h: r for h, r in parsed.items() if "error" not in r}
+    if fresh:
+        with _cache_lock:
+            cache = _load_cache()
+            cache.update(fresh)
+            _save_cache(cache)
+    cache.update(parsed)
+
+    for path, h in hashes.items():
+        results[path] = dict(cache[h])
+    return results
@@ -0,0 +1,98 @@
+# tools/text.py
+"""
+Normalización de texto compartida por la búsqueda de mensajes (nombres, IDs,
+archivo histórico) y por los nombres de carpeta de los clientes.
+
+En lugar de recorrer cada carácter en Python, el texto ASCII se resuelve con
+lower() y solo los tramos no ASCII ("ó", "¡", "ñ") pasan por NFD y una tabla
+de traducción precalculada; cada tramo distinto se traduce una sola vez.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Iterable
+
+from config import VALIDATION
+
+
+# Marcas diacríticas (categoría Mn) -> se eliminan. Solo existen en los
+# planos 0, 1 y 14; recorrerlos una vez al importar cuesta ~20 ms.
+_STRIP_MARKS = {
+    cp: None
+    for block in (range(0x20000), range(0xE0000, 0xE1000))
+    for cp in block
+    if unicodedata.category(chr(cp)) == "Mn"
+}
+
+# Tramos de caracteres no ASCII; fuera de ellos NFD y la tabla no cambian nada
+# (ningún carácter ASCII se descompone ni se reordena con las marcas)
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]+")
+
+# tramo -> tramo sin marcas; en un mes de mensajes hay unos cientos distintos
+_runs: dict[str, str] = {}
+_RUNS_MAX = 4096
+
+# Separador del modo en bloque: no cambia con NFD ni con lower() y corta
+# el contexto de la sigma final igual que el inicio o el fin del texto
+_BATCH_SEP = "\x00"
+
+
+def _strip_run(match: re.Match) -> str:
+    run = match.group()
+    stripped = _runs.get(run)
+    if stripped is None:
+        stripped = unicodedata.normalize("NFD", run).translate(_STRIP_MARKS)
+        if len(_runs) >= _RUNS_MAX:
+            _runs.clear()
+        _runs[run] = stripped
+    return stripped
+
+
+def normalize_text(s: str) -> str:
+    """Normaliza texto: sin acentos, minúsculas"""
+    if s.isascii():
+        return s.lower()
+    # lower() al final y sobre todo el texto: la sigma final depende de lo que la rodea
+    return _NON_ASCII_RE.sub(_strip_run, s).lower()
+
+
+def normalize_texts(texts: Iterable[str]) -> list[str]:
+    """
+    normalize_text sobre muchos textos a la vez (una columna del Excel, las
+    páginas de un PDF): los textos ASCII van directo a lower() y los demás se
+    normalizan juntos, en una sola pasada.
+    """
+    texts = list(texts)
+    result = [t.lower() if t.isascii() else None for t in texts]
+    pending = [i for i, r in enumerate(result) if r is None]
+    if not pending:
+        return result
+
+    joined = _BATCH_SEP.join(texts[i] for i in pending)
+    if joined.count(_BATCH_SEP) != len(pending) - 1:
+        # Algún texto ya trae el separador: uno por uno
+        return [normalize_text(t) for t in texts]
+    for i, text in zip(pending, normalize_text(joined).split(_BATCH_SEP)):
+        result[i] = text
+    return result
+
+
+def _folder_strip_re() -> re.Pattern:
+    # \w es str.isalnum() más "_": conserva Ñ y acentos igual que el filtro original
+    allowed = "".join(VALIDATION["allowed_folder_chars"])
+    pattern = r"[^\w" + re.escape(allowed) + "]"
+    if "_" not in allowed:
+        pattern += "|_"
+    return re.compile(pattern)
+
+
+_FOLDER_STRIP_RE = _folder_strip_re()
+
+
+def safe_folder_name(name: str) -> str:
+    """
+    Nombre utilizable como carpeta o prefijo de archivo: solo letras, dígitos
+    y VALIDATION["allowed_folder_chars"]; si no queda nada, el nombre de respaldo.
+    """
+    return _FOLDER_STRIP_RE.sub("", name).strip() or VALIDATION["fallback_folder_name"]
@@ -6,13 +6,18 @@ import logging
 from pathlib import Path
 from typing import Optional, Tuple
 
-from config import WHATSAPP_CONFIG, VALIDATION, EXCEL_COLUMNS_M40, ERROR_LOG_FILE
+from config import WHATSAPP_CONFIG, PDF_CONFIG, EXCEL_COLUMNS_M40, ERROR_LOG_FILE
 from models.trabajador_m40 import TrabajadorM40
 from models.mensaje import Mensaje
 from services.imss_m40 import IMSSM40Service
 from services.whatsapp_web import WhatsAppService
 from tools.excel import ExcelTools
-from tools.pdf import extract_message
+from tools.pdf import (
+    extract_messages_bulk, check_pdf, check_pdfs, split_pages, PDF_TRUNCATED, PDF_CORRUPT,
+    get_cached_page_image, render_page_images,
+)
+from tools.archive import ingest_messages_pdf, search_messages
+from tools.text import safe_folder_name
 from tools.file import ensure_directory
 
 
@@ -49,8 +54,11 @@ class IMSSM40Workflow:
 
     def load_excel(self, path: str) -> TrabajadorM40:
         """Carga un archivo Excel."""
+        if self.excel is not None:
+            self.excel.close()
         self.excel = ExcelTools(path)
-        self.excel.load()
+        # Solo las columnas que usa el flujo; las demás quedan intactas en el archivo
+        self.excel.load(columns=EXCEL_COLUMNS_M40)
         self.excel.ensure_columns(EXCEL_COLUMNS_M40)
         self.excel.save()
         self.current_index = 0
@@ -65,7 +73,8 @@ class IMSSM40Workflow:
         """Guarda el trabajador actual."""
         self._ensure_excel()
         self.excel.update_row(self.current_index, trabajador.to_row())
-        self.excel.save()
+        # Guardado pedido por el usuario: se escribe ya para poder avisarle si falla
+        self.excel.flush()
 
     def create_new_client(self) -> TrabajadorM40:
         """Crea un nuevo trabajador."""
@@ -78,7 +87,7 @@ class IMSSM40Workflow:
     def go_next(self) -> TrabajadorM40:
         """Navega al siguiente trabajador."""
         self._ensure_excel()
-        if self.current_index < self.excel.row_count() - 1:
+        if self.excel.has_row(self.current_index + 1):
             self.current_index += 1
         return self.get_current_client()
 
@@ -92,7 +101,7 @@ class IMSSM40Workflow:
     def go_to(self, index: int) -> TrabajadorM40:
         """Navega a un índice específico."""
         self._ensure_excel()
-        if 0 <= index < self.excel.row_count():
+        if self.excel.has_row(index):
             self.current_index = index
         return self.get_current_client()
 
@@ -111,34 +120,174 @@ class IMSSM40Workflow:
         self, trabajador: TrabajadorM40, pdf_path: str
     ) -> Mensaje:
         """Extrae el mensaje personalizado para un trabajador."""
+        return self.get_messages_for_clients([trabajador], pdf_path)[0]
+
+    def get_messages_for_clients(
+        self, trabajadores: list[TrabajadorM40], pdf_path: str
+    ) -> list[Mensaje]:
+        """
+        Extrae los mensajes de varios trabajadores con una sola lectura del PDF.
+        Busca primero por ID y, a los que no se encuentren, por nombre. Por
+        nombre solo se acepta una página con confianza de al menos
+        PDF_CONFIG["name_min_score"]; cada Mensaje trae su confianza.
+        """
         path = Path(pdf_path)
-        result = None
-        
-        if hasattr(trabajador, 'id') and trabajador.id:
-            result = extract_message(
-                pdf_path=path,
-                identifier=str(trabajador.id),
-                search_by="id",
-                remove_first_line_flag=True,
-                normalize_breaks=True
-            )
-        
-        if not result or not result.get("success"):
-            result = extract_message(
-                pdf_path=path,
-                identifier=trabajador.cliente,
-                search_by="name",
-                remove_first_line_flag=False,  
-                normalize_breaks=True
-            )
-        
-        return Mensaje(
-            texto      = result.get("message", ""),
-            encontrado = result.get("success", False),
-            page_idx   = result.get("page_idx") if result.get("page_idx") is not None else -1,
-            pdf_path   = str(path),
+
+        by_id = extract_messages_bulk(
+            pdf_path=path,
+            identifiers=[str(t.id) for t in trabajadores if t.id],
+            search_by="id",
+            remove_first_line_flag=True,
+            normalize_breaks=True
         )
 
+        def _found_by_id(t: TrabajadorM40) -> bool:
+            return bool(t.id) and by_id[str(t.id)]["success"]
+
+        # Solo si quedan clientes sin resolver: por nombre hace falta el texto de todo el PDF
+        pending = [t.cliente for t in trabajadores if not _found_by_id(t)]
+        by_name = extract_messages_bulk(
+            pdf_path=path,
+            identifiers=pending,
+            search_by="name",
+            remove_first_line_flag=False,
+            normalize_breaks=True
+        ) if pending else {}
+
+        mensajes = []
+        for t in trabajadores:
+            result = by_id[str(t.id)] if _found_by_id(t) else by_name[t.cliente]
+            metodo = ""
+            if result.get("success"):
+                metodo = "id" if _found_by_id(t) else "nombre"
+            mensajes.append(Mensaje(
+                texto      = result.get("message", ""),
+                encontrado = result.get("success", False),
+                page_idx   = result.get("page_idx") if result.get("page_idx") is not None else -1,
+                pdf_path   = str(path),
+                metodo     = metodo,
+                confianza  = result.get("score", 0.0) if result.get("success") else 0.0,
+            ))
+        return mensajes
+
+    def precompute_messages(self, pdf_path: str) -> dict:
+        """
+        Resuelve en segundo plano los mensajes de todas las filas del Excel.
+        Quedan guardados junto al índice del PDF, así que la navegación y los
+        envíos posteriores los obtienen sin volver a extraer.
+
+        Retorna la cobertura: {"total", "por_id", "por_nombre", "sin_mensaje"}.
+        """
+        self._ensure_excel()
+        trabajadores = [
+            TrabajadorM40.from_row(self.excel.get_row(i)) for i in range(self.excel.row_count())
+        ]
+        trabajadores = [t for t in trabajadores if t.id or t.cliente]
+        mensajes = self.get_messages_for_clients(trabajadores, pdf_path)
+
+        return {
+            "total":       len(mensajes),
+            "por_id":      sum(1 for m in mensajes if m.metodo == "id"),
+            "por_nombre":  sum(1 for m in mensajes if m.metodo == "nombre"),
+            "sin_mensaje": sum(1 for m in mensajes if not m.encontrado),
+        }
+
+    def archive_messages_pdf(self, pdf_path: str) -> dict:
+        """
+        Guarda el PDF de mensajes en el archivo histórico (tools/archive) para
+        buscarlo en los meses siguientes. Es un paso aparte del precálculo
+        porque necesita el texto de todas las páginas, que la vista previa no.
+
+        Retorna lo mismo que ingest_messages_pdf.
+        """
+        try:
+            return ingest_messages_pdf(Path(pdf_path))
+        except Exception as e:
+            logging.error(f"No se pudo archivar {pdf_path}: {e}")
+            raise
+
+    def search_message_archive(self, query: str, search_by: str = "text", limit: int = 20) -> list[dict]:
+        """
+        Busca en los mensajes de todos los meses ya archivados (tools/archive).
+        search_by: "name", "id" o "text" (todas las palabras).
+        """
+        return search_messages(query, search_by, limit)
+
+    def split_message_pages(self, pdf_path: str) -> dict:
+        """
+        Deja en la carpeta de cada cliente su página del PDF de mensajes como un
+        PDF aparte (PDF_CONFIG["message_page_name"]). La página se resuelve igual
+        que en la navegación (por ID y, si no, por nombre) y el PDF de mensajes
+        se lee una sola vez; los archivos que ya están al día no se reescriben.
+
+        Retorna {"escritos", "al_dia", "sin_mensaje", "sin_carpeta", "errores"}.
+        """
+        self._ensure_excel()
+        trabajadores = [
+            TrabajadorM40.from_row(self.excel.get_row(i)) for i in range(self.excel.row_count())
+        ]
+        trabajadores = [t for t in trabajadores if t.id or t.cliente]
+        mensajes = self.get_messages_for_clients(trabajadores, pdf_path)
+
+        outputs: dict[Path, int] = {}
+        sin_mensaje = sin_carpeta = 0
+        for trabajador, mensaje in zip(trabajadores, mensajes):
+            if not mensaje.encontrado:
+                sin_mensaje += 1
+                continue
+            folder = self._client_folder_path(trabajador)
+            if folder is None:
+                sin_carpeta += 1
+                continue
+            name = PDF_CONFIG["message_page_name"].format(
+                cliente=self._client_folder_name(trabajador.cliente or trabajador.id)
+            )
+            outputs[folder / name] = mensaje.page_idx
+
+        results = split_pages(Path(pdf_path), outputs)
+        for output, result in results.items():
+            if result["error"]:
+                logging.error(f"Error separando mensaje en {output}: {result['error']}")
+
+        return {
+            "escritos":    sum(1 for r in results.values() if r["success"] and not r["skipped"]),
+            "al_dia":      sum(1 for r in results.values() if r["skipped"]),
+            "sin_mensaje": sin_mensaje,
+            "sin_carpeta": sin_carpeta,
+            "errores":     sum(1 for r in results.values() if r["error"]),
+        }
+
+    def get_cached_thumbnail(self, mensaje: Mensaje) -> Optional[bytes]:
+        """PNG de la página del mensaje si ya está renderizada; no renderiza."""
+        if not mensaje.es_valido() or mensaje.page_idx < 0:
+            return None
+        try:
+            return get_cached_page_image(Path(mensaje.pdf_path), mensaje.page_idx)
+        except OSError:
+            return None
+
+    def render_thumbnails(self, pdf_path: str, index: int) -> dict[int, bytes]:
+        """
+        Renderiza la página del mensaje de la fila `index` y, de antemano, las de
+        las PDF_CONFIG["thumbnail_prefetch"] filas anteriores y siguientes, para
+        que la navegación encuentre la vista previa lista.
+
+        Retorna {fila: PNG} de las filas que tienen mensaje.
+        """
+        self._ensure_excel()
+        radius = PDF_CONFIG["thumbnail_prefetch"]
+        # La fila actual primero; luego las vecinas, de la más cercana a la más lejana
+        rows = [index] + [
+            r for d in range(1, radius + 1) for r in (index + d, index - d)
+            if 0 <= r < self.excel.row_count()
+        ]
+        trabajadores = [TrabajadorM40.from_row(self.excel.get_row(r)) for r in rows]
+        mensajes = self.get_messages_for_clients(trabajadores, pdf_path)
+
+        pages = {r: m.page_idx for r, m in zip(rows, mensajes) if m.es_valido() and m.page_idx >= 0}
+        images = render_page_images(Path(pdf_path), pages.values())
+        return {r: images[p] for r, p in pages.items() if p in images}
+
     def open_imss_page(self) -> None:
         """Abre la página del IMSS M40."""
         self.imss.start()
@@ -179,7 +328,7 @@ class IMSSM40Workflow:
                 return None, intentos
 
             self.excel.update_row(self.current_index, {"PDF": pdf_path})
-            self.excel.save()
+            self.excel.flush()   # la descarga ya se hizo: que no dependa del guardado diferido
             return pdf_path, trabajador.intentos
         except RuntimeError:
             raise
@@ -220,7 +369,7 @@ class IMSSM40Workflow:
             pdf_path = self._rename_pdf(pdf_path, trabajador.cliente)
             intentos = self._increment_intentos()
             self.excel.update_row(self.current_index, {"PDF": pdf_path})
-            self.excel.save()
+            self.excel.flush()   # la descarga ya se hizo: que no dependa del guardado diferido
             return pdf_path, intentos
         except RuntimeError:
             raise
@@ -241,11 +390,7 @@ class IMSSM40Workflow:
         original = Path(pdf_path)
         if not original.exists():
             return pdf_path
-        safe_client = "".join(
-            c for c in client_name
-            if c.isalnum() or c in VALIDATION["allowed_folder_chars"]
-        ).strip() or VALIDATION["fallback_folder_name"]
-        new_path = original.parent / f"{safe_client}_{original.name}"
+        new_path = original.parent / f"{safe_folder_name(client_name)}_{original.name}"
         original.replace(new_path)
         return str(new_path)
 
@@ -268,6 +413,11 @@ class IMSSM40Workflow:
             raise RuntimeError("El cliente no tiene PDF asignado.")
         if not Path(trabajador.pdf).exists():
             raise RuntimeError("El archivo PDF no existe. Descárgalo primero.")
+        verdict = check_pdf(Path(trabajador.pdf))
+        if verdict["status"] == PDF_TRUNCATED:
+            raise RuntimeError("El PDF está incompleto (descarga interrumpida). Descárgalo de nuevo.")
+        if verdict["status"] == PDF_CORRUPT:
+            raise RuntimeError(f"El PDF está dañado: {verdict['error']}")
 
         self.whatsapp.open_chat(trabajador.numero)
         self.whatsapp.send_message(message_text)
@@ -283,12 +433,26 @@ class IMSSM40Workflow:
         if start < 0 or end >= total or start > end:
             raise ValueError(f"Rango inválido. Verifica los números ingresados.")
 
+        # Todos los mensajes del rango se resuelven antes de empezar a enviar
+        trabajadores = [
+            TrabajadorM40.from_row(self.excel.get_row(i)) for i in range(start, end + 1)
+        ]
+        try:
+            mensajes = self.get_messages_for_clients(trabajadores, global_pdf_path)
+        except Exception as e:
+            # Sin el lote, cada fila se resuelve en su propio try: un error solo omite esa fila
+            logging.error(f"No se pudieron resolver los mensajes del rango: {e}", exc_info=True)
+            mensajes = [None] * len(trabajadores)
+
+        # Los PDF del rango se validan juntos; cada envío usa el veredicto ya calculado
+        check_pdfs(Path(t.pdf) for t in trabajadores if t.pdf)
+
         ok = fail = 0
-        for i in range(start, end + 1):
+        for i, trabajador, mensaje in zip(range(start, end + 1), trabajadores, mensajes):
             self.current_index = i
             try:
-                trabajador = self.get_current_client()
-                mensaje = self.get_message_for_client(trabajador, global_pdf_path)
+                if mensaje is None:
+                    mensaje = self.get_message_for_client(trabajador, global_pdf_path)
                 if not mensaje.es_valido():
                     raise RuntimeError(
                         f"No se encontró mensaje para '{trabajador.cliente}'."
@@ -301,21 +465,29 @@ class IMSSM40Workflow:
 
         return ok, fail
 
+    def _client_folder_path(self, trabajador: TrabajadorM40) -> Optional[Path]:
+        """Carpeta de descargas del cliente: la de su PDF o la que se le crearía."""
+        if trabajador.pdf:
+            return Path(trabajador.pdf).parent
+        if trabajador.carpeta_pdf and trabajador.cliente:
+            return Path(trabajador.carpeta_pdf) / self._client_folder_name(trabajador.cliente)
+        return None
+
+    def _client_folder_name(self, client_name: str) -> str:
+        return safe_folder_name(client_name)
+
     def _create_client_folder(self, base_folder: str, client_name: str) -> str:
         """Crea una subcarpeta para el cliente."""
-        safe_name = "".join(
-            c for c in client_name 
-            if c.isalnum() or c in VALIDATION["allowed_folder_chars"]
-        ).strip()
-        
-        if not safe_name:
-            safe_name = VALIDATION["fallback_folder_name"]
-        
-        carpeta_cliente = Path(base_folder) / safe_name
+        carpeta_cliente = Path(base_folder) / self._client_folder_name(client_name)
         ensure_directory(carpeta_cliente)
         
         return str(carpeta_cliente)
 
+    def close(self) -> None:
+        """Escribe los cambios pendientes del Excel (al cerrar la ventana)."""
+        if self.excel is not None:
+            self.excel.close()
+
     def _ensure_excel(self) -> None:
         """Verifica que haya un Excel cargado."""
         if not self.excel:
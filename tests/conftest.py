@@ -0,0 +1,41 @@
+"""
+Las pruebas importan los módulos de src/ igual que la app (import config,
+import tools...). DATA_DIR se manda a una carpeta temporal para no tocar
+los datos del usuario.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+os.environ["LOCALAPPDATA"] = tempfile.mkdtemp(prefix="asistenteimss-tests-")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+MESSAGE_BODY = (
+    "Esperando se encuentre muy bien, le contactamos del despacho para "
+    "informarle que ya se efectuó su registro referente al mes de Agosto 2025."
+)
+
+
+@pytest.fixture
+def make_messages_pdf(tmp_path):
+    """
+    Arma un PDF de mensajes como el global: una página por cliente, con la
+    primera línea (IDs) y el saludo "Sr(a). NOMBRE". Requiere PyMuPDF.
+    """
+    fitz = pytest.importorskip("fitz")
+
+    def make(pages: list[tuple[str, str]], name: str = "mensajes.pdf"):
+        path = tmp_path / name
+        with fitz.open() as doc:
+            for first_line, client in pages:
+                page = doc.new_page()
+                lines = [first_line, "", f"Sr(a). {client}, ¡Buenas tardes!", "", MESSAGE_BODY]
+                page.insert_text((72, 72), "\n".join(lines))
+            doc.save(str(path))
+        return path
+
+    return make
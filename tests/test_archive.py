@@ -0,0 +1,54 @@
+"""
+tools.archive: búsqueda por ID con las mismas reglas que find_message_by_id.
+"""
+import sqlite3
+
+import pytest
+
+import tools.archive as archive
+from tools.archive import SEARCH_ID, ingest_messages_pdf, search_messages
+from tools.pdf import find_message_by_id
+
+
+PAGES = [
+    ("12345TI", "CLIENTE UNO"),
+    ("678 TI 55", "CLIENTE DOS"),
+    ("9000TI 9000M40", "CLIENTE TRES"),
+]
+
+
+@pytest.fixture
+def archive_file(tmp_path, monkeypatch):
+    path = tmp_path / "archivo.sqlite3"
+    monkeypatch.setattr(archive, "MESSAGES_ARCHIVE_FILE", path)
+    return path
+
+
+def _pages_found(query):
+    return [r["page_idx"] for r in search_messages(query, SEARCH_ID)]
+
+
+def test_id_search_finds_bare_numbers_like_find_message_by_id(make_messages_pdf, archive_file):
+    path = make_messages_pdf(PAGES)
+    ingest_messages_pdf(path)
+
+    assert _pages_found("12345TI") == [0]
+    assert _pages_found("12345") == [0]
+    assert find_message_by_id(path, "12345")["page_idx"] == 0
+    assert _pages_found("678 ti") == [1]
+    assert _pages_found("678") == [1]
+    # "9000" lleva a dos IDs de la misma página: sigue siendo de esa página
+    assert _pages_found("9000") == [2]
+
+
+def test_version_1_archive_gains_bare_numbers_without_losing_documents(make_messages_pdf, archive_file):
+    path = make_messages_pdf(PAGES)
+    ingest_messages_pdf(path)
+    # Base como la dejaba la versión 1: sin números sueltos en ids
+    with sqlite3.connect(str(archive_file)) as conn:
+        conn.execute("UPDATE page_text SET ids = '12345ti' WHERE rowid & 1048575 = 0")
+        conn.execute("PRAGMA user_version = 1")
+    path.unlink()
+
+    assert _pages_found("12345") == [0]
+    assert len(archive.archived_documents()) == 1
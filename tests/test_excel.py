@@ -0,0 +1,205 @@
+"""
+ExcelTools: guardado por parches (openpyxl) y bitácora de cambios.
+"""
+import json
+
+import openpyxl
+import pytest
+from openpyxl.styles import Font
+
+import tools.excel as excel_module
+from tools.excel import ExcelTools
+
+
+COLUMNS = ["ID", "CLIENTE", "NSS", "TOTAL"]
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    """Excel con formato, una fórmula, una columna que no carga el flujo y otra hoja."""
+    path = tmp_path / "control.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append([*COLUMNS, "NOTAS"])
+    for i in range(1, 11):
+        ws.append([f"{i}TI", f"CLIENTE {i}", f"{i:011d}", i * 100, f"nota {i}"])
+    ws["D12"] = "=SUM(D2:D11)"
+    ws.column_dimensions["B"].width = 42
+    ws["B2"].font = Font(bold=True)
+    wb.create_sheet("Tarifas")["A1"] = "no tocar"
+    wb.save(path)
+    return path
+
+
+def _open(path, **kwargs):
+    kwargs.setdefault("write_behind", False)
+    excel = ExcelTools(path, **kwargs)
+    excel.snapshot = False          # cada prueba lee el archivo real
+    excel.load(columns=[*COLUMNS, "PDF"])
+    excel.wait_loaded()
+    return excel
+
+
+def _edit(excel):
+    excel.ensure_columns(["PDF"])
+    excel.update_row(0, {"CLIENTE": "EDITADO", "PDF": "a.pdf"})
+    excel.insert_row(2, {"ID": "99TI", "CLIENTE": "INSERTADO"})
+    excel.delete_row(5)
+    excel.add_row({"ID": "100TI", "CLIENTE": "AL FINAL"})
+
+
+def _rows(excel):
+    return [excel.get_row(i) for i in range(excel.row_count())]
+
+
+def test_patch_save_round_trip_keeps_formatting_sheets_and_other_columns(workbook):
+    excel = _open(workbook, journal=False)
+    _edit(excel)
+    excel.save()
+    expected = _rows(excel)
+
+    reread = _open(workbook, journal=False)
+    assert _rows(reread) == [
+        {k: v for k, v in row.items() if k != "UltimaActualizacion"} for row in expected
+    ]
+
+    wb = openpyxl.load_workbook(workbook)
+    ws = wb.worksheets[0]
+    assert wb.sheetnames == ["Sheet", "Tarifas"]
+    assert wb["Tarifas"]["A1"].value == "no tocar"
+    assert ws.column_dimensions["B"].width == 42
+    assert ws["B2"].font.bold
+    # NOTAS no se cargó: se movió con su fila, pero no se reescribió
+    assert ws["E2"].value == "nota 1"
+    assert ws["E4"].value is None            # fila insertada
+    assert [ws.cell(r, 5).value for r in range(5, 7)] == ["nota 3", "nota 4"]
+
+
+def test_patch_save_keeps_formulas_and_asks_excel_to_recalculate(workbook):
+    excel = _open(workbook, journal=False)
+    total_row = excel.row_count() - 1
+    excel.update_row(total_row, {"TOTAL": ""})   # resultado que la app no conoce
+    excel.update_row(0, {"CLIENTE": "X"})
+    excel.save()
+
+    wb = openpyxl.load_workbook(workbook)
+    assert wb.worksheets[0]["D12"].value == "=SUM(D2:D11)"
+    assert wb.calculation.fullCalcOnLoad
+
+
+def test_journal_is_replayed_after_crash(workbook):
+    excel = _open(workbook, write_behind=True)
+    excel.save_delay = 3600
+    _edit(excel)
+    excel.save()
+    expected = _rows(excel)
+
+    # Cierre inesperado: no se escribe el Excel y la bitácora queda en disco
+    excel._timer.cancel()
+    excel_module._open_workbooks.discard(excel)
+    journal = excel.journal_path
+    with journal.open("a", encoding="utf-8") as f:
+        f.write('{"op": "upd')                 # última línea cortada
+    assert openpyxl.load_workbook(workbook).worksheets[0]["B2"].value == "CLIENTE 1"
+
+    recovered = _open(workbook)
+    assert recovered.replayed_ops == 5
+    assert recovered.has_pending_changes()
+    assert _rows(recovered) == expected
+
+    recovered.close()
+    assert not journal.exists()
+    assert _rows(_open(workbook, journal=False)) == expected
+
+
+def test_journal_for_another_version_is_set_aside(workbook):
+    excel = _open(workbook, write_behind=True)
+    excel.save_delay = 3600
+    excel.update_row(0, {"CLIENTE": "PERDIDO"})
+    excel_module._open_workbooks.discard(excel)
+
+    # Otro programa cambia el Excel después de anotar el cambio
+    wb = openpyxl.load_workbook(workbook)
+    wb.worksheets[0]["C2"] = "00000000000"
+    wb.save(workbook)
+
+    reopened = _open(workbook)
+    assert reopened.replayed_ops == 0
+    assert reopened.get_row(0)["CLIENTE"] == "CLIENTE 1"
+    assert not reopened.journal_path.exists()
+    aside = list(workbook.parent.glob(workbook.name + ".journal.jsonl.*.bak"))
+    assert len(aside) == 1
+    header, op = aside[0].read_text(encoding="utf-8").splitlines()
+    assert json.loads(op)["data"]["CLIENTE"] == "PERDIDO"
+
+
+def _insert_outside_app(path, row, values):
+    wb = openpyxl.load_workbook(path)
+    ws = wb.worksheets[0]
+    ws.insert_rows(row)
+    for col, value in enumerate(values, start=1):
+        ws.cell(row, col).value = value
+    wb.save(path)
+
+
+def _sheet(path, columns=5, rows=None):
+    ws = openpyxl.load_workbook(path).worksheets[0]
+    last = rows or ws.max_row
+    return [tuple(ws.cell(r, c).value for c in range(1, columns + 1)) for r in range(2, last + 1)]
+
+
+def test_save_after_outside_edit_matches_rows_by_id(workbook):
+    excel = _open(workbook, journal=False)
+    excel.update_row(0, {"CLIENTE": "EDITADO"})
+    excel.delete_row(4)                                   # 5TI
+    excel.add_row({"ID": "100TI", "CLIENTE": "AL FINAL"})
+
+    # Mientras tanto alguien inserta una fila arriba en Excel
+    _insert_outside_app(workbook, 2, ["0TI", "NUEVO", None, 5, "nota nueva"])
+    excel.save()
+
+    rows = _sheet(workbook)
+    by_id = {row[0]: row for row in rows if row[0]}
+    assert by_id["0TI"] == ("0TI", "NUEVO", None, 5, "nota nueva")
+    assert by_id["1TI"][1:] == ("EDITADO", "00000000001", 100, "nota 1")
+    assert by_id["6TI"][1:] == ("CLIENTE 6", "00000000006", 600, "nota 6")
+    assert by_id["100TI"][1] == "AL FINAL"
+    assert "5TI" not in by_id
+    assert all(row[0] for row in rows if row[4])          # ninguna nota quedó sin su fila
+    assert [row[0] for row in rows].index("100TI") == len(rows) - 2   # antes del total
+    assert rows[-1][3] == "=SUM(D2:D11)"                 # la fila del total no se tocó
+
+
+def test_save_after_outside_edit_without_unique_ids_refuses(workbook):
+    excel = _open(workbook, journal=False)
+    excel.update_row(0, {"CLIENTE": "EDITADO"})
+    _insert_outside_app(workbook, 2, ["3TI", "REPETIDO", None, None, None])
+    before = workbook.read_bytes()
+
+    with pytest.raises(RuntimeError, match="3TI"):
+        excel.save()
+    assert workbook.read_bytes() == before
+    assert excel.has_pending_changes()
+
+
+@pytest.mark.parametrize("columns", [["ID", "CLIENTE"], ["CLIENTE"]])
+def test_partial_load_keeps_unloaded_columns_with_their_row_after_outside_edit(workbook, columns):
+    excel = ExcelTools(workbook, write_behind=False, journal=False)
+    excel.snapshot = False
+    excel.load(columns=columns)
+    excel.wait_loaded()
+    assert "ID" in excel.df.columns          # la llave se carga aunque no se pida
+
+    _insert_outside_app(workbook, 2, ["0TI", "NUEVO", None, None, "nota nueva"])
+    excel.update_row(0, {"CLIENTE": "EDIT"})
+    excel.update_row(1, {"CLIENTE": "EDIT2"})
+    excel.save()
+
+    rows = _sheet(workbook)
+    assert rows[:3] == [
+        ("0TI", "NUEVO", None, None, "nota nueva"),
+        ("1TI", "EDIT", "00000000001", 100, "nota 1"),
+        ("2TI", "EDIT2", "00000000002", 200, "nota 2"),
+    ]
+    assert [(row[0], row[4]) for row in rows[3:-1]] == [(f"{i}TI", f"nota {i}") for i in range(3, 11)]
+    assert rows[-1][:2] == (None, None)
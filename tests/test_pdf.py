@@ -0,0 +1,260 @@
+"""
+tools.pdf: documentos compartidos entre hilos.
+"""
+import os
+import threading
+
+import pytest
+
+import tools.pdf as pdf_module
+from tools.pdf import build_id_map, find_message_by_id, get_page_text, render_page_images, split_pages
+
+
+CLIENTS = [(f"{i}TI", f"CLIENTE NUMERO {i}") for i in range(1, 9)]
+
+
+def test_fitz_calls_from_several_threads_match_serial_results(make_messages_pdf, tmp_path, monkeypatch):
+    path = make_messages_pdf(CLIENTS)
+    fitz_open = pdf_module.fitz.open
+    unlocked = []
+
+    def checked_open(*args, **kwargs):
+        if not pdf_module._fitz_lock._is_owned():
+            unlocked.append(args)
+        return fitz_open(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_module.fitz, "open", checked_open)
+    expected_text = [get_page_text(path, i) for i in range(len(CLIENTS))]
+    expected_png = render_page_images(path, range(len(CLIENTS)), zoom=0.3)
+    pdf_module.clear_pages_index()
+    pdf_module._thumbnails.clear()
+
+    errors = []
+
+    def run(job):
+        try:
+            job()
+        except Exception as e:
+            errors.append(e)
+
+    def texts():
+        for _ in range(5):
+            for i in range(len(CLIENTS)):
+                assert get_page_text(path, i) == expected_text[i]
+
+    def thumbnails():
+        for i in range(len(CLIENTS)):
+            assert render_page_images(path, [i], zoom=0.3)[i] == expected_png[i]
+
+    def splits(n):
+        outputs = {tmp_path / f"split{n}" / f"{i}.pdf": i for i in range(len(CLIENTS))}
+        assert all(r["success"] for r in split_pages(path, outputs).values())
+
+    threads = [threading.Thread(target=run, args=(job,)) for job in (
+        texts, thumbnails, lambda: splits(1), lambda: splits(2), texts,
+    )]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert unlocked == []              # MuPDF solo se usó con _fitz_lock
+    assert not pdf_module._fitz_lock._is_owned()
+    pdf_module.close_documents()
+
+
+def test_cold_index_build_does_not_block_page_lookups(make_messages_pdf, monkeypatch):
+    path = make_messages_pdf(CLIENTS)
+    extract = pdf_module._get_pages_text
+    started, release = threading.Event(), threading.Event()
+
+    def slow_extract(*args, **kwargs):
+        started.set()
+        assert release.wait(10)
+        return extract(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_module, "_get_pages_text", slow_extract)
+    monkeypatch.setattr(pdf_module, "_page_hashes", lambda p: None)
+    builder = threading.Thread(target=pdf_module.get_pages_index, args=(path,))
+    builder.start()
+    try:
+        assert started.wait(10)
+        # Mientras se extrae el índice completo, las consultas de una página no esperan
+        assert "CLIENTE NUMERO 3" in get_page_text(path, 2)
+        assert pdf_module.get_first_lines(path)[0] == "1ti"
+    finally:
+        release.set()
+        builder.join()
+    assert "CLIENTE NUMERO 3" in pdf_module.get_pages_index(path)["pages"][2]
+
+
+def test_name_search_rejects_pages_that_only_share_a_surname(make_messages_pdf):
+    path = make_messages_pdf([
+        ("1TI", "ALFREDO RUIZ BENITEZ"),
+        ("2TI", "RICARDO VARGAS  VILLALOBOS"),
+        ("3TI", "MARIA ELENA BARBA FLORES"),
+    ])
+
+    exact = pdf_module.find_message_for_client(path, "MARIA ELENA BARBA FLORES")
+    assert exact["found"] and exact["page_idx"] == 2 and exact["score"] == 1.0
+
+    close = pdf_module.find_message_for_client(path, "RICARDO VARGAS VILLALOBOS")
+    assert close["found"] and close["page_idx"] == 1
+    assert pdf_module.PDF_CONFIG["name_min_score"] <= close["score"] < 1.0
+
+    # Otro cliente con el mismo apellido: el candidato se informa, pero no se usa
+    absent = pdf_module.find_message_for_client(path, "ANABEL RUIZ ESQUIVEL")
+    assert not absent["found"] and absent["page_idx"] is None
+    assert absent["matches"][0]["page_idx"] == 0
+    assert 0 < absent["score"] < pdf_module.PDF_CONFIG["name_min_score"]
+    assert "insuficiente" in absent["errors"][0]
+
+    bulk = pdf_module.extract_messages_bulk(path, ["ANABEL RUIZ ESQUIVEL", "RICARDO VARGAS VILLALOBOS"])
+    assert not bulk["ANABEL RUIZ ESQUIVEL"]["success"]
+    assert bulk["ANABEL RUIZ ESQUIVEL"]["score"] == absent["score"]
+    assert bulk["RICARDO VARGAS VILLALOBOS"]["score"] == close["score"]
+
+
+@pytest.mark.parametrize("config_mb, max_memory_mb", [(256, 0), (0, None)])
+def test_merge_that_spills_to_disk_ends_compacted(make_messages_pdf, tmp_path, monkeypatch,
+                                                  config_mb, max_memory_mb):
+    parts = [make_messages_pdf(CLIENTS[i:i + 2], name=f"parte{i}.pdf") for i in range(0, 8, 2)]
+    merged = tmp_path / "unido.pdf"
+    monkeypatch.setitem(pdf_module.PDF_CONFIG, "merge_memory_mb", config_mb)
+    save_incremental = pdf_module.fitz.Document.saveIncr
+    incremental_saves = []
+
+    def counted_save(doc):
+        incremental_saves.append(doc.name)
+        return save_incremental(doc)
+
+    monkeypatch.setattr(pdf_module.fitz.Document, "saveIncr", counted_save)
+
+    # 0 MB se vuelca después de cada entrada (un 0 explícito no es "el valor por omisión")
+    pdf_module.merge_pdfs(parts, merged, max_memory_mb=max_memory_mb)
+
+    assert incremental_saves                    # sí hubo volcados intermedios
+    assert merged.read_bytes().count(b"%%EOF") == 1   # pero el resultado no los encadena
+    assert pdf_module.extract_pages_text(merged) == [
+        text for part in parts for text in pdf_module.extract_pages_text(part)
+    ]
+    assert sorted(p.name for p in tmp_path.glob("unido.pdf*")) == ["unido.pdf"]
+
+
+@pytest.mark.parametrize("search_by, identifiers", [
+    ("name", ["CLIENTE NUMERO 2", "CLIENTE NUMERO 5"]),
+    ("id", ["2TI", "5TI"]),
+])
+def test_memoized_bulk_lookup_does_not_touch_the_index(make_messages_pdf, monkeypatch,
+                                                       search_by, identifiers):
+    path = make_messages_pdf(CLIENTS)
+    first = pdf_module.extract_messages_bulk(path, identifiers, search_by)
+    assert all(r["success"] for r in first.values())
+
+    # Otra sesión: sin nada en memoria, solo lo guardado en *.messages.json
+    pdf_module.clear_pages_index()
+
+    def no_index(*args, **kwargs):
+        raise AssertionError("no debía construir el índice")
+
+    monkeypatch.setattr(pdf_module, "get_pages_index", no_index)
+    monkeypatch.setattr(pdf_module, "get_id_map", no_index)
+    monkeypatch.setattr(pdf_module, "_get_pages_text", no_index)
+    assert pdf_module.extract_messages_bulk(path, identifiers, search_by) == first
+
+
+def test_extract_pages_text_in_parallel_matches_serial(make_messages_pdf):
+    path = make_messages_pdf(CLIENTS)
+    serial = pdf_module.extract_pages_text(path)
+
+    assert pdf_module.extract_pages_text(path, parallel=True) == serial
+    assert [page.split("\n", 1)[0] for page in serial] == [first for first, _ in CLIENTS]
+
+
+def test_id_map_adds_bare_numbers_only_when_they_lead_to_one_page():
+    id_map = build_id_map(["1ti", "10ti", "557 ti", "382ti 382m40", "77ti", "77m40", "77ti"])
+    ids = id_map["ids"]
+
+    assert (ids["1"], ids["10"], ids["557ti"], ids["382"]) == (0, 1, 2, 3)
+    # "77" llevaría a tres páginas (77ti dos veces y 77m40): no se registra
+    assert "77" not in ids
+    assert id_map["duplicates"] == {"77ti": [4, 6]}
+    # "557" sale de la misma línea que "557ti": no es un conflicto
+    assert id_map["overlaps"] == {"1": ["10", "10ti"]}
+
+
+def test_find_message_by_id_with_bare_numbers(make_messages_pdf):
+    path = make_messages_pdf([("382TI", "CLIENTE A"), ("77TI", "CLIENTE B"), ("77SP", "CLIENTE C")])
+
+    found = find_message_by_id(path, "382")
+    assert found["found"] and found["page_idx"] == 0
+    assert find_message_by_id(path, "77 sp")["page_idx"] == 2
+    # "77" sería tanto 77TI como 77SP: no se elige ninguno
+    missing = find_message_by_id(path, "77")
+    assert not missing["found"] and missing["errors"]
+
+
+def _regenerate(make_messages_pdf, path, pages):
+    """Vuelve a escribir el PDF en la misma ruta, con otra versión (tamaño/mtime)."""
+    mtime_ns = path.stat().st_mtime_ns
+    make_messages_pdf(pages, name=path.name)
+    os.utime(path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+
+
+def _count_extracted_pages(monkeypatch):
+    extracted = []
+    iter_pages = pdf_module._iter_backend_pages
+    first_lines_text = pdf_module._get_first_lines_text
+
+    def counted_pages(path, page_indices):
+        extracted.extend(page_indices)
+        return iter_pages(path, page_indices)
+
+    def counted_first_lines(path, page_indices=None):
+        extracted.extend(page_indices)
+        return first_lines_text(path, page_indices)
+
+    def no_full_extraction(*args, **kwargs):
+        raise AssertionError("se extrajo el PDF completo")
+
+    monkeypatch.setattr(pdf_module, "_iter_backend_pages", counted_pages)
+    monkeypatch.setattr(pdf_module, "_get_first_lines_text", counted_first_lines)
+    monkeypatch.setattr(pdf_module, "_get_pages_text", no_full_extraction)
+    return extracted
+
+
+@pytest.mark.parametrize("from_disk", [False, True])
+def test_regenerated_pdf_only_reindexes_changed_pages(make_messages_pdf, monkeypatch, from_disk):
+    path = make_messages_pdf(CLIENTS)
+    old = pdf_module.get_pages_index(path)["pages"]
+
+    pages = list(CLIENTS)
+    pages[3] = ("4TI 99TI", "CLIENTE CAMBIADO")
+    _regenerate(make_messages_pdf, path, pages)
+    expected = pdf_module.extract_pages_text(path)
+    if from_disk:
+        pdf_module.clear_pages_index()
+    extracted = _count_extracted_pages(monkeypatch)
+
+    index = pdf_module.get_pages_index(path)
+
+    assert extracted == [3]
+    assert index["pages"] == expected
+    assert index["pages"][3] != old[3] and "CLIENTE CAMBIADO" in index["pages"][3]
+    assert index["norm"] == [pdf_module.normalize_text(p) for p in expected]
+    assert find_message_by_id(path, "99ti")["page_idx"] == 3
+
+
+def test_regenerated_pdf_only_rereads_changed_first_lines(make_messages_pdf, monkeypatch):
+    path = make_messages_pdf(CLIENTS)
+    pdf_module.get_first_lines(path)
+
+    pages = list(CLIENTS)
+    pages[0] = ("1TI 99TI", CLIENTS[0][1])
+    pages.append(("9TI", "CLIENTE NUEVO"))
+    _regenerate(make_messages_pdf, path, pages)
+    extracted = _count_extracted_pages(monkeypatch)
+
+    assert pdf_module.get_first_lines(path) == ["1ti 99ti"] + [f"{i}ti" for i in range(2, 10)]
+    assert extracted == [0, 8]
@@ -0,0 +1,23 @@
+"""
+tools.receipt: qué archivos de la carpeta del cliente se leen como recibos.
+"""
+from tools.receipt import receipt_files
+
+
+def test_receipt_files_skip_the_pdfs_the_app_writes(tmp_path):
+    for name in (
+        "Comprobante.pdf",
+        "lineaCaptura (1).PDF",
+        "linea Captura.pdf",
+        "JUAN PEREZ_completo.pdf",
+        "JUAN PEREZ_mensaje.pdf",
+        "Comprobante_completo.pdf",
+        "notas.pdf",
+        "Comprobante.txt",
+    ):
+        (tmp_path / name).write_bytes(b"%PDF-1.4\n")
+    (tmp_path / "lineaCaptura.pdf").mkdir()
+
+    names = sorted(p.name for p in receipt_files(tmp_path))
+
+    assert names == ["Comprobante.pdf", "linea Captura.pdf", "lineaCaptura (1).PDF"]
@@ -0,0 +1,66 @@
+"""
+tools.text: mismo resultado, carácter por carácter, que las versiones
+anteriores de la normalización y del filtro de nombres de carpeta.
+"""
+import random
+import unicodedata
+
+from config import VALIDATION
+from tools.text import normalize_text, normalize_texts, safe_folder_name
+
+
+# Lo que aparece en nombres y mensajes, más los casos límite: sigma final,
+# "İ" (lower() la alarga), marcas sueltas, el separador del modo en bloque,
+# caracteres fuera del plano básico
+ALPHABET = (
+    "abcXYZ 0123456789.,-_/()¡!¿?\n\t"
+    "áéíóúüñÁÉÍÓÚÜÑçÇàèÅ"
+    "ΣσςΑΒΓ"
+    "İıǅﬁ"
+    "̧́̈"
+    "\x00"
+    "日本語😀𝐀"
+)
+
+
+def _old_normalize(s):
+    """La _normalize anterior de tools/pdf."""
+    s = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn").lower()
+
+
+def _old_folder_name(name):
+    """El filtro anterior de _client_folder_name / _rename_pdf."""
+    safe = "".join(
+        c for c in name if c.isalnum() or c in VALIDATION["allowed_folder_chars"]
+    ).strip()
+    return safe or VALIDATION["fallback_folder_name"]
+
+
+def _random_texts(count, seed=20):
+    rnd = random.Random(seed)
+    return ["".join(rnd.choices(ALPHABET, k=rnd.randint(0, 40))) for _ in range(count)]
+
+
+def test_normalize_text_matches_the_old_implementation():
+    texts = _random_texts(5000) + ["ΣΑΣ", "ΌΣΟΣ ΚΑΙ", "José Ramírez Ñúñez", ""]
+
+    for text in texts:
+        assert normalize_text(text) == _old_normalize(text), repr(text)
+
+
+def test_normalize_texts_matches_one_by_one():
+    texts = _random_texts(2000, seed=7)
+    ascii_only = ["JUAN PEREZ", "382TI", ""]
+
+    assert normalize_texts(texts) == [_old_normalize(t) for t in texts]
+    assert normalize_texts(ascii_only) == [t.lower() for t in ascii_only]
+    # Sin el separador en ningún texto se normaliza todo en una pasada
+    no_sep = [t.replace("\x00", "") for t in texts]
+    assert normalize_texts(no_sep) == [_old_normalize(t) for t in no_sep]
+    assert normalize_texts([]) == []
+
+
+def test_safe_folder_name_matches_the_old_filter():
+    for name in _random_texts(3000, seed=3) + ["  ", "José_Ñúñez (2)", "___"]:
+        assert safe_folder_name(name) == _old_folder_name(name), repr(name)